@@ -0,0 +1,346 @@
+import sys
+import json
+import time
+import getopt
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import QueryServer
+import ResultCache
+import Telemetry
+import Benchmark
+import CQ_Basic
+import CQ_Fast
+import CR
+
+
+def group_key(algorithm, params):
+    """
+    The key of the batch a query can join: (algorithm, s, d, alpha, c, epsilon, other parameters, k), q is left out,
+    and so is k for cr, whose batches select the top k of each query separately
+
+    :param algorithm: cq_basic, cq_fast or cr
+    :param params: the keyword arguments of the algorithm, with their defaults filled in
+    :return: a hashable key
+    """
+
+    key = ResultCache.result_key(algorithm, params)
+
+    return key[0:1] + key[2:] + (None if algorithm == 'cr' else int(params['k']),)
+
+
+class AsyncQueryService(object):
+    """
+    Asyncio front-end of the query service with request coalescing
+
+    Requests are answered from the result cache of the NoNQueryService when possible. The others are queued by
+    group_key for at most MaxDelay seconds, or until MaxBatch of them are waiting, and each group is then answered on
+    a worker thread by one multi-column walk: cq_basic and cq_fast run CQ_Basic.cq_basic_batch (on the cached sub-NoN
+    for cq_fast), and cr runs CR.cr_block for the power solver (other solvers answer the group one query at a time).
+    The future of each caller is resolved with its own response.
+
+    Histograms of the queue depth seen by each queued request, of the batch sizes and of the latencies are kept for
+    export (see stats).
+    """
+
+    def __init__(self, Service, MaxBatch=32, MaxDelay=0.005, Workers=None):
+        """
+        :param Service: the resident NoNQueryService
+        :param MaxBatch: the largest number of queries answered by one walk
+        :param MaxDelay: the longest time in seconds a query waits for others to join its batch
+        :param Workers: the number of worker threads (None uses every core)
+        """
+
+        self.Service = Service
+        self.MaxBatch = MaxBatch
+        self.MaxDelay = MaxDelay
+        self.Executor = ThreadPoolExecutor(Workers if Workers is not None else multiprocessing.cpu_count())
+        self.Pending = {}  # group key -> [(params, future)] of the queued queries
+        self.Timers = {}  # group key -> the handle of the MaxDelay timer of the group
+        self.Depth = 0  # the number of queued queries
+        self.QueueDepth = Telemetry.Histogram()
+        self.BatchSize = Telemetry.Histogram()
+        self.Latency = Telemetry.Histogram(1e-3)
+        self.Batches = 0
+        self.Hits = 0
+
+    async def query(self, algorithm, params):
+        """
+        Answer one query
+
+        :param algorithm: cq_basic, cq_fast or cr
+        :param params: the keyword arguments of the algorithm (see NoNQueryService.query)
+        :return: a dictionary with the IDs and names of the top k authors, the latency in seconds and the size of the
+                 batch which answered the query (0 for a cached result)
+        """
+
+        if algorithm not in ('cq_basic', 'cq_fast', 'cr'):
+            raise ValueError("Invalid algorithm: " + str(algorithm))
+
+        start = time.time()
+        params = self.Service.query_params(algorithm, self.Service.resolve_names(params))
+        k = int(params['k'])
+
+        Cached = self.Service.check_fingerprint()
+        response = self.Service.Results.get(ResultCache.result_key(algorithm, params), k) if Cached else None
+        if response is not None:
+            self.Hits += 1
+            response['cached'] = True
+            response['batch'] = 0
+        else:
+            response = await self.enqueue(algorithm, params)
+            response['cached'] = False
+
+        response['latency'] = time.time() - start
+        response['algorithm'] = algorithm
+        response['names'] = self.Service.author_names(response['results'])
+        self.Latency.add(response['latency'])
+
+        return response
+
+    def enqueue(self, algorithm, params):
+        """
+        Queue a query in its group and dispatch the group once it is full (the timer dispatches it otherwise)
+
+        :return: the future of the response
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = group_key(algorithm, params)
+
+        Group = self.Pending.setdefault(key, [])
+        Group.append((params, future))
+        self.Depth += 1
+        self.QueueDepth.add(self.Depth)
+
+        if len(Group) >= self.MaxBatch:
+            self.dispatch(key)
+        elif len(Group) == 1:
+            self.Timers[key] = loop.call_later(self.MaxDelay, self.dispatch, key)
+
+        return future
+
+    def dispatch(self, key):
+        """
+        Answer the queued queries of a group on a worker thread
+        """
+
+        Timer = self.Timers.pop(key, None)
+        if Timer is not None:
+            Timer.cancel()
+        Group = self.Pending.pop(key, None)
+        if not Group:
+            return
+
+        self.Depth -= len(Group)
+        self.BatchSize.add(len(Group))
+        self.Batches += 1
+
+        Done = asyncio.get_running_loop().run_in_executor(self.Executor, self.answer, key[0],
+                                                          [params for (params, future) in Group])
+        Done.add_done_callback(lambda Done: resolve(Group, Done))
+
+    def answer(self, algorithm, Params):
+        """
+        Answer a group of queries which only differ in q (and k for cr) with one walk, on a worker thread
+
+        :return: the response of each query
+        """
+
+        Service = self.Service
+        p = Params[0]
+        Q = [int(params['q']) for params in Params]
+        (s, d) = (int(p['s']), int(p['d']))
+
+        if algorithm == 'cq_basic':
+            [W, tilde_c] = Service.transition(p['alpha'], p['c'])
+            TopK = CQ_Basic.cq_basic_batch(W, Q, s, d, int(p['k']), tilde_c, Service.A_ID, Service.Index)
+            Responses = [{'results': [int(ID) for ID in TopKResults]} for TopKResults in TopK]
+            Ranked = False
+
+        elif algorithm == 'cq_fast':
+            key = (s, d, float(p['epsilon']), float(p['alpha']), float(p['c']), False)  # see CQ_Fast.cq_fast
+            SubNoN = Service.SubNoNs.get(key)
+            if SubNoN is None:
+                SubNoN = CQ_Fast.sub_non(Service.Anorm, Service.Y, Service.G, s, d, p['alpha'], p['c'], p['epsilon'],
+                                         Service.A_ID, Service.DisG)
+                Service.SubNoNs.put(key, SubNoN)
+            [W, tilde_c, Sub_A_ID, SubG_Idx] = SubNoN
+            TopK = CQ_Basic.cq_basic_batch(W, Q, np.nonzero(SubG_Idx == s)[0][0], np.nonzero(SubG_Idx == d)[0][0],
+                                           int(p['k']), tilde_c, Sub_A_ID)
+            Domains = [int(i) for i in SubG_Idx]
+            Responses = [{'results': [int(ID) for ID in TopKResults], 'domains': Domains} for TopKResults in TopK]
+            Ranked = False
+
+        elif p['solver'] == 'power' and len(Params) > 1:
+            Responses = self.answer_cr(Params)
+            Ranked = True
+
+        else:
+            Responses = []
+            for params in Params:
+                params = dict(params)
+                params['k'] = max(int(params['k']), Service.ResultPrefix) if params['solver'] != 'topk' \
+                    else int(params['k'])
+                Responses.append(Service.cr(**params))
+            Ranked = True
+
+        '''
+        Cache the responses and cut them to the k of each query
+        '''
+        if Service.check_fingerprint():
+            for (params, response) in zip(Params, Responses):
+                K = len(response['results']) if Ranked else int(params['k'])
+                Service.Results.put(ResultCache.result_key(algorithm, params), K, response, Ranked)
+
+        return [ResultCache.cut_response(response, int(params['k'])) for (params, response) in zip(Params, Responses)]
+
+    def answer_cr(self, Params):
+        """
+        Answer a group of cr queries with the power method on all query vectors at once (CR.cr_block)
+        """
+
+        start = time.time()
+        Service = self.Service
+        p = Params[0]
+        (s, d, alpha, c) = (int(p['s']), int(p['d']), float(p['alpha']), float(p['c']))
+        K = max([int(params['k']) for params in Params] + [Service.ResultPrefix])
+
+        E = np.hstack([Service.query_vector(int(params['q']), s).toarray() for params in Params])
+        [R, Iters] = CR.cr_block(Service.Anorm, Service.Ynorm, E, alpha, c, int(p['max_iter']), float(p['epsilon']))
+
+        # the residual of (I - M) r = eta e of every column, as reported by cr_solve
+        M = (c / (1.0 + 2.0 * alpha)) * Service.Anorm + (2.0 * alpha / (1.0 + 2.0 * alpha)) * Service.Ynorm
+        Residuals = np.abs((1.0 - c) / (1.0 + 2 * alpha) * E - (R - M.dot(R))).sum(axis=0)
+        Runtime = time.time() - start
+
+        Responses = []
+        for i in range(len(Params)):
+            TopK = CR.top_k(R[Service.Offsets[d]:Service.Offsets[d + 1], i], K)
+            Info = {'solver': 'power', 'iterations': int(Iters[i]), 'residual': float(Residuals[i]),
+                    'converged': bool(Iters[i] < int(p['max_iter'])), 'runtime': Runtime}
+            Responses.append({'results': [int(ID) for ID in Service.A_ID[0, d][TopK, 0]], 'solver': Info})
+
+        return Responses
+
+    def stats(self):
+        """
+        :return: a dictionary with the numbers of batches and cache hits, the current queue depth and the histograms
+                 of queue depths, batch sizes and latencies
+        """
+
+        return {'batches': self.Batches,
+                'cache_hits': self.Hits,
+                'queue_depth': self.Depth,
+                'queue_depth_histogram': self.QueueDepth.to_dict(),
+                'batch_size_histogram': self.BatchSize.to_dict(),
+                'latency_histogram': self.Latency.to_dict(),
+                'max_batch': self.MaxBatch,
+                'max_delay': self.MaxDelay}
+
+    def close(self):
+        self.Executor.shutdown()
+
+
+def resolve(Group, Done):
+    """
+    Resolve the future of each query of a group with its own response, or with the error of the group
+    """
+
+    Error = Done.exception()
+    for (i, (params, future)) in enumerate(Group):
+        if future.done():  # cancelled by its caller
+            continue
+        if Error is not None:
+            future.set_exception(Error)
+        else:
+            future.set_result(Done.result()[i])
+
+
+async def load_test(Async, Workload, algorithm, Concurrency, k=10):
+    """
+    Send a query workload with Concurrency requests in flight
+
+    :return: the responses in the order of the workload and the wall time in seconds
+    """
+
+    Slots = asyncio.Semaphore(Concurrency)
+
+    async def send(q, s, d):
+        async with Slots:
+            return await Async.query(algorithm, {'q': q, 's': s, 'd': d, 'k': k})
+
+    start = time.time()
+    Responses = await asyncio.gather(*[send(q, s, d) for (q, s, d) in Workload])
+
+    return [Responses, time.time() - start]
+
+
+if __name__ == '__main__':
+
+    dataset = "../data/DBLP_NoN.npy"
+    precomp = "Precomp_Values_DBLP.npy"
+    algorithm = "cr"
+    num_queries = 256
+    pairs = 4
+    concurrency = 64
+    max_batch = 32
+    max_delay = 0.005
+    workers = None
+    out = None
+
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["dataset=", "precomp=", "algorithm=", "num_queries=", "pairs=",
+                                                   "concurrency=", "max_batch=", "max_delay=", "workers=", "out="])
+    for option, value in opts:
+        if option == "-h":
+            print("python AsyncQuery.py [--dataset ../data/DBLP_NoN.npy] [--precomp Precomp_Values_DBLP.npy] "
+                  "[--algorithm cr] [--num_queries 256] [--pairs 4] [--concurrency 64] [--max_batch 32] "
+                  "[--max_delay 0.005] [--workers 4] [--out AsyncQuery.json]")
+            exit(0)
+        if option == "--dataset":
+            dataset = value
+        if option == "--precomp":
+            precomp = value
+        if option == "--algorithm":
+            algorithm = value
+        if option == "--num_queries":
+            num_queries = int(value)
+        if option == "--pairs":
+            pairs = int(value)
+        if option == "--concurrency":
+            concurrency = int(value)
+        if option == "--max_batch":
+            max_batch = int(value)
+        if option == "--max_delay":
+            max_delay = float(value)
+        if option == "--workers":
+            workers = int(value)
+        if option == "--out":
+            out = value
+
+    # a skewed load: distinct query nodes over a few (s, d) pairs, with the result cache disabled
+    Service = QueryServer.NoNQueryService(dataset, precomp, ResultBytes=0)
+    Pairs = [(s, d) for (q, s, d) in Benchmark.query_workload(Service.A_ID, pairs)]
+    rng = np.random.RandomState(0)
+    Workload = []
+    for i in range(num_queries):
+        (s, d) = Pairs[i % len(Pairs)]
+        Workload.append((int(rng.choice(Service.A_ID[0, s].ravel())), s, d))
+
+    Report = {}
+    for (name, batch) in [('unbatched', 1), ('coalesced', max_batch)]:
+        Async = AsyncQueryService(Service, batch, max_delay, workers)
+        [Responses, Runtime] = asyncio.run(load_test(Async, Workload, algorithm, concurrency))
+        Async.close()
+        Report[name] = Async.stats()
+        Report[name]['runtime'] = Runtime
+        Report[name]['throughput'] = len(Workload) / Runtime
+        print(name + ": " + str(len(Workload)) + " queries in " + str(Runtime) + " seconds (" +
+              str(Report[name]['throughput']) + " queries/s), " + str(Async.Batches) + " batches, mean latency " +
+              str(Report[name]['latency_histogram']['mean']) + " seconds.")
+
+    if out is not None:
+        with open(out, 'w') as f:
+            json.dump(Report, f, indent=2)
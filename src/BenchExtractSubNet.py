@@ -0,0 +1,107 @@
+import sys
+import time
+import getopt
+import numpy as np
+from scipy import sparse
+import ExtractSubNet
+
+
+def random_main_network(n, AvgDegree, seed=0):
+    """
+    Generate a random weighted main network
+
+    :param n: the number of main nodes (domains)
+    :param AvgDegree: the average number of neighbors of a main node
+    :param seed: the random seed
+    :return: the symmetric adjacency matrix of the main network (csc)
+    """
+
+    rng = np.random.RandomState(seed)
+
+    # a ring keeps every main node connected, the remaining edges are drawn at random
+    m = int(n * max(AvgDegree - 2, 0) / 2)
+    row = np.hstack((np.arange(n), rng.randint(0, n, m)))
+    col = np.hstack(((np.arange(n) + 1) % n, rng.randint(0, n, m)))
+    Mask = row != col
+    data = rng.rand(int(np.sum(Mask))) + 0.01
+
+    G = sparse.coo_matrix((data, (row[Mask], col[Mask])), shape=(n, n)).tocsr()
+    G = G + G.transpose()
+
+    return sparse.csc_matrix(G)
+
+
+def bench_extract_subnet(Sizes=(500, 2000, 10000, 50000), AvgDegree=6, NumPairs=5, epsilon=0.003,
+                         MaxBasicSize=2000, seed=0):
+    """
+    Benchmark the bidirectional Dijkstra engine of extract_subnet against extract_subnet_basic
+
+    :param Sizes: the numbers of main nodes
+    :param AvgDegree: the average number of neighbors of a main node
+    :param NumPairs: the number of random (s, d) pairs per main network
+    :param epsilon: an error factor to control the accuracy of results
+    :param MaxBasicSize: extract_subnet_basic is only run on main networks up to this size
+    :param seed: the random seed
+    :return: a list of (n, pair, basic runtime, engine runtime, number of extracted domains, identical results)
+    """
+
+    rng = np.random.RandomState(seed)
+    Results = []
+
+    for n in Sizes:
+
+        G = random_main_network(n, AvgDegree, seed)
+        DisG = ExtractSubNet.distance_graph(G)
+
+        for i in range(NumPairs):
+
+            s = rng.randint(n)
+            d = rng.randint(n)
+
+            start = time.time()
+            SubG_Idx = ExtractSubNet.extract_subnet(G, s, d, epsilon, DisG)
+            Runtime = time.time() - start
+
+            if n <= MaxBasicSize:
+                start = time.time()
+                SubG_Idx_basic = ExtractSubNet.extract_subnet_basic(G, s, d, epsilon, DisG)
+                Runtime_basic = time.time() - start
+                Same = np.array_equal(SubG_Idx, SubG_Idx_basic)
+            else:
+                Runtime_basic = float('nan')
+                Same = None
+
+            Results.append((n, (s, d), Runtime_basic, Runtime, len(SubG_Idx), Same))
+            print("n = %d, (s, d) = (%d, %d): basic %.4f s, engine %.4f s, %d domains, identical: %s"
+                  % (n, s, d, Runtime_basic, Runtime, len(SubG_Idx), Same))
+
+    return Results
+
+
+if __name__ == '__main__':
+
+    sizes = (500, 2000, 10000, 50000)
+    avg_degree = 6
+    num_pairs = 5
+    epsilon = 0.003
+    max_basic_size = 2000
+
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["sizes=", "avg_degree=", "num_pairs=", "epsilon=",
+                                                   "max_basic_size="])
+    for option, value in opts:
+        if option == "-h":
+            print("python BenchExtractSubNet.py [--sizes 500,2000,10000,50000] [--avg_degree 6] [--num_pairs 5] "
+                  "[--epsilon 0.003] [--max_basic_size 2000]")
+            exit(0)
+        if option == "--sizes":
+            sizes = [int(x) for x in value.split(',')]
+        if option == "--avg_degree":
+            avg_degree = float(value)
+        if option == "--num_pairs":
+            num_pairs = int(value)
+        if option == "--epsilon":
+            epsilon = float(value)
+        if option == "--max_basic_size":
+            max_basic_size = int(value)
+
+    bench_extract_subnet(sizes, avg_degree, num_pairs, epsilon, max_basic_size)
@@ -0,0 +1,139 @@
+import sys
+import json
+import time
+import getopt
+import multiprocessing
+import numpy as np
+import LoadData
+import Precomputation
+import ParallelSpMV
+import CR
+import Benchmark
+
+
+def time_product(Op, x, Repeats):
+    """
+    :return: the median runtime of Op.dot(x) over Repeats runs
+    """
+
+    Runtimes = []
+    for i in range(Repeats):
+        start = time.time()
+        Op.dot(x)
+        Runtimes.append(time.time() - start)
+
+    return float(np.median(Runtimes))
+
+
+def bench_spmv(dataset, PrecompFileName, MaxThreads=None, Columns=(1, 8), Repeats=20, NumQueries=5, alpha=0.2,
+               c=0.85, Compact=False, seed=0):
+    """
+    Scaling benchmark of ParallelSpMV from 1 to MaxThreads threads
+
+    Times the products W x of CQ_Basic with a dense vector and with dense blocks of vectors (the SpMM of
+    cq_basic_batch and cr_block), and the power method of CR (cr_solve) on a random query workload, each against the
+    serial SciPy product.
+
+    :param dataset: the path of the dataset
+    :param PrecompFileName: the file name of precomputation results
+    :param MaxThreads: the largest number of threads (None uses every core)
+    :param Columns: the numbers of columns of x (1 is SpMV)
+    :param Repeats: the number of timed products per configuration
+    :param NumQueries: the number of CR queries per configuration
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param Compact: use the compact mode (float32 values, int32 indices)
+    :param seed: the random seed
+    :return: a list of dictionaries with the kernel (spmv, spmm or cr), the number of columns, the number of
+             threads, the serial and parallel runtimes and the speedup
+    """
+
+    if MaxThreads is None:
+        MaxThreads = multiprocessing.cpu_count()
+
+    NoN = LoadData.load_all(dataset, PrecompFileName, Compact)
+    A_ID = NoN['A_ID']
+    Offsets = Precomputation.cumulative_ns(A_ID)
+    W = ((c / (c + 2.0 * alpha)) * NoN['Anorm'] + ((2.0 * alpha) / (c + 2.0 * alpha)) * NoN['Ynorm']).tocsr()
+    n = W.shape[0]
+
+    rng = np.random.RandomState(seed)
+    Workload = Benchmark.query_workload(A_ID, NumQueries, seed)
+    Results = []
+
+    for b in Columns:
+
+        x = rng.rand(n) if b == 1 else rng.rand(n, b)
+        x = x.astype(W.dtype)
+        Serial = time_product(W, x, Repeats)
+
+        for Threads in range(1, MaxThreads + 1):
+            with ParallelSpMV.ParallelSpMV(W, Offsets, Threads) as Op:
+                Parallel = time_product(Op, x, Repeats)
+            Results.append({'kernel': 'spmv' if b == 1 else 'spmm', 'columns': b, 'threads': Threads,
+                            'serial': Serial, 'parallel': Parallel, 'speedup': Serial / Parallel})
+
+    Serial = 0.0
+    for (q, s, d) in Workload:
+        e = np.zeros(n)
+        e[Offsets[s] + np.nonzero(A_ID[0, s].ravel() == q)[0]] = 1
+        start = time.time()
+        CR.cr_solve(NoN['Anorm'], NoN['Ynorm'], e, alpha, c)
+        Serial += time.time() - start
+
+    for Threads in range(1, MaxThreads + 1):
+        Parallel = 0.0
+        for (q, s, d) in Workload:
+            e = np.zeros(n)
+            e[Offsets[s] + np.nonzero(A_ID[0, s].ravel() == q)[0]] = 1
+            start = time.time()
+            CR.cr_solve(NoN['Anorm'], NoN['Ynorm'], e, alpha, c, Threads=Threads, Offsets=Offsets)
+            Parallel += time.time() - start
+        Results.append({'kernel': 'cr', 'columns': 1, 'threads': Threads, 'serial': Serial / len(Workload),
+                        'parallel': Parallel / len(Workload), 'speedup': Serial / Parallel})
+
+    return Results
+
+
+if __name__ == '__main__':
+
+    dataset = "../data/DBLP_NoN.npy"
+    precomp = "Precomp_Values_DBLP.npy"
+    max_threads = None
+    columns = (1, 8)
+    repeats = 20
+    compact = False
+    out = None
+
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["dataset=", "precomp=", "max_threads=", "columns=", "repeats=",
+                                                   "compact", "out="])
+    for option, value in opts:
+        if option == "-h":
+            print("python BenchSpMV.py [--dataset ../data/DBLP_NoN.npy] [--precomp Precomp_Values_DBLP.npy] "
+                  "[--max_threads 8] [--columns 1,8] [--repeats 20] [--compact] [--out BenchSpMV.json]")
+            exit(0)
+        if option == "--dataset":
+            dataset = value
+        if option == "--precomp":
+            precomp = value
+        if option == "--max_threads":
+            max_threads = int(value)
+        if option == "--columns":
+            columns = [int(b) for b in value.split(',')]
+        if option == "--repeats":
+            repeats = int(value)
+        if option == "--compact":
+            compact = True
+        if option == "--out":
+            out = value
+
+    Results = bench_spmv(dataset, precomp, max_threads, columns, repeats, Compact=compact)
+
+    print("%-6s %8s %8s %12s %12s %8s" % ('kernel', 'columns', 'threads', 'serial (s)', 'parallel (s)', 'speedup'))
+    for Result in Results:
+        print("%-6s %8d %8d %12.6f %12.6f %8.2f" % (Result['kernel'], Result['columns'], Result['threads'],
+                                                    Result['serial'], Result['parallel'], Result['speedup']))
+
+    if out is not None:
+        with open(out, 'w') as f:
+            json.dump(Results, f, indent=2)
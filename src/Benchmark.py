@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import getopt
+import platform
+import subprocess
+import numpy as np
+import scipy
+import CQ_Basic
+import CQ_Fast
+import CR
+import QueryServer
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+Algorithms = ['cq_basic', 'cq_fast', 'cr']
+
+
+def git_commit():
+    """
+    :return: the commit hash of the working tree, None outside a git repository
+    """
+
+    try:
+        Out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                      stderr=subprocess.STDOUT)
+        return Out.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def query_workload(A_ID, NumQueries, seed=0):
+    """
+    Draw a random query workload
+
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param NumQueries: the number of queries
+    :param seed: the random seed
+    :return: a list of (q, s, d), q is a node of the source domain s and d is a different target domain
+    """
+
+    rng = np.random.RandomState(seed)
+    g = A_ID.shape[1]
+    Workload = []
+
+    for i in range(NumQueries):
+        s = rng.randint(g)
+        d = rng.randint(g - 1) if g > 1 else 0
+        if g > 1 and d >= s:
+            d += 1
+        q = A_ID[0, s].ravel()[rng.randint(A_ID[0, s].shape[0])]
+        Workload.append((int(q), int(s), int(d)))
+
+    return Workload
+
+
+def percentiles(Values):
+    """
+    :param Values: a list of measurements
+    :return: a dictionary with the mean, p50, p90, p99 and max of Values
+    """
+
+    Values = np.asarray(Values, dtype=np.float64)
+    if len(Values) == 0:
+        return {}
+
+    return {'mean': float(np.mean(Values)), 'p50': float(np.percentile(Values, 50)),
+            'p90': float(np.percentile(Values, 90)), 'p99': float(np.percentile(Values, 99)),
+            'max': float(np.max(Values))}
+
+
+def run_query(Service, algorithm, q, s, d, k, alpha, c, epsilon, MaxIter):
+    """
+    Answer one query and collect its statistics
+
+    :return: the IDs of the top k authors and a dictionary of statistics
+    """
+
+    Info = {}
+
+    if algorithm == 'cq_basic':
+        [W, tilde_c] = Service.transition(alpha, c)
+        TopKResults = CQ_Basic.cq_basic(W, q, s, d, k, tilde_c, Service.A_ID, Info)
+    elif algorithm == 'cq_fast':
+        [TopKResults, SubG_Idx] = CQ_Fast.cq_fast(Service.Anorm, Service.Y, Service.G, q, s, d, k, alpha, c,
+                                                  epsilon, Service.A_ID, Service.DisG, None, Info)
+        Info['domains_kept'] = float(Info['domains']) / Info['domains_total']
+    else:
+        e = Service.query_vector(q, s)
+        [r, Info] = CR.cr_solve(Service.Anorm, Service.Ynorm, e, alpha, c, MaxIter, 1e-15)
+        TopKResults = Service.A_ID[0, d][CR.top_k(r[Service.Offsets[d]:Service.Offsets[d + 1]], k), 0]
+
+    return [np.asarray(TopKResults).ravel(), Info]
+
+
+def bench_dataset(dataset, PrecompFileName, NumQueries=20, k=10, alpha=0.2, c=0.85, epsilon=0.003, MaxIter=1000,
+                  Memory=True, seed=0):
+    """
+    Benchmark cq_basic, cq_fast and cr on one dataset
+
+    Every query of the workload is answered by the three algorithms. Latencies are measured without tracing, the
+    peak memory of each query is measured by tracemalloc in a second, traced run.
+
+    :param dataset: the path for the dataset
+    :param PrecompFileName: the file name of precomputation results, computed if it does not exist
+    :param NumQueries: the number of random queries
+    :param k: the number of retrieved nodes
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param epsilon: an error factor of cq_fast
+    :param MaxIter: the maximal number of iterations of cr
+    :param Memory: measure the peak memory of each query
+    :param seed: the random seed of the workload
+    :return: a dictionary with the dataset description, per-algorithm summaries and per-query records
+    """
+
+    start = time.time()
+    Service = QueryServer.NoNQueryService(dataset, PrecompFileName, ((alpha, c),), 0)
+    LoadTime = time.time() - start
+
+    Workload = query_workload(Service.A_ID, NumQueries, seed)
+    Records = []
+
+    for (q, s, d) in Workload:
+
+        Record = {'q': q, 's': s, 'd': d}
+        TopK = {}
+
+        for algorithm in Algorithms:
+
+            start = time.time()
+            [TopK[algorithm], Info] = run_query(Service, algorithm, q, s, d, k, alpha, c, epsilon, MaxIter)
+            Info['latency'] = time.time() - start
+
+            if Memory and tracemalloc is not None:
+                tracemalloc.start()
+                run_query(Service, algorithm, q, s, d, k, alpha, c, epsilon, MaxIter)
+                Info['peak_memory'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            Record[algorithm] = Info
+
+        # top-k agreement with CR
+        for algorithm in Algorithms:
+            Common = np.intersect1d(TopK[algorithm], TopK['cr'])
+            Record[algorithm]['agreement'] = float(len(Common)) / max(len(TopK['cr']), 1)
+
+        Records.append(Record)
+
+    Summary = {}
+    for algorithm in Algorithms:
+        Infos = [Record[algorithm] for Record in Records]
+        Summary[algorithm] = {'latency': percentiles([Info['latency'] for Info in Infos]),
+                              'iterations': percentiles([Info['iterations'] for Info in Infos]),
+                              'agreement': percentiles([Info['agreement'] for Info in Infos])}
+        if Memory and tracemalloc is not None:
+            Summary[algorithm]['peak_memory'] = percentiles([Info['peak_memory'] for Info in Infos])
+        if algorithm != 'cr':
+            Summary[algorithm]['candidates'] = percentiles([Info['candidates'] for Info in Infos])
+        if algorithm == 'cq_fast':
+            Summary[algorithm]['domains_kept'] = percentiles([Info['domains_kept'] for Info in Infos])
+
+    return {'dataset': dataset,
+            'domains': int(Service.A_ID.shape[1]),
+            'nodes': int(Service.Offsets[-1]),
+            'nnz_Anorm': int(Service.Anorm.nnz),
+            'nnz_Ynorm': int(Service.Ynorm.nnz),
+            'load_time': LoadTime,
+            'summary': Summary,
+            'queries': Records}
+
+
+def bench(Datasets, OutFileName="Benchmark.json", NumQueries=20, k=10, alpha=0.2, c=0.85, epsilon=0.003,
+          MaxIter=1000, Memory=True, seed=0):
+    """
+    Benchmark suite over datasets of increasing size
+
+    :param Datasets: a list of (dataset, PrecompFileName)
+    :param OutFileName: the JSON file to store the results
+    :return: the results
+    """
+
+    Results = {'commit': git_commit(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'scipy': scipy.__version__,
+               'params': {'num_queries': NumQueries, 'k': k, 'alpha': alpha, 'c': c, 'epsilon': epsilon,
+                          'max_iter': MaxIter, 'seed': seed},
+               'datasets': []}
+
+    for (dataset, PrecompFileName) in Datasets:
+
+        Result = bench_dataset(dataset, PrecompFileName, NumQueries, k, alpha, c, epsilon, MaxIter, Memory, seed)
+        Results['datasets'].append(Result)
+
+        print("%s: %d domains, %d nodes" % (dataset, Result['domains'], Result['nodes']))
+        for algorithm in Algorithms:
+            Summary = Result['summary'][algorithm]
+            print("  %-8s p50 %.4f s, p90 %.4f s, %.1f iterations, agreement with cr %.2f"
+                  % (algorithm, Summary['latency']['p50'], Summary['latency']['p90'], Summary['iterations']['mean'],
+                     Summary['agreement']['mean']))
+
+    with open(OutFileName, 'w') as f:
+        json.dump(Results, f, indent=2)
+
+    return Results
+
+
+def compare(BaseFileName, NewFileName, Threshold=1.2):
+    """
+    Compare two benchmark result files and report regressions
+
+    :param BaseFileName: the JSON file of the baseline results
+    :param NewFileName: the JSON file of the new results
+    :param Threshold: a metric regresses if new / base exceeds Threshold (or agreement drops)
+    :return: a list of (dataset, algorithm, metric, base value, new value)
+    """
+
+    with open(BaseFileName) as f:
+        Base = json.load(f)
+    with open(NewFileName) as f:
+        New = json.load(f)
+
+    BaseResults = dict((Result['dataset'], Result) for Result in Base['datasets'])
+    Regressions = []
+
+    print("%s (%s) -> %s (%s)" % (BaseFileName, Base['commit'], NewFileName, New['commit']))
+
+    for Result in New['datasets']:
+
+        if Result['dataset'] not in BaseResults:
+            continue
+        BaseSummary = BaseResults[Result['dataset']]['summary']
+
+        for algorithm in Algorithms:
+            for (metric, stat) in [('latency', 'p50'), ('latency', 'p90'), ('peak_memory', 'max'),
+                                   ('iterations', 'mean'), ('agreement', 'mean')]:
+
+                if metric not in Result['summary'][algorithm] or metric not in BaseSummary[algorithm]:
+                    continue
+                BaseValue = BaseSummary[algorithm][metric][stat]
+                NewValue = Result['summary'][algorithm][metric][stat]
+
+                if metric == 'agreement':
+                    Regressed = NewValue < BaseValue
+                else:
+                    Regressed = NewValue > Threshold * BaseValue
+
+                Ratio = NewValue / BaseValue if BaseValue > 0 else float('nan')
+                print("  %s %-8s %s %s: %.4g -> %.4g (x%.2f)%s"
+                      % (Result['dataset'], algorithm, metric, stat, BaseValue, NewValue, Ratio,
+                         "  REGRESSION" if Regressed else ""))
+                if Regressed:
+                    Regressions.append((Result['dataset'], algorithm, metric + '.' + stat, BaseValue, NewValue))
+
+    return Regressions
+
+
+if __name__ == '__main__':
+
+    datasets = ["../data/DBLP_NoN.npy"]
+    precomps = None
+    out = "Benchmark.json"
+    num_queries = 20
+    k = 10
+    memory = True
+    compared = None
+
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["datasets=", "precomps=", "out=", "num_queries=", "k=",
+                                                   "no_memory", "compare="])
+    for option, value in opts:
+        if option == "-h":
+            print("python Benchmark.py [--datasets a.npy,b.npy] [--precomps a_Precomp.npy,b_Precomp.npy] "
+                  "[--out Benchmark.json] [--num_queries 20] [--k 10] [--no_memory] [--compare base.json,new.json]")
+            exit(0)
+        if option == "--datasets":
+            datasets = value.split(',')
+        if option == "--precomps":
+            precomps = value.split(',')
+        if option == "--out":
+            out = value
+        if option == "--num_queries":
+            num_queries = int(value)
+        if option == "--k":
+            k = int(value)
+        if option == "--no_memory":
+            memory = False
+        if option == "--compare":
+            compared = value.split(',')
+
+    if compared is not None:  # compare two result files without running the benchmark
+        compare(compared[0], compared[1])
+        exit(0)
+
+    if precomps is None:
+        precomps = [os.path.splitext(dataset)[0] + "_Precomp.npy" for dataset in datasets]
+
+    bench(list(zip(datasets, precomps)), out, num_queries, k, Memory=memory)
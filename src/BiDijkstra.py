@@ -0,0 +1,307 @@
+import math
+import numpy as np
+
+
+class HeapSearch(object):
+    """
+    One direction of the bidirectional Dijkstra search
+
+    The heap is an indexed binary min-heap of node indices kept in plain integer lists (H holds the nodes, P the
+    1-based heap position of each node, 0 if the node never entered the heap), and the distances are a list of
+    floats. The heap operations are the ones of DijkstraExpansion, so nodes are popped in exactly the same order,
+    ties included.
+    """
+
+    def __init__(self, rp, ci, vi, u):
+        """
+        :param rp: row pointer of the csr distance graph
+        :param ci: column index of the csr distance graph
+        :param vi: value index of the csr distance graph
+        :param u: the source/target node
+        """
+
+        n = len(rp) - 1  # the number of nodes
+
+        self.rp = rp
+        self.ci = ci
+        self.vi = vi
+        self.H = [0] * n  # the heap of node indices
+        self.P = [0] * n  # the heap positions of nodes
+        self.Dis = [float('inf')] * n  # the distances from u to other nodes
+        self.Len = 1  # the heap length
+        self.H[0] = u
+        self.P[u] = 1
+        self.Dis[u] = 0.0
+
+    def pop(self):
+        """
+        Pop the head off the heap and maintain the min-heap
+
+        :return: the popped node
+        """
+
+        H = self.H
+        P = self.P
+        Dis = self.Dis
+
+        u = H[0]
+        Tail = H[self.Len - 1]
+        H[0] = Tail
+        P[Tail] = 1
+        self.Len -= 1
+        Len = self.Len
+
+        # move the first node down the heap
+        Pos = 1
+        First = H[0]
+        DisFirst = Dis[First]
+        while True:
+
+            Idx = 2 * Pos
+
+            if Idx > Len:  # no child
+                break
+            elif Idx == Len:  # one child
+                v = H[Idx - 1]
+            else:  # two children, pick the smaller one
+                Left = H[Idx - 1]
+                Right = H[Idx]
+                v = Left
+                if Dis[Right] < Dis[Left]:
+                    Idx += 1
+                    v = Right
+
+            if DisFirst < Dis[v]:
+                break
+            else:
+                H[Pos - 1] = v
+                P[v] = Pos
+                H[Idx - 1] = First
+                P[First] = Idx
+                Pos = Idx
+
+        return u
+
+    def relax(self, u, Nbrs, Weights):
+        """
+        Relax the edges from u to Nbrs
+
+        :param u: the node whose edges are relaxed
+        :param Nbrs: the neighbors of u
+        :param Weights: the lengths of the edges to the neighbors
+        """
+
+        H = self.H
+        P = self.P
+        Dis = self.Dis
+        Len = self.Len
+        DisU = Dis[u]
+
+        for i in range(len(Nbrs)):
+
+            v = Nbrs[i]
+            DisV = DisU + Weights[i]
+
+            # relax edge (u, v)
+            if Dis[v] > DisV:
+
+                Dis[v] = DisV
+                Pos = P[v]
+
+                if Pos == 0:  # v is not in the heap
+
+                    Len += 1
+                    H[Len - 1] = v
+                    P[v] = Len
+                    Pos = Len
+
+                # move v up the heap
+                while Pos > 1:
+
+                    ParPos = Pos // 2
+                    Par = H[ParPos - 1]
+
+                    if Dis[Par] < DisV:
+                        break
+                    else:
+                        H[ParPos - 1] = v
+                        P[v] = ParPos
+                        H[Pos - 1] = Par
+                        P[Par] = Pos
+                        Pos = ParPos
+
+        self.Len = Len
+
+    def expand(self):
+        """
+        One step expansion: pop the nearest node and relax its edges in the distance graph
+
+        :return: the popped node
+        """
+
+        u = self.pop()
+        st = self.rp[u]
+        ed = self.rp[u + 1]
+        self.relax(u, self.ci[st:ed].tolist(), self.vi[st:ed].tolist())
+
+        return u
+
+    def first_expand(self, Background):
+        """
+        First step expansion: pop the source/target node and relax it against every other node, its neighbors in
+        the distance graph at their distances and all other nodes at the background distance
+
+        :param Background: the distance between nodes with zero similarity
+        :return: the popped node
+        """
+
+        u = self.pop()
+        n = len(self.rp) - 1
+        st = self.rp[u]
+        ed = self.rp[u + 1]
+
+        Row = np.full(n, Background)  # the dense row of u
+        Row[self.ci[st:ed]] = self.vi[st:ed]
+        Nbrs = np.delete(np.arange(n), u)
+        self.relax(u, Nbrs.tolist(), Row[Nbrs].tolist())
+
+        return u
+
+
+def bidirectional_expansion(DisG, s, d, epsilon, Background, Trace=None):
+    """
+    Bidirectional Dijkstra expansion on the distance graph of the main network
+
+    Follows ExtractSubNet.extract_subnet_basic step by step (the same expansion order, the first overlap of the two
+    neighbourhoods fixing L_sd, the final relax and the L_sd - log10(epsilon) pruning), but keeps the neighbourhoods
+    as boolean masks and detects their overlap incrementally instead of intersecting them after every pop.
+
+    :param DisG: the distance graph of the main network built by ExtractSubNet.distance_graph
+    :param s: the index of the source domain-specific network
+    :param d: the index of the target domain-specific network
+    :param epsilon: an error factor to control the accuracy of results
+    :param Background: the distance between main nodes with zero similarity
+    :param Trace: a callback called after every expansion of the neighbourhood expansion loop with the expanded side,
+                  the popped node, the radius, the heap length, the overlap size, L_sd and the maximal radius, and
+                  once with the sizes of the final neighbourhoods (optional)
+    :return: ID of domain networks
+    """
+
+    '''
+    Initialization for expansion
+    '''
+    rp = DisG.indptr
+    ci = DisG.indices
+    vi = DisG.data
+    n = len(rp) - 1  # the number of nodes
+
+    L_sd = float('inf')  # the shortest distance between s and d in G
+    MaxRadius = (L_sd - math.log10(epsilon)) / 2.0  # the maximal radius to search
+    Ns = []  # the neighborhoods of s
+    Nd = []  # the neighborhoods of d
+    InNs = bytearray(n)  # the membership mask of Ns
+    InNd = bytearray(n)  # the membership mask of Nd
+    Overlap = 0  # the number of nodes in both Ns and Nd
+    Mid = -1  # the first node in both Ns and Nd
+    Flag = 1  # the flag for the first overlap between neighborhoods of s and d
+
+    Search_s = HeapSearch(rp, ci, vi, s)
+    Search_d = HeapSearch(rp, ci, vi, d)
+
+    '''
+    First expansion
+    '''
+    u = Search_s.first_expand(Background)
+    Ns.append(u)
+    InNs[u] = 1
+    rs = Search_s.Dis[u]  # the radius of s
+
+    u = Search_d.first_expand(Background)
+    Nd.append(u)
+    InNd[u] = 1
+    if InNs[u]:
+        Overlap += 1
+        Mid = u
+    rd = Search_d.Dis[u]  # the radius of d
+
+    '''
+    Neighbourhood expansion loop
+    '''
+    while (rs <= MaxRadius and Search_s.Len > 0) or (rd <= MaxRadius and Search_d.Len > 0):
+
+        if Overlap == 1 and Flag == 1:  # the first overlap of two neighbourhoods
+
+            L_sd = Search_s.Dis[Mid] + Search_d.Dis[Mid]
+            MaxRadius = (L_sd - math.log10(epsilon)) / 2.0
+            Flag = 0
+
+        if rs <= MaxRadius and Search_s.Len > 0:
+
+            u = Search_s.expand()
+            Ns.append(u)
+            InNs[u] = 1
+            if InNd[u]:
+                Overlap += 1
+                Mid = u
+            rs = Search_s.Dis[u]
+
+            if Trace is not None:
+                Trace('expansion', side='s', node=u, radius=rs, heap=Search_s.Len, overlap=Overlap, L_sd=L_sd,
+                      max_radius=MaxRadius)
+
+        if rd <= MaxRadius and Search_d.Len > 0:
+
+            u = Search_d.expand()
+            Nd.append(u)
+            InNd[u] = 1
+            if InNs[u]:
+                Overlap += 1
+                Mid = u
+            rd = Search_d.Dis[u]
+
+            if Trace is not None:
+                Trace('expansion', side='d', node=u, radius=rd, heap=Search_d.Len, overlap=Overlap, L_sd=L_sd,
+                      max_radius=MaxRadius)
+
+    '''
+    Full relax
+
+    Keep expanding s until every node of Nd has been popped from its heap, and the same for d.
+    '''
+    Ns_extra = [u for u in Nd if not InNs[u]]  # the nodes in Nd but not in Ns
+    Nd_extra = [u for u in Ns if not InNd[u]]  # the nodes in Ns but not in Nd
+
+    Extra = bytearray(n)
+    for u in Ns_extra:
+        Extra[u] = 1
+    Remaining = len(Ns_extra)
+    while Remaining > 0 and Search_s.Len > 0:
+        u = Search_s.expand()
+        if Extra[u]:
+            Ns.append(u)
+            Extra[u] = 0
+            Remaining -= 1
+
+    Extra = bytearray(n)
+    for u in Nd_extra:
+        Extra[u] = 1
+    Remaining = len(Nd_extra)
+    while Remaining > 0 and Search_d.Len > 0:
+        u = Search_d.expand()
+        if Extra[u]:
+            Nd.append(u)
+            Extra[u] = 0
+            Remaining -= 1
+
+    '''
+    Further pruning Ns and Nd
+    '''
+    Nsd = np.unique(np.array(Ns + Nd, dtype=np.int64))
+    Dis_s = np.array(Search_s.Dis)[Nsd]
+    Dis_d = np.array(Search_d.Dis)[Nsd]
+    Nsd = Nsd[Dis_s + Dis_d <= L_sd - math.log10(epsilon)]
+
+    if Trace is not None:
+        Trace('extract_subnet', Ns=len(Ns), Nd=len(Nd), kept=len(Nsd), L_sd=L_sd)
+
+    return Nsd
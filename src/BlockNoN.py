@@ -0,0 +1,161 @@
+import numpy as np
+from scipy import sparse
+
+
+class BlockNoN(object):
+    """
+    Block-sparse NoN operator
+
+    Anorm is block-diagonal by domain and Ynorm couples a domain node only with its copies in the domains adjacent
+    in the main network, so W = a Anorm + b Ynorm (or M of CR) splits into the diagonal blocks W_ii (the normalized
+    domain-specific network plus the self-loops of Y) and the coupling blocks W_ij (the common nodes of domains i
+    and j, O_ij), of which only the non-empty ones are kept. A product W p only visits the block columns of the
+    domains which carry mass in p, which is what a random walk from the query node needs in its early iterations,
+    when p is non-zero in the source domain and a few neighbours only.
+
+    Once the active block columns hold more than DenseFraction of the non-zeros of W, a product falls back to the
+    single SciPy product with the whole matrix, which is faster than a Python loop over most blocks.
+
+    The operator has dot, max, shape and dtype, so it can replace W in cq_basic and M in the power method of CR.
+    """
+
+    def __init__(self, M, Offsets, DenseFraction=0.5):
+        """
+        :param M: a sparse matrix with the block structure of the NoN (e.g., W or M of CR)
+        :param Offsets: the first row of each domain block followed by n (see Precomputation.cumulative_ns)
+        :param DenseFraction: the fraction of non-zeros of M above which the whole matrix is multiplied
+        """
+
+        self.M = sparse.csr_matrix(M)
+        self.shape = self.M.shape
+        self.dtype = self.M.dtype
+        self.Offsets = np.asarray(Offsets, dtype=np.int64)
+        self.DenseFraction = DenseFraction
+
+        g = len(self.Offsets) - 1
+        self.Domain = np.repeat(np.arange(g), np.diff(self.Offsets))  # the domain of each row
+
+        '''
+        Split M into its non-empty blocks, grouped by block column
+        '''
+        C = sparse.coo_matrix(self.M)
+        Rows = self.Domain[C.row]
+        Cols = self.Domain[C.col]
+        Order = np.lexsort((Rows, Cols))  # by block column, then by block row
+        Keys = Cols[Order] * g + Rows[Order]
+        Starts = np.hstack(([0], np.nonzero(np.diff(Keys))[0] + 1, [len(Keys)])) if len(Keys) > 0 \
+            else np.array([0], dtype=np.int64)
+
+        self.Columns = [[] for j in range(g)]  # the (block row, block) pairs of each block column
+        self.ColumnNnz = np.zeros(g, dtype=np.int64)  # the number of non-zeros of each block column
+
+        for (a, b) in zip(Starts[:-1], Starts[1:]):
+            Idx = Order[a:b]
+            i = Rows[Idx[0]]
+            j = Cols[Idx[0]]
+            Block = sparse.csr_matrix((C.data[Idx], (C.row[Idx] - self.Offsets[i], C.col[Idx] - self.Offsets[j])),
+                                      shape=(self.Offsets[i + 1] - self.Offsets[i],
+                                             self.Offsets[j + 1] - self.Offsets[j]))
+            self.Columns[j].append((i, Block))
+            self.ColumnNnz[j] += b - a
+
+        self.Blocks = int(sum(len(Column) for Column in self.Columns))
+
+        # the numbers of products with the active blocks and with the whole matrix, and of block products
+        self.Stats = {'block': 0, 'full': 0, 'block_products': 0}
+
+    def nbytes(self):
+        """
+        :return: the memory held by the whole matrix and its blocks
+        """
+
+        Size = self.M.data.nbytes + self.M.indices.nbytes + self.M.indptr.nbytes + self.Domain.nbytes
+        for Column in self.Columns:
+            for (i, Block) in Column:
+                Size += Block.data.nbytes + Block.indices.nbytes + Block.indptr.nbytes
+
+        return Size
+
+    def max(self, axis=None):
+        return self.M.max(axis=axis)
+
+    def active_domains(self, Rows):
+        """
+        :param Rows: the rows of the non-zero entries of a vector
+        :return: the domains which carry mass in the vector
+        """
+
+        return np.nonzero(np.bincount(self.Domain[Rows], minlength=len(self.Offsets) - 1))[0]
+
+    def dot(self, p):
+        """
+        The product M p
+
+        :param p: a dense vector, a dense n x b matrix or a sparse column
+        :return: M p, dense for a dense p and a sparse column (csc) for a sparse p
+        """
+
+        '''
+        Find the active domains
+        '''
+        if sparse.issparse(p):
+            p = sparse.csc_matrix(p)
+            p.sum_duplicates()  # sorted row indices
+            NonZero = p.data != 0
+            Rows = p.indices[NonZero]
+            Values = p.data[NonZero]
+            Active = self.active_domains(Rows)
+        else:
+            p = np.asarray(p)
+            NonZero = p != 0 if p.ndim == 1 else np.any(p != 0, axis=1)
+            Active = self.active_domains(np.nonzero(NonZero)[0])
+
+        if np.sum(self.ColumnNnz[Active]) > self.DenseFraction * self.M.nnz:
+            self.Stats['full'] += 1
+            return self.M.dot(p)
+
+        self.Stats['block'] += 1
+
+        '''
+        Multiply the block columns of the active domains
+        '''
+        Out = {}  # the dense output segment of each touched block row
+
+        for j in Active:
+
+            st = self.Offsets[j]
+            ed = self.Offsets[j + 1]
+
+            if sparse.issparse(p):
+                x = np.zeros(ed - st, dtype=np.result_type(self.dtype, p.dtype))
+                [a, b] = np.searchsorted(Rows, [st, ed])
+                x[Rows[a:b] - st] = Values[a:b]
+            else:
+                x = p[st:ed]
+
+            for (i, Block) in self.Columns[j]:
+                if i in Out:
+                    Out[i] += Block.dot(x)
+                else:
+                    Out[i] = Block.dot(x)
+                self.Stats['block_products'] += 1
+
+        '''
+        Assemble M p from the touched block rows
+        '''
+        Touched = sorted(Out.keys())
+
+        if sparse.issparse(p):
+            if len(Touched) == 0:
+                return sparse.csc_matrix(self.shape[:1] + (1,), dtype=self.dtype)
+            OutRows = np.hstack([np.arange(self.Offsets[i], self.Offsets[i + 1]) for i in Touched])
+            OutValues = np.hstack([Out[i] for i in Touched])
+            Keep = OutValues != 0
+            return sparse.csc_matrix((OutValues[Keep], (OutRows[Keep], np.zeros(int(np.sum(Keep)), dtype=np.int64))),
+                                     shape=(self.shape[0], 1))
+
+        Result = np.zeros((self.shape[0],) + p.shape[1:], dtype=np.result_type(self.dtype, p.dtype))
+        for i in Touched:
+            Result[self.Offsets[i]:self.Offsets[i + 1]] = Out[i]
+
+        return Result
@@ -1,8 +1,9 @@
 import numpy as np
 from scipy import sparse
+import Precomputation
 
 
-def cq_basic(W, q, s, d, k, tilde_c, A_ID):
+def cq_basic(W, q, s, d, k, tilde_c, A_ID, Info=None, Trace=None, Index=None):
     """
     CrossQuery-Basic
     
@@ -13,41 +14,38 @@ def cq_basic(W, q, s, d, k, tilde_c, A_ID):
     :param k: the number of retrieved nodes
     :param tilde_c: the normalized parameter for query preference
     :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param Info: a dictionary which receives the number of iterations and the initial and final candidate-set sizes
+                 (optional)
+    :param Trace: a callback (e.g., Telemetry.TraceRecorder) called once per iteration with the candidate-set size,
+                  the threshold Theta, the bound gap max(Upper - Lower) and the nnz of p (optional)
+    :param Index: the NodeIndex of the NoN, which locates q without scanning the source domain (optional)
     :return: the IDs of top k relevant authors from the target domain-specific network
     """
 
     '''
     Initialization
     '''
-    g = A_ID.shape[1]  # the number of domain-specific networks
-
-    vfunc = np.vectorize(lambda matrix: matrix.shape[0])  # define an element-wise operation
-    DomainSizes = vfunc(A_ID)  # the number of domain nodes in each domain-specific network
-
-    e = np.array([])  # initialize query vector
-
-    for i in range(g):
-
-        tmp_e = np.zeros((DomainSizes[0, i],))
-
-        if i == s:
-            tmp_e[A_ID[0, i].ravel() == q] = 1  # use g to replace 1 if NoN size is large
-
-        e = np.hstack((e, tmp_e))
-
-    e = e.reshape(len(e), 1)
-    e = sparse.csc_matrix(e)
+    # the query vector has a single non-zero entry, build it directly at the row of q
+    # (float32 in the compact mode, the bounds are kept in float64)
+    if Index is not None:
+        Offsets = Index.Offsets
+        e = Index.query_vector(q, s, W.dtype)
+    else:
+        Offsets = Precomputation.cumulative_ns(A_ID)  # the first row of each domain
+        Rows = Offsets[s] + np.nonzero(A_ID[0, s].ravel() == q)[0]
+        e = sparse.csc_matrix((np.ones(len(Rows), dtype=W.dtype), (Rows, np.zeros(len(Rows), dtype=np.int64))),
+                              shape=(Offsets[-1], 1))
 
     Wmax = W.max(axis=1)
-    Wmax = Wmax.todense().A
+    Wmax = Wmax.todense().A1.astype(np.float64)
 
-    st = np.sum(DomainSizes[0, 0:d])
-    ed = np.sum(DomainSizes[0, 0:d+1])
+    st = Offsets[d]
+    ed = Offsets[d + 1]
     S = np.arange(st, ed)
 
     Iter = 1  # iteration number
     p = e  # the random walk vector
-    Lower = (1.0 - tilde_c) * p[S, 0]  # the lower bound vector
+    Lower = (1.0 - tilde_c) * p[S, 0].toarray().ravel().astype(np.float64)  # the lower bound vector
 
     '''
     Score upper and lower bounds update loop
@@ -65,32 +63,235 @@ def cq_basic(W, q, s, d, k, tilde_c, A_ID):
         '''
         p = W.dot(p)
 
-        # update upper and lower bounds
-        Lower = Lower + (1 - tilde_c) * (tilde_c ** Iter) * p[S, 0]
-        Upper = Lower + (tilde_c ** (Iter + 1)) * Wmax[S]
-
-        # update threshold by the kth lower bound (must have problem in here)
-        kthSmallestValue = np.partition(-Lower.todense().A1, k - 1)[k - 1]  # zero-based index here
-        Theta = -kthSmallestValue
-
-        flattenUpper = np.ravel(Upper)
-        S = S[flattenUpper >= Theta]
-        Lower = Lower[flattenUpper >= Theta, 0]
-        Upper = Upper[flattenUpper >= Theta, 0]
+        [S, Lower, Theta, Gap] = update_bounds(S, Lower, p[S, 0].toarray().ravel(), Wmax, Iter, k, tilde_c)
 
-        # avoid duplicates
-        if np.amax((Upper - Lower).A) < 1e-15:
-            flattenLower = Lower.todense().A1
-            SelectIdx = np.nonzero(flattenLower > Theta)[0]
-            Duplicates = np.nonzero(flattenLower == Theta)[0]
-            SelectIdx = np.hstack((SelectIdx, Duplicates))
-            SelectIdx = SelectIdx[0:k]
-            S = S[SelectIdx]
+        if Trace is not None:
+            Trace('cq_basic', iteration=Iter, candidates=len(S), theta=float(Theta), gap=float(Gap), nnz=p.nnz)
 
         Iter += 1
 
+    if Info is not None:
+        Info['iterations'] = Iter - 1
+        Info['initial_candidates'] = int(ed - st)
+        Info['candidates'] = len(S)
+
     TopKResults = S
-    TopKResults = TopKResults - np.sum(DomainSizes[0, 0:d])
+    TopKResults = TopKResults - st
     TopKResults = A_ID[0, d][TopKResults, 0]
 
     return TopKResults
+
+
+def cq_basic_multi(W, q, s, k, tilde_c, A_ID, Targets=None, Info=None, Trace=None, Index=None):
+    """
+    Multi-target CrossQuery-Basic
+
+    Answers the top-k query of node q for several target domains at once. The random walk from e does not depend on
+    the target domain, so all targets share one sequence of products p = W dot p, and only the candidate set S, the
+    lower/upper bounds and the pruning are kept per target domain. The loop stops once the top k of every target is
+    settled, and gives the same top k as one cq_basic call per target.
+
+    :param W: the transition matrix
+    :param q: the ID of the query node of interest
+    :param s: the ID of the source domain-specific network
+    :param k: the number of retrieved nodes
+    :param tilde_c: the normalized parameter for query preference
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param Targets: the IDs of the target domain-specific networks (None uses every domain except s)
+    :param Info: a dictionary which receives the number of iterations and the iteration at which each target was
+                 settled (optional)
+    :param Trace: a callback (e.g., Telemetry.TraceRecorder) called once per iteration with the total candidate-set
+                  size, the number of unsettled targets and the nnz of p (optional)
+    :param Index: the NodeIndex of the NoN, which locates q without scanning the source domain (optional)
+    :return: the IDs of top k relevant authors from each target domain-specific network, and the target IDs
+    """
+
+    '''
+    Initialization
+    '''
+    if Index is not None:
+        Offsets = Index.Offsets
+        e = Index.query_vector(q, s, W.dtype)
+    else:
+        Offsets = Precomputation.cumulative_ns(A_ID)  # the first row of each domain
+        Rows = Offsets[s] + np.nonzero(A_ID[0, s].ravel() == q)[0]
+        e = sparse.csc_matrix((np.ones(len(Rows), dtype=W.dtype), (Rows, np.zeros(len(Rows), dtype=np.int64))),
+                              shape=(Offsets[-1], 1))
+
+    if Targets is None:
+        Targets = [d for d in range(A_ID.shape[1]) if d != s]
+    Targets = [int(d) for d in Targets]
+    b = len(Targets)  # the number of target domains
+
+    Wmax = W.max(axis=1)
+    Wmax = Wmax.todense().A1.astype(np.float64)
+
+    Iter = 1  # iteration number
+    p = e  # the random walk vector, shared by all targets
+    pd = p.toarray().ravel()
+    S = [np.arange(Offsets[d], Offsets[d + 1]) for d in Targets]  # the candidate set of each target
+    Lower = [(1.0 - tilde_c) * pd[S[j]].astype(np.float64) for j in range(b)]  # the lower bound vector of each target
+    Settled = [0 if len(S[j]) <= k else None for j in range(b)]  # the iteration at which each target was settled
+    Active = [j for j in range(b) if Settled[j] is None]
+
+    '''
+    Score upper and lower bounds update loop
+    '''
+    while len(Active) > 0:
+
+        # one product per iteration for all unsettled targets
+        p = W.dot(p)
+        pd = p.toarray().ravel() if sparse.issparse(p) else np.ravel(p)
+
+        for j in Active:
+            [S[j], Lower[j]] = update_bounds(S[j], Lower[j], pd[S[j]], Wmax, Iter, k, tilde_c)[0:2]
+            if len(S[j]) <= k:
+                Settled[j] = Iter
+
+        Active = [j for j in Active if Settled[j] is None]
+
+        if Trace is not None:
+            Trace('cq_basic_multi', iteration=Iter, candidates=int(sum(len(S[j]) for j in range(b))),
+                  unsettled=len(Active), nnz=int(np.count_nonzero(pd)))
+
+        Iter += 1
+
+    if Info is not None:
+        Info['iterations'] = Iter - 1
+        Info['settled'] = dict(zip(Targets, Settled))
+
+    TopKResults = []
+    for j in range(b):
+        TopKResults.append(A_ID[0, Targets[j]][S[j] - Offsets[Targets[j]], 0])
+
+    return [TopKResults, Targets]
+
+
+def cq_basic_batch(W, Q, s, d, k, tilde_c, A_ID, Index=None):
+    """
+    Batched CrossQuery-Basic
+
+    Answers many queries from the same source and target domains at once. The random walk vectors of all queries
+    are kept as the columns of one dense matrix P, so every iteration costs a single sparse matrix-matrix product
+    P = W dot P instead of one sparse matrix-vector product per query. Each column keeps its own lower/upper bounds
+    and candidate set, and is dropped from P as soon as its top k is settled.
+
+    :param W: the transition matrix
+    :param Q: the IDs of the query nodes of interest
+    :param s: the ID of the source domain-specific network
+    :param d: the ID of the target domain-specific network
+    :param k: the number of retrieved nodes
+    :param tilde_c: the normalized parameter for query preference
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param Index: the NodeIndex of the NoN, which locates the query nodes without scanning the source domain
+                  (optional)
+    :return: a list with the IDs of top k relevant authors from the target domain-specific network for each query
+    """
+
+    '''
+    Initialization
+    '''
+    if Index is not None:
+        Offsets = Index.Offsets
+        Rows = [Index.row(q, s) for q in Q]
+    else:
+        Offsets = Precomputation.cumulative_ns(A_ID)  # the first row of each domain
+
+        SourceIdx = {}  # the local index of each node ID in the source domain
+        for i, ID in enumerate(A_ID[0, s].ravel()):
+            SourceIdx[ID] = i
+        Rows = [Offsets[s] + SourceIdx[q] if q in SourceIdx else None for q in Q]
+
+    n = Offsets[-1]  # the total number of domain nodes
+    b = len(Q)  # the number of queries
+
+    # build all query vectors at once as the columns of E
+    E = np.zeros((n, b), dtype=W.dtype)  # float32 in the compact mode, the bounds are kept in float64
+    for j in range(b):
+        if Rows[j] is not None:
+            E[Rows[j], j] = 1  # use g to replace 1 if NoN size is large
+
+    Wmax = W.max(axis=1)
+    Wmax = Wmax.todense().A1.astype(np.float64)
+
+    st = Offsets[d]
+    ed = Offsets[d + 1]
+
+    Iter = 1  # iteration number
+    P = E  # the random walk vectors, one column per unsettled query
+    Active = list(range(b))  # the queries whose columns are still in P
+    S = [np.arange(st, ed) for j in range(b)]  # the candidate set of each query
+    Lower = [(1.0 - tilde_c) * P[S[j], j].astype(np.float64) for j in range(b)]  # the lower bound vector of each query
+
+    # queries whose candidate set is already small enough never enter the loop
+    Keep = [len(S[j]) > k for j in range(b)]
+    Active = [j for j in Active if Keep[j]]
+    P = P[:, Keep]
+
+    '''
+    Score upper and lower bounds update loop
+    '''
+    while len(Active) > 0:
+
+        # update random walk scores of all unsettled queries with one sparse matrix-matrix product
+        P = W.dot(P)
+
+        Keep = []
+        for col, j in enumerate(Active):
+            [S[j], Lower[j]] = update_bounds(S[j], Lower[j], P[S[j], col], Wmax, Iter, k, tilde_c)[0:2]
+            Keep.append(len(S[j]) > k)
+
+        # drop the columns whose top k is settled
+        Active = [j for col, j in enumerate(Active) if Keep[col]]
+        P = P[:, Keep]
+
+        Iter += 1
+
+    TopKResults = []
+    for j in range(b):
+        TopKResults.append(A_ID[0, d][S[j] - st, 0])
+
+    return TopKResults
+
+
+def update_bounds(S, Lower, pS, Wmax, Iter, k, tilde_c):
+    """
+    One iteration of the score bounds of a candidate set
+
+    Adds the random walk scores of the iteration to the lower bounds, prunes the candidates whose upper bound is
+    below the threshold Theta (the kth largest lower bound), and once the bounds of every candidate have met, keeps
+    the k candidates above Theta, then those tied with it.
+
+    :param S: the candidate set (rows of W)
+    :param Lower: the lower bound vector of S (float64)
+    :param pS: the random walk scores of S after Iter products
+    :param Wmax: the largest entry of each row of W (float64)
+    :param Iter: the iteration number
+    :param k: the number of retrieved nodes
+    :param tilde_c: the normalized parameter for query preference
+    :return: the pruned candidate set, its lower bounds, the threshold Theta and the bound gap max(Upper - Lower)
+    """
+
+    # update upper and lower bounds
+    Lower = Lower + (1 - tilde_c) * (tilde_c ** Iter) * pS.astype(np.float64)
+    Upper = Lower + (tilde_c ** (Iter + 1)) * Wmax[S]
+
+    # update threshold by the kth lower bound
+    kthSmallestValue = np.partition(-Lower, k - 1)[k - 1]  # zero-based index here
+    Theta = -kthSmallestValue
+
+    S = S[Upper >= Theta]
+    Lower = Lower[Upper >= Theta]
+    Upper = Upper[Upper >= Theta]
+
+    # avoid duplicates
+    Gap = np.amax(Upper - Lower)
+    if Gap < 1e-15:
+        SelectIdx = np.nonzero(Lower > Theta)[0]
+        Duplicates = np.nonzero(Lower == Theta)[0]
+        SelectIdx = np.hstack((SelectIdx, Duplicates))
+        SelectIdx = SelectIdx[0:k]
+        S = S[SelectIdx]
+        Lower = Lower[SelectIdx]
+
+    return [S, Lower, Theta, Gap]
@@ -2,12 +2,14 @@ import numpy as np
 from scipy import sparse
 import ExtractSubNet
 import CQ_Basic
+import BlockNoN
 
 
-def cq_fast(Anorm, Y, G, q, s, d, k, alpha, c, epsilon, A_ID):
+def cq_fast(Anorm, Y, G, q, s, d, k, alpha, c, epsilon, A_ID, DisG=None, Cache=None, Info=None, Trace=None,
+            Blocks=False):
     """
     CrossQuery-Fast
-    
+
     :param Anorm: the aggregated normalized adjacency matrix of domain-specific networks
     :param Y: the matrix encoding the cross-domain mapping information
     :param G: the adjacency matrix of the main network
@@ -19,10 +21,73 @@ def cq_fast(Anorm, Y, G, q, s, d, k, alpha, c, epsilon, A_ID):
     :param c: a regularization parameter for query preference
     :param epsilon: an error factor to control the accuracy of results
     :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param DisG: the distance graph of G built once per dataset by ExtractSubNet.distance_graph (optional)
+    :param Cache: a SubNoNCache of extracted sub-NoNs of this dataset (optional)
+    :param Info: a dictionary which receives the statistics of CQ_Basic on the sub-NoN, the number of kept domains
+                 and whether the sub-NoN came from the cache (optional)
+    :param Trace: a callback (e.g., Telemetry.TraceRecorder) receiving the expansions of extract_subnet and the
+                  iterations of CQ_Basic (optional)
+    :param Blocks: run CQ_Basic on the block operator of the sub-NoN (see BlockNoN), which is cached with it
     :return: the ID of top k relevant authors from the target domain-specific network and the the ID of relevant domains
              of the source and target domains
     """
 
+    '''
+    Extract the relevant sub-NoN, or reuse the cached one
+    '''
+    key = (int(s), int(d), float(epsilon), float(alpha), float(c), bool(Blocks))
+    SubNoN = None
+
+    if Cache is not None:
+        SubNoN = Cache.get(key)
+
+    if Info is not None:
+        Info['cache_hit'] = SubNoN is not None
+
+    if SubNoN is None:
+        SubNoN = sub_non(Anorm, Y, G, s, d, alpha, c, epsilon, A_ID, DisG, Trace, Blocks)
+        if Cache is not None:
+            Cache.put(key, SubNoN)
+
+    [W, tilde_c, Sub_A_ID, SubG_Idx] = SubNoN
+    s = np.nonzero(SubG_Idx == s)[0][0]
+    d = np.nonzero(SubG_Idx == d)[0][0]
+
+    '''
+    Apply CQ_Basic on the extracted NoN
+    '''
+    TopKResults = CQ_Basic.cq_basic(W, q, s, d, k, tilde_c, Sub_A_ID, Info, Trace)
+
+    if Info is not None:
+        Info['domains'] = len(SubG_Idx)
+        Info['domains_total'] = A_ID.shape[1]
+
+    return [TopKResults, SubG_Idx]
+
+
+def sub_non(Anorm, Y, G, s, d, alpha, c, epsilon, A_ID, DisG=None, Trace=None, Blocks=False):
+    """
+    Extract the relevant sub-NoN w.r.t. source and target domains and assemble its transition matrix
+
+    The result does not depend on the query node, so it can be reused by all queries with the same s, d, alpha, c
+    and epsilon.
+
+    :param Anorm: the aggregated normalized adjacency matrix of domain-specific networks
+    :param Y: the matrix encoding the cross-domain mapping information
+    :param G: the adjacency matrix of the main network
+    :param s: the ID of the source domain-specific network
+    :param d: the ID of the target domain-specific network
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param epsilon: an error factor to control the accuracy of results
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param DisG: the distance graph of G built once per dataset by ExtractSubNet.distance_graph (optional)
+    :param Trace: a callback receiving the expansions of extract_subnet (optional)
+    :param Blocks: return the transition matrix as a block operator (see BlockNoN)
+    :return: the transition matrix of the sub-NoN, the normalized parameter tilde_c, the IDs of domain nodes in each
+             domain-specific network of the sub-NoN and the ID of relevant domains
+    """
+
     '''
     Initialization
     '''
@@ -33,38 +98,29 @@ def cq_fast(Anorm, Y, G, q, s, d, k, alpha, c, epsilon, A_ID):
     '''
     Extract relevant subnetwork from the main network
     '''
-    SubG_Idx = ExtractSubNet.extract_subnet(G, s, d, epsilon)
+    SubG_Idx = ExtractSubNet.extract_subnet(G, s, d, epsilon, DisG, Trace)
 
     '''
     Calculate matrices
     '''
     g = len(SubG_Idx)
-    SubA_Idx = np.array([], dtype=np.int64)
-
-    for i in range(g):
-
-        Hd = CumDomainSizes[0, int(SubG_Idx[i])] - DomainSizes[0, int(SubG_Idx[i])] + 1
-        T1 = CumDomainSizes[0, int(SubG_Idx[i])]
-        SubA_Idx = np.hstack((SubA_Idx, np.arange(Hd - 1, T1, dtype=np.int64)))
+    Hd = CumDomainSizes[0, SubG_Idx] - DomainSizes[0, SubG_Idx]  # the first row of each relevant domain
+    SubA_Idx = np.hstack([np.arange(Hd[i], CumDomainSizes[0, SubG_Idx[i]], dtype=np.int64) for i in range(g)])
 
     DomainSizes = DomainSizes[0, SubG_Idx]
     A_ID = A_ID[0, SubG_Idx]
     A_ID = A_ID.reshape(1, len(A_ID))
-    Anorm = Anorm.tocsc()
+    Anorm = sparse.csr_matrix(Anorm)  # select rows first, so the column selection only sees the relevant rows
     Anorm = Anorm[SubA_Idx, :]
     Anorm = Anorm[:, SubA_Idx]
-    s = np.nonzero(SubG_Idx == s)[0][0]
-    d = np.nonzero(SubG_Idx == d)[0][0]
 
     SubG = G[SubG_Idx, :]
     SubG = SubG[:, SubG_Idx]
-    dSubG = SubG.sum(axis=1)
+    dSubG = SubG.sum(axis=1).getA().ravel()
 
-    Dy = np.zeros((g, 1), dtype=object)  # cell matrix
-    for i in range(g):
-        Dy[i, 0] = dSubG[i, 0] * sparse.eye(DomainSizes[i])
-    Dy = sparse.block_diag(Dy[:, 0])
+    Dy = sparse.diags(np.repeat(dSubG, DomainSizes)).tocsc()
 
+    Y = sparse.csr_matrix(Y)
     Y = Y[SubA_Idx, :]
     Y = Y[:, SubA_Idx]
     Dt = Dy - sparse.diags(Y.sum(axis=1).getA().ravel()).tocsc()
@@ -74,10 +130,8 @@ def cq_fast(Anorm, Y, G, q, s, d, k, alpha, c, epsilon, A_ID):
 
     tilde_c = (c + 2.0 * alpha) / (1.0 + 2.0 * alpha)
     W = (c / (c + 2.0 * alpha)) * Anorm + ((2.0 * alpha) / (c + 2.0 * alpha)) * Ynorm
+    W = sparse.csr_matrix(W)
+    if Blocks:
+        W = BlockNoN.BlockNoN(W, np.hstack(([0], np.cumsum(DomainSizes))))
 
-    '''
-    Apply CQ_Basic on the extracted NoN
-    '''
-    TopKResults = CQ_Basic.cq_basic(W, q, s, d, k, tilde_c, A_ID)
-
-    return [TopKResults, SubG_Idx]
+    return [W, tilde_c, A_ID, SubG_Idx]
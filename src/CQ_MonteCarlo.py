@@ -0,0 +1,263 @@
+import multiprocessing
+import numpy as np
+from scipy import sparse
+import CR
+import Precomputation
+
+
+def walk_tables(W):
+    """
+    Build the sampling tables of the weighted random walk on W
+
+    A walk at node u moves to v with probability W[u, v] / w(u), where w(u) is the row sum of u, and multiplies its
+    weight by w(u), so the expected weight arriving at v after t steps is (W^t e)[v] for any nonnegative W (W is
+    symmetric, so rows and columns agree). The next node is drawn by inverse transform sampling on the cumulative
+    sums of the csr data.
+
+    :param W: the transition matrix
+    :return: a dictionary with the csr arrays of W, the row sums and the cumulative sums of the data
+    """
+
+    W = sparse.csr_matrix(W)
+
+    Tables = {}
+    Tables['indptr'] = W.indptr
+    Tables['indices'] = W.indices
+    Tables['RowSums'] = np.asarray(W.sum(axis=1)).ravel()
+    Tables['Cum'] = np.cumsum(W.data)  # the cumulative sums of the data, row by row
+    Tables['Base'] = np.hstack(([0.0], Tables['Cum']))[W.indptr[:-1]]  # the cumulative sum before each row
+
+    return Tables
+
+
+def walk_batch(Tables, u, st, ed, tilde_c, NumWalks, MaxSteps, seed):
+    """
+    Simulate a batch of restarting random walks from u, all walks advance together one step at a time
+
+    Every visit of a walk to a node adds (1 - tilde_c) times the walk weight to the score of that node, and the walk
+    continues with probability tilde_c, so the mean contribution of a walk is (1 - tilde_c) sum_t tilde_c^t W^t e.
+
+    :param Tables: the sampling tables built by walk_tables
+    :param u: the start node (the row of the query node)
+    :param st: the first row of the target domain-specific network
+    :param ed: the row after the last row of the target domain-specific network
+    :param tilde_c: the normalized parameter for query preference
+    :param NumWalks: the number of walks in the batch
+    :param MaxSteps: the maximal length of a walk
+    :param seed: the random seed of the batch
+    :return: the sums, the sums of squares and the maxima over walks of the contributions of each target node and the
+             number of walks visiting each target node (dense, length ed - st), and the number of walks visiting the
+             target domain with the sum, the sum of squares and the maximum over walks of their contributions to the
+             whole domain
+    """
+
+    rng = np.random.RandomState(seed)
+    indptr = Tables['indptr']
+    indices = Tables['indices']
+    RowSums = Tables['RowSums']
+    Cum = Tables['Cum']
+    Base = Tables['Base']
+
+    Nodes = np.full(NumWalks, u, dtype=np.int64)  # the current node of each live walk
+    Weights = np.ones(NumWalks)  # the weight of each live walk
+    Walks = np.arange(NumWalks)  # the index of each live walk
+
+    VisitWalks = []
+    VisitNodes = []
+    VisitValues = []
+
+    for Step in range(MaxSteps + 1):
+
+        # record the visits to the target domain
+        InTarget = (Nodes >= st) & (Nodes < ed)
+        if np.any(InTarget):
+            VisitWalks.append(Walks[InTarget])
+            VisitNodes.append(Nodes[InTarget] - st)
+            VisitValues.append((1.0 - tilde_c) * Weights[InTarget])
+
+        # continue with probability tilde_c, from nodes with at least one edge
+        Live = (rng.rand(len(Nodes)) < tilde_c) & (RowSums[Nodes] > 0)
+        Nodes = Nodes[Live]
+        Weights = Weights[Live]
+        Walks = Walks[Live]
+        if len(Nodes) == 0:
+            break
+
+        # draw the next nodes by inverse transform sampling within the rows of the current nodes
+        Targets = Base[Nodes] + rng.rand(len(Nodes)) * RowSums[Nodes]
+        Pos = np.searchsorted(Cum, Targets, side='right')
+        Pos = np.clip(Pos, indptr[Nodes], indptr[Nodes + 1] - 1)
+        Weights = Weights * RowSums[Nodes]
+        Nodes = indices[Pos].astype(np.int64)
+
+    m = ed - st
+    if len(VisitWalks) == 0:
+        return [np.zeros(m), np.zeros(m), np.zeros(m), np.zeros(m), np.zeros(4)]
+
+    # the contribution of each (walk, node) pair, then the sums over walks
+    Keys = np.hstack(VisitWalks) * m + np.hstack(VisitNodes)
+    [Keys, Inverse] = np.unique(Keys, return_inverse=True)
+    Z = np.bincount(Inverse, weights=np.hstack(VisitValues), minlength=len(Keys))
+    KeyNodes = Keys % m
+
+    # the contribution of each walk to the whole target domain
+    T = np.bincount(Keys // m, weights=Z)
+    T = T[T > 0]
+    Max = np.zeros(m)
+    np.maximum.at(Max, KeyNodes, Z)
+
+    return [np.bincount(KeyNodes, weights=Z, minlength=m), np.bincount(KeyNodes, weights=Z ** 2, minlength=m), Max,
+            np.bincount(KeyNodes, minlength=m).astype(np.float64),
+            np.array([len(T), T.sum(), (T ** 2).sum(), T.max() if len(T) > 0 else 0.0])]
+
+
+# the sampling tables of the worker processes, set once per worker by init_worker
+WorkerTables = None
+
+
+def init_worker(Tables):
+    global WorkerTables
+    WorkerTables = Tables
+
+
+def worker_batch(Args):
+    return walk_batch(WorkerTables, *Args)
+
+
+def cq_montecarlo(W, q, s, d, k, tilde_c, A_ID, NumWalks=10000, BatchSize=2000, Processes=None, Confidence=0.95,
+                  MaxSteps=200, seed=0, Tables=None, Info=None, MinVisits=30):
+    """
+    CrossQuery with Monte Carlo random walks
+
+    Estimates the CQ_Basic scores of the target domain-specific network with restarting random walks from the query
+    node, and returns the top k nodes by their estimates with confidence intervals. More walks give tighter
+    intervals at the cost of latency. Walks are simulated in batches, and the batches are spread across a process
+    pool. Batch b always uses the random seed seed + b, so results do not depend on the number of processes.
+
+    The contributions of single walks are heavy-tailed (a walk multiplies its weight by the row sums of W), so normal
+    intervals undercover. The intervals are empirical Bernstein bounds instead, sqrt(2 V log(3 / delta) / N) +
+    3 B log(3 / delta) / N around the estimate, with the sample variance V, the largest observed contribution B of a
+    walk and delta = 1 - Confidence. They are only reported for a node visited by at least MinVisits walks, since B
+    is unreliable below that. Every other node gets the residual mass bound [0, T - L]: T is the upper end of the
+    interval of the score mass of the whole target domain (the sum of the scores, estimated from all walks which
+    reach it) and L is the sum of the lower ends of the intervals, as every score is nonnegative. The intervals hold
+    together only approximately (they are not corrected for multiple comparisons).
+
+    k is at most the size of the target domain. Raises ValueError if fewer than MinVisits walks reach the target
+    domain. If fewer than k target nodes are visited, the top k is filled with unvisited nodes, whose estimates are
+    zero and whose intervals are the residual mass bound.
+
+    :param W: the transition matrix
+    :param q: the ID of the query node of interest
+    :param s: the ID of the source domain-specific network
+    :param d: the ID of the target domain-specific network
+    :param k: the number of retrieved nodes
+    :param tilde_c: the normalized parameter for query preference
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param NumWalks: the number of random walks
+    :param BatchSize: the number of walks simulated together
+    :param Processes: the number of worker processes (None simulates the batches in this process)
+    :param Confidence: the confidence level of the intervals
+    :param MaxSteps: the maximal length of a walk, the truncated tail is at most tilde_c^(MaxSteps + 1)
+    :param seed: the random seed
+    :param Tables: the sampling tables built by walk_tables (optional, built from W if not given)
+    :param Info: a dictionary which receives the numbers of walks, batches, walks reaching the target domain and
+                 visited target nodes, the number of the top k with their own intervals, the residual mass bound and the
+                 largest interval half-width among the top k (optional)
+    :param MinVisits: the number of visiting walks from which a node (or the target domain) gets its own interval
+    :return: the IDs of top k relevant authors from the target domain-specific network, their estimated scores and
+             their confidence intervals (k x 2)
+    """
+
+    '''
+    Initialization
+    '''
+    Offsets = Precomputation.cumulative_ns(A_ID)  # the first row of each domain
+    st = Offsets[d]
+    ed = Offsets[d + 1]
+    k = min(k, ed - st)
+
+    if Tables is None:
+        Tables = walk_tables(W)
+
+    Start = np.nonzero(A_ID[0, s].ravel() == q)[0]
+    if len(Start) == 0:
+        raise ValueError("The query node " + str(q) + " is not in the source domain " + str(s))
+    u = Offsets[s] + Start[0]
+
+    Batches = []
+    for b in range(int(np.ceil(float(NumWalks) / BatchSize))):
+        Batches.append((u, st, ed, tilde_c, min(BatchSize, NumWalks - b * BatchSize), MaxSteps, seed + b))
+
+    '''
+    Simulate the walks
+    '''
+    if Processes is not None and Processes > 1:
+        Pool = multiprocessing.Pool(Processes, initializer=init_worker, initargs=(Tables,))
+        try:
+            Results = Pool.map(worker_batch, Batches)
+        finally:
+            Pool.close()
+            Pool.join()
+    else:
+        Results = [walk_batch(Tables, *Batch) for Batch in Batches]
+
+    SumZ = np.sum([Result[0] for Result in Results], axis=0)
+    SumZ2 = np.sum([Result[1] for Result in Results], axis=0)
+    MaxZ = np.max([Result[2] for Result in Results], axis=0)
+    Hits = np.sum([Result[3] for Result in Results], axis=0)
+    [DomainWalks, SumT, SumT2] = np.sum([Result[4][0:3] for Result in Results], axis=0)
+    MaxT = max(Result[4][3] for Result in Results)
+    Visited = int(np.count_nonzero(Hits))
+
+    if DomainWalks < MinVisits:
+        raise ValueError("Only " + str(int(DomainWalks)) + " of " + str(NumWalks) + " walks reach the target domain " +
+                         str(d) + " (at least " + str(MinVisits) + " are needed), increase NumWalks")
+
+    '''
+    Estimates and confidence intervals
+    '''
+    Estimates = SumZ / NumWalks
+    HalfWidths = bernstein_half_width(SumZ2 / NumWalks - Estimates ** 2, MaxZ, NumWalks, Confidence)
+    Lower = np.maximum(Estimates - HalfWidths, 0.0)
+    Upper = Estimates + HalfWidths
+
+    # the residual mass bound of the nodes with too few visits
+    Bounded = Hits >= MinVisits
+    Mass = SumT / NumWalks
+    MassUpper = Mass + bernstein_half_width(SumT2 / NumWalks - Mass ** 2, MaxT, NumWalks, Confidence)
+    Residual = max(MassUpper - Lower[Bounded].sum(), 0.0)
+    Lower[~Bounded] = 0.0
+    Upper[~Bounded] = Residual
+
+    TopK = CR.top_k(Estimates, k)
+    Intervals = np.vstack((Lower[TopK], Upper[TopK])).T
+
+    if Info is not None:
+        Info['walks'] = NumWalks
+        Info['batches'] = len(Batches)
+        Info['domain_walks'] = int(DomainWalks)
+        Info['visited'] = Visited
+        Info['bounded'] = int(np.count_nonzero(Bounded[TopK]))
+        Info['residual_bound'] = float(Residual)
+        Info['max_half_width'] = float((Intervals[:, 1] - Intervals[:, 0]).max() / 2.0) if len(TopK) > 0 else 0.0
+
+    TopKResults = A_ID[0, d][TopK, 0]
+
+    return [TopKResults, Estimates[TopK], Intervals]
+
+
+def bernstein_half_width(Variances, Ranges, NumWalks, Confidence):
+    """
+    The half-width of the empirical Bernstein confidence interval of a mean of NumWalks walks
+
+    :param Variances: the sample variances of the contributions
+    :param Ranges: the largest contributions (the contributions are nonnegative)
+    :param NumWalks: the number of walks
+    :param Confidence: the confidence level
+    :return: the half-widths
+    """
+
+    Log = np.log(3.0 / (1.0 - Confidence))
+
+    return np.sqrt(2.0 * np.maximum(Variances, 0.0) * Log / NumWalks) + 3.0 * Ranges * Log / NumWalks
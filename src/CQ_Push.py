@@ -0,0 +1,143 @@
+import numpy as np
+from scipy import sparse
+import Precomputation
+
+
+def cq_push(W, q, s, d, k, tilde_c, A_ID, rmax=1e-4, Wmax=None, Info=None, Trace=None):
+    """
+    CrossQuery with local forward push
+
+    Computes the same scores as CrossQuery-Basic, x = (1 - tilde_c) sum_t tilde_c^t W^t e, by residual forward push:
+    an estimate x and a residual res start at 0 and e, and pushing node u moves (1 - tilde_c) res[u] into x[u] and
+    spreads tilde_c res[u] W[:, u] over the residual. All nodes whose residual exceeds rmax are pushed together in
+    one round, reading only their columns of W, so the work stays proportional to the region the walk has reached.
+
+    Once no residual exceeds rmax, the scores of the target domain are bounded as in CQ_Basic,
+    Lower = x + (1 - tilde_c) res and Upper = Lower + tilde_c Wmax |res|_1, the candidate set S is pruned by the
+    kth largest lower bound, and rmax is divided by 10 until at most k candidates remain.
+
+    :param W: the transition matrix (csr), symmetric like every W = a Anorm + b Ynorm, so the column of a node is
+              read as its row
+    :param q: the ID of the query node of interest
+    :param s: the ID of the source domain-specific network
+    :param d: the ID of the target domain-specific network
+    :param k: the number of retrieved nodes
+    :param tilde_c: the normalized parameter for query preference
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param rmax: the initial residual threshold
+    :param Wmax: the row maxima of W (optional, only the rows of the target domain are computed if not given)
+    :param Info: a dictionary which receives the numbers of bound checks, push rounds, pushes and touched nodes and
+                 the final candidate-set size (optional)
+    :param Trace: a callback (e.g., Telemetry.TraceRecorder) called at every bound check with rmax, the candidate-set
+                  size, Theta, the bound gap, the residual mass and the number of touched nodes (optional)
+    :return: the IDs of top k relevant authors from the target domain-specific network
+    """
+
+    '''
+    Initialization
+    '''
+    W = sparse.csr_matrix(W)
+    indptr = W.indptr
+    indices = W.indices
+    data = W.data
+
+    Offsets = Precomputation.cumulative_ns(A_ID)  # the first row of each domain
+    n = Offsets[-1]
+
+    st = Offsets[d]
+    ed = Offsets[d + 1]
+    S = np.arange(st, ed)  # the candidate set
+
+    if Wmax is None:
+        Wmax = np.zeros(n)
+        Wmax[st:ed] = W[st:ed, :].max(axis=1).toarray().ravel()
+
+    x = np.zeros(n)  # the estimated scores
+    res = np.zeros(n)  # the residual
+    Touched = np.zeros(n, dtype=bool)  # the nodes which ever had a residual
+
+    Frontier = np.nonzero(A_ID[0, s].ravel() == q)[0] + Offsets[s]  # the query node
+    res[Frontier] = 1
+    Touched[Frontier] = True
+    TouchedParts = [Frontier]  # the touched nodes, in the order they were reached
+    ResSum = float(len(Frontier))  # the residual mass |res|_1
+
+    Iter = 0  # the number of bound checks
+    Rounds = 0
+    Pushes = 0
+
+    '''
+    Push rounds and bound checks
+    '''
+    while len(S) > k:
+
+        # push every node whose residual exceeds rmax until none is left
+        TouchedList = np.hstack(TouchedParts)
+        TouchedParts = [TouchedList]
+        Frontier = TouchedList[res[TouchedList] > rmax]
+        while len(Frontier) > 0:
+
+            Delta = res[Frontier]
+            x[Frontier] += (1.0 - tilde_c) * Delta
+            res[Frontier] = 0.0
+
+            # gather the columns of the frontier nodes
+            Starts = indptr[Frontier]
+            Lens = indptr[Frontier + 1] - Starts
+            Pos = np.arange(np.sum(Lens)) - np.repeat(np.cumsum(Lens) - Lens, Lens) + np.repeat(Starts, Lens)
+            Rows = indices[Pos]
+            Vals = tilde_c * data[Pos] * np.repeat(Delta, Lens)
+
+            [Reached, Inverse] = np.unique(Rows, return_inverse=True)
+            Spread = np.bincount(Inverse, weights=Vals, minlength=len(Reached))
+            res[Reached] += Spread
+            ResSum = max(ResSum - np.sum(Delta) + np.sum(Spread), 0.0)
+
+            New = Reached[~Touched[Reached]]
+            Touched[New] = True
+            TouchedParts.append(New)
+
+            Rounds += 1
+            Pushes += len(Frontier)
+            Frontier = Reached[res[Reached] > rmax]
+
+        Iter += 1
+
+        # update upper and lower bounds of the candidates
+        Lower = x[S] + (1.0 - tilde_c) * res[S]
+        Upper = Lower + tilde_c * Wmax[S] * ResSum
+
+        # update threshold by the kth lower bound
+        Theta = -np.partition(-Lower, k - 1)[k - 1]
+
+        S = S[Upper >= Theta]
+        Lower = Lower[Upper >= Theta]
+        Upper = Upper[Upper >= Theta]
+
+        # avoid duplicates
+        Gap = np.amax(Upper - Lower)
+        if Gap < 1e-15:
+            SelectIdx = np.nonzero(Lower > Theta)[0]
+            Duplicates = np.nonzero(Lower == Theta)[0]
+            SelectIdx = np.hstack((SelectIdx, Duplicates))
+            SelectIdx = SelectIdx[0:k]
+            S = S[SelectIdx]
+
+        if Trace is not None:
+            Trace('cq_push', iteration=Iter, rmax=rmax, candidates=len(S), theta=float(Theta), gap=float(Gap),
+                  residual=ResSum, touched=int(np.sum([len(Part) for Part in TouchedParts])))
+
+        rmax /= 10.0
+
+    if Info is not None:
+        Info['iterations'] = Iter
+        Info['rounds'] = Rounds
+        Info['pushes'] = Pushes
+        Info['touched'] = int(np.sum([len(Part) for Part in TouchedParts]))
+        Info['initial_candidates'] = int(ed - st)
+        Info['candidates'] = len(S)
+
+    TopKResults = S - st
+    TopKResults = A_ID[0, d][TopKResults, 0]
+
+    return TopKResults
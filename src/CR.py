@@ -1,8 +1,17 @@
+import time
 import numpy as np
-from scipy.sparse.linalg import norm
+from scipy import sparse
+from scipy.sparse.linalg import norm, splu, gmres, bicgstab
+import ParallelSpMV
+import BlockNoN
 
+try:
+    from inspect import signature
+except ImportError:  # Python 2, whose SciPy solvers only take tol
+    signature = None
 
-def cr(Anorm, Ynorm, I_n, e, alpha, c, MaxIter, epsilon):
+
+def cr(Anorm, Ynorm, I_n, e, alpha, c, MaxIter, epsilon, Trace=None, Threads=None, Offsets=None, Blocks=False):
     """
     Cross Rank
 
@@ -14,6 +23,12 @@ def cr(Anorm, Ynorm, I_n, e, alpha, c, MaxIter, epsilon):
     :param c: a regularization parameter for query preference
     :param MaxIter: the maximal number of iteration for updating raking vector
     :param epsilon: a convergence parameter
+    :param Trace: a callback (e.g., Telemetry.TraceRecorder) called once per iteration with the objective value and
+                  delta (optional)
+    :param Threads: the number of threads of the products with M (see ParallelSpMV, None multiplies serially)
+    :param Offsets: the domain block boundaries used to partition M among the threads or into blocks (see
+                    Precomputation.cumulative_ns)
+    :param Blocks: multiply only the blocks of the domains which carry mass in r (see BlockNoN, needs Offsets)
 
     :returns r: the ranking vector
     :returns Objs: objective values
@@ -23,8 +38,10 @@ def cr(Anorm, Ynorm, I_n, e, alpha, c, MaxIter, epsilon):
     '''
     Initialization
     '''
-    # initialize ranking vector
-    r = e.astype(np.float64)
+    # initialize ranking vector, in float32 in the compact mode
+    [Dtype, epsilon] = working_precision(Anorm, Ynorm, epsilon)
+    e = e.astype(Dtype)
+    r = e
 
     # initialize parameters
     gamma = c / (1.0 + 2.0 * alpha)
@@ -41,13 +58,13 @@ def cr(Anorm, Ynorm, I_n, e, alpha, c, MaxIter, epsilon):
     Objs = []
     Deltas = []
     Iter = 1
+    M = product_operator(gamma * Anorm + kappa * Ynorm, Threads, Offsets, Blocks)
 
     '''
     Power method update loop
     '''
     while delta > epsilon and Iter <= MaxIter:
         # update r
-        M = gamma * Anorm + kappa * Ynorm
         r = M.dot(r) + eta * e
 
         # convergence analysis
@@ -58,10 +75,454 @@ def cr(Anorm, Ynorm, I_n, e, alpha, c, MaxIter, epsilon):
         # delta = J2 - J1  # objective value measure
         delta = norm(J2 - J1, ord=1)  # ranking vector norm measure
 
-        # Objs = np.hstack((Objs, J1))  # objective value measure
-        Objs = np.hstack((Objs, norm(J1, ord=1)))  # ranking vector norm measure
-        Deltas = np.hstack((Deltas, delta))
+        # Objs.append(J1)  # objective value measure
+        Objs.append(norm(J1, ord=1))  # ranking vector norm measure
+        Deltas.append(delta)
+
+        if Trace is not None:
+            Trace('cr', iteration=Iter, obj=Objs[-1], delta=delta)
+
+        Iter += 1
+
+    close_operator(M)
+
+    return [r, np.array(Objs), np.array(Deltas)]
+
+
+# the solver backends of cr_solve
+Solvers = ['power', 'gauss_seidel', 'sor', 'gmres', 'bicgstab']
+
+
+def cr_solve(Anorm, Ynorm, e, alpha, c, MaxIter=1000, epsilon=1e-15, solver='power', omega=1.2, Trace=None,
+             Threads=None, Offsets=None, Blocks=False):
+    """
+    Cross Rank with a selectable solver backend
+
+    The ranking vector is the fixed point r = M r + eta e with M = gamma Anorm + kappa Ynorm, i.e., the solution of
+    the linear system (I - M) r = eta e. M is built once and r is a dense vector.
+
+    power:          the power method of cr, stops when the L1 change of r (rounded to 1e-16) is at most epsilon
+    gauss_seidel:   Gauss-Seidel iteration on (I - M) r = eta e, same stopping rule as power
+    sor:            successive over-relaxation with factor omega, same stopping rule as power
+    gmres:          restarted GMRES from scipy.sparse.linalg, stops when the relative residual is at most epsilon
+    bicgstab:       BiCGSTAB from scipy.sparse.linalg, stops when the relative residual is at most epsilon
+
+    :param Anorm: the aggregated normalized adjacency matrix of domain-specific networks
+    :param Ynorm: the normalized matrix encoding the cross-domain mapping information
+    :param e: the query vector (dense or sparse, n x 1)
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param MaxIter: the maximal number of iterations
+    :param epsilon: a convergence parameter
+    :param solver: the solver backend, one of Solvers
+    :param omega: the relaxation factor of sor
+    :param Trace: a callback (e.g., Telemetry.TraceRecorder) called once per iteration with the L1 change of r (power,
+                  gauss_seidel, sor) or the residual norm (gmres) (optional)
+    :param Threads: the number of threads of the products with M in the power method (see ParallelSpMV, None
+                    multiplies serially)
+    :param Offsets: the domain block boundaries used to partition M among the threads or into blocks (see
+                    Precomputation.cumulative_ns)
+    :param Blocks: multiply only the blocks of the domains which carry mass in r (see BlockNoN, needs Offsets)
+
+    :returns r: the ranking vector (dense, length n)
+    :returns Info: a dictionary with the solver, the number of iterations, the L1 residual of (I - M) r = eta e,
+                   whether the stopping rule was met and the wall time in seconds
+    """
+
+    '''
+    Initialization
+    '''
+    start = time.time()
+
+    [Dtype, epsilon] = working_precision(Anorm, Ynorm, epsilon)
+
+    if sparse.issparse(e):
+        e = e.toarray()
+    e = np.asarray(e, dtype=Dtype).ravel()
+
+    gamma = c / (1.0 + 2.0 * alpha)
+    kappa = 2.0 * alpha / (1.0 + 2.0 * alpha)
+    eta = (1.0 - c) / (1.0 + 2 * alpha)
+
+    M = sparse.csr_matrix(gamma * Anorm + kappa * Ynorm)
+    b = eta * e
+
+    '''
+    Solve
+    '''
+    if solver == 'power':
+        Op = product_operator(M, Threads, Offsets, Blocks)
+        [r, Iter, Converged] = power_iteration(Op, b, e, MaxIter, epsilon, Trace)
+        close_operator(Op)
+    elif solver == 'gauss_seidel':
+        [r, Iter, Converged] = sor_iteration(M, b, e, MaxIter, epsilon, 1.0, Trace)
+    elif solver == 'sor':
+        [r, Iter, Converged] = sor_iteration(M, b, e, MaxIter, epsilon, omega, Trace)
+    elif solver in ('gmres', 'bicgstab'):
+        [r, Iter, Converged] = krylov(M, b, e, MaxIter, epsilon, solver, Trace)
+    else:
+        raise ValueError("Invalid solver: " + str(solver) + ", choose from " + ", ".join(Solvers))
+
+    Info = {'solver': solver,
+            'iterations': int(Iter),
+            'residual': float(np.abs(b - (r - M.dot(r))).sum()),
+            'converged': bool(Converged),
+            'runtime': time.time() - start}
+
+    return [r, Info]
+
+
+def power_iteration(M, b, r, MaxIter, epsilon, Trace=None):
+    """
+    Power method r = M r + b from the initial vector r
+    """
+
+    J1 = np.around(r * 1e16) / 1e16
+    delta = 99999
+    Iter = 0
+
+    while delta > epsilon and Iter < MaxIter:
+        r = M.dot(r) + b
+
+        J2 = J1
+        J1 = np.around(r * 1e16) / 1e16
+        delta = np.abs(J2 - J1).sum()
 
         Iter += 1
 
-    return [r, Objs, Deltas]
+        if Trace is not None:
+            Trace('cr', iteration=Iter, delta=delta)
+
+    return [r, Iter, delta <= epsilon]
+
+
+def sor_iteration(M, b, r, MaxIter, epsilon, omega, Trace=None):
+    """
+    Successive over-relaxation (Gauss-Seidel when omega = 1) on (I - M) r = b from the initial vector r
+
+    With I - M = L + D + U (strictly lower, diagonal and strictly upper parts), each sweep solves the triangular
+    system (D + omega L) r' = omega b - (omega U + (omega - 1) D) r. The triangular matrix is factorized once, in
+    its natural order and without pivoting, so the factors have no fill-in and a sweep is two compiled triangular
+    solves.
+    """
+
+    A = sparse.csr_matrix(sparse.identity(M.shape[0], format='csr') - M)
+    D = sparse.diags(A.diagonal())
+    Lower = sparse.csr_matrix(D + omega * sparse.tril(A, k=-1))
+    Rest = sparse.csr_matrix(omega * sparse.triu(A, k=1) + (omega - 1.0) * D)
+    Lower = splu(Lower.tocsc(), permc_spec='NATURAL', diag_pivot_thresh=0.0, options={'SymmetricMode': True})
+
+    J1 = np.around(r * 1e16) / 1e16
+    delta = 99999
+    Iter = 0
+
+    while delta > epsilon and Iter < MaxIter:
+        r = Lower.solve(omega * b - Rest.dot(r))
+
+        J2 = J1
+        J1 = np.around(r * 1e16) / 1e16
+        delta = np.abs(J2 - J1).sum()
+
+        Iter += 1
+
+        if Trace is not None:
+            Trace('cr', iteration=Iter, delta=delta)
+
+    return [r, Iter, delta <= epsilon]
+
+
+def krylov(M, b, r, MaxIter, epsilon, solver, Trace=None):
+    """
+    GMRES or BiCGSTAB on (I - M) r = b from the initial vector r
+    """
+
+    A = sparse.csr_matrix(sparse.identity(M.shape[0], format='csr') - M)
+    Counter = [0]
+
+    def count(xk):
+        Counter[0] += 1
+        if Trace is not None:
+            if solver == 'gmres':  # xk is the preconditioned residual norm
+                Trace('cr', iteration=Counter[0], residual=float(xk))
+            else:
+                Trace('cr', iteration=Counter[0])
+
+    if solver == 'gmres':
+        Solve = gmres
+        Options = {'restart': 20, 'maxiter': MaxIter, 'callback': count, 'callback_type': 'pr_norm'}
+    else:
+        Solve = bicgstab
+        Options = {'maxiter': MaxIter, 'callback': count}
+
+    Options[tolerance_name(Solve)] = epsilon
+    [r, Status] = Solve(A, b, x0=r, atol=0.0, **Options)
+
+    return [r, Counter[0], Status == 0]
+
+
+def tolerance_name(Solve):
+    """
+    :return: the keyword of the relative tolerance of a scipy.sparse.linalg solver, rtol (SciPy >= 1.12) or tol
+    """
+
+    if signature is None:
+        return 'tol'
+
+    return 'rtol' if 'rtol' in signature(Solve).parameters else 'tol'
+
+
+def cr_block(Anorm, Ynorm, E, alpha, c, MaxIter=1000, epsilon=1e-15, Threads=None, Offsets=None,
+             Blocks=False, Operator=None):
+    """
+    Cross Rank for a block of query vectors
+
+    Runs the power method of cr_solve on all columns of E at once, one sparse matrix-matrix product per iteration.
+    A column stops being updated as soon as its own L1 change (rounded to 1e-16) is at most epsilon.
+
+    :param Anorm: the aggregated normalized adjacency matrix of domain-specific networks
+    :param Ynorm: the normalized matrix encoding the cross-domain mapping information
+    :param E: the query vectors as the columns of a dense n x b matrix
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param MaxIter: the maximal number of iterations
+    :param epsilon: a convergence parameter
+    :param Threads: the number of threads of the products with M (see ParallelSpMV, None multiplies serially)
+    :param Offsets: the domain block boundaries used to partition M among the threads or into blocks (see
+                    Precomputation.cumulative_ns)
+    :param Blocks: multiply only the blocks of the domains which carry mass in r (see BlockNoN, needs Offsets)
+    :param Operator: the operator of M built once by cr_operator for many blocks with the same alpha and c, which
+                     the caller closes (optional, Threads, Offsets and Blocks are ignored if given)
+
+    :returns R: the ranking vectors as the columns of a dense n x b matrix
+    :returns Iters: the number of iterations of each column
+    """
+
+    eta = (1.0 - c) / (1.0 + 2 * alpha)
+
+    [Dtype, epsilon] = working_precision(Anorm, Ynorm, epsilon)
+    M = Operator if Operator is not None else cr_operator(Anorm, Ynorm, alpha, c, Threads, Offsets, Blocks)
+    E = np.asarray(E, dtype=Dtype)
+
+    R = np.zeros(E.shape, dtype=Dtype)
+    Iters = np.zeros(E.shape[1], dtype=np.int64)
+    Active = np.arange(E.shape[1])  # the columns which have not converged yet
+    Ra = E.copy()  # the ranking vectors of the active columns
+    Ea = eta * E
+    J1 = np.around(Ra * 1e16) / 1e16
+    Iter = 0
+
+    while len(Active) > 0 and Iter < MaxIter:
+        Ra = M.dot(Ra) + Ea
+
+        J2 = J1
+        J1 = np.around(Ra * 1e16) / 1e16
+        delta = np.abs(J2 - J1).sum(axis=0)
+
+        Iter += 1
+
+        # move the converged columns out of the active block
+        Done = delta <= epsilon
+        if np.any(Done):
+            R[:, Active[Done]] = Ra[:, Done]
+            Iters[Active[Done]] = Iter
+            Ra = Ra[:, ~Done]
+            Ea = Ea[:, ~Done]
+            J1 = J1[:, ~Done]
+            Active = Active[~Done]
+
+    R[:, Active] = Ra
+    Iters[Active] = Iter
+
+    if Operator is None:
+        close_operator(M)
+
+    return [R, Iters]
+
+
+def cr_operator(Anorm, Ynorm, alpha, c, Threads=None, Offsets=None, Blocks=False):
+    """
+    Build the operator of M = gamma Anorm + kappa Ynorm of the power method of cr_block (close it with
+    close_operator)
+    """
+
+    gamma = c / (1.0 + 2.0 * alpha)
+    kappa = 2.0 * alpha / (1.0 + 2.0 * alpha)
+
+    return product_operator(sparse.csr_matrix(gamma * Anorm + kappa * Ynorm), Threads, Offsets, Blocks)
+
+
+def cr_topk(Anorm, Ynorm, e, alpha, c, st, ed, k, MaxIter=1000, epsilon=1e-15, Trace=None, Threads=None,
+            Offsets=None, Blocks=False):
+    """
+    Cross Rank top-k mode
+
+    Runs the power method of cr_solve, but stops as soon as the top k nodes of the target domain-specific network
+    (rows st to ed of r) and their order are certain. M = gamma Anorm + kappa Ynorm is symmetric with spectral norm
+    at most rho = gamma + kappa = tilde_c, so after an update with change Delta every entry of r is within
+    Tail = rho Delta / (1 - rho) (Delta in the L2 norm) of its limit. The remaining geometric tail can no longer
+    change the top k order once the k + 1 largest target scores are more than 2 Tail apart from each other. If
+    they are tied, the usual stopping rule of cr_solve (L1 change at most epsilon) applies.
+
+    :param Anorm: the aggregated normalized adjacency matrix of domain-specific networks
+    :param Ynorm: the normalized matrix encoding the cross-domain mapping information
+    :param e: the query vector (dense or sparse, n x 1)
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param st: the first row of the target domain-specific network
+    :param ed: the row after the last row of the target domain-specific network
+    :param k: the number of retrieved nodes
+    :param MaxIter: the maximal number of iterations
+    :param epsilon: a convergence parameter of the fallback stopping rule
+    :param Trace: a callback (e.g., Telemetry.TraceRecorder) called once per iteration with the L1 change, the tail
+                  bound and the smallest gap among the k + 1 largest target scores at the last check (optional)
+    :param Threads: the number of threads of the products with M (see ParallelSpMV, None multiplies serially)
+    :param Offsets: the domain block boundaries used to partition M among the threads or into blocks (see
+                    Precomputation.cumulative_ns)
+    :param Blocks: multiply only the blocks of the domains which carry mass in r (see BlockNoN, needs Offsets)
+
+    :returns TopK: the indices of the top k nodes within the target domain-specific network, in decreasing order
+    :returns Scores: their ranking scores
+    :returns Info: a dictionary with the solver (topk), the number of iterations, the tail bound, whether the top k
+                   order was certified, whether a stopping rule was met and the wall time in seconds
+    """
+
+    '''
+    Initialization
+    '''
+    start = time.time()
+
+    [Dtype, epsilon] = working_precision(Anorm, Ynorm, epsilon)
+
+    if sparse.issparse(e):
+        e = e.toarray()
+    e = np.asarray(e, dtype=Dtype).ravel()
+
+    gamma = c / (1.0 + 2.0 * alpha)
+    kappa = 2.0 * alpha / (1.0 + 2.0 * alpha)
+    eta = (1.0 - c) / (1.0 + 2 * alpha)
+    rho = gamma + kappa  # the contraction factor of the power method
+
+    M = product_operator(sparse.csr_matrix(gamma * Anorm + kappa * Ynorm), Threads, Offsets, Blocks)
+    b = eta * e
+    k = min(k, ed - st)
+
+    r = e
+    J1 = np.around(r * 1e16) / 1e16
+    delta = 99999
+    Tail = float('inf')
+    Gap = float('inf')  # the smallest gap among the k + 1 largest target scores at the last check
+    Certified = False
+    Iter = 0
+
+    '''
+    Power method update loop with the top k certificate
+    '''
+    while delta > epsilon and Iter < MaxIter:
+        rNew = M.dot(r) + b
+        Tail = rho / (1.0 - rho) * np.linalg.norm(rNew - r)
+        r = rNew
+
+        J2 = J1
+        J1 = np.around(r * 1e16) / 1e16
+        delta = np.abs(J2 - J1).sum()
+
+        Iter += 1
+
+        if Trace is not None:
+            Trace('cr', iteration=Iter, delta=delta, tail=Tail, gap=Gap)
+
+        # the k + 1 largest target scores must be separated by more than twice the tail bound, gaps move slowly, so
+        # they are checked once the tail bound is below the last gap seen, and every 10 iterations in case of ties
+        if 2.0 * Tail < Gap or Iter % 10 == 0:
+            Candidates = top_k(r[st:ed], k + 1)
+            Gaps = -np.diff(r[st:ed][Candidates])
+            Gap = Gaps.min() if len(Gaps) > 0 else float('inf')
+
+            if Gap > 2.0 * Tail:
+                Certified = True
+                break
+
+    close_operator(M)
+
+    TopK = top_k(r[st:ed], k)
+
+    Info = {'solver': 'topk',
+            'iterations': int(Iter),
+            'tail': float(Tail),
+            'certified': bool(Certified),
+            'converged': bool(Certified or delta <= epsilon),
+            'runtime': time.time() - start}
+
+    return [TopK, r[st:ed][TopK], Info]
+
+
+def product_operator(M, Threads, Offsets, Blocks=False):
+    """
+    :param M: the sparse matrix of the power method
+    :param Threads: the number of threads (None or 1 keeps M)
+    :param Offsets: the domain block boundaries used to partition M among the threads or into blocks
+    :param Blocks: multiply only the blocks of the active domains
+    :return: M, or a BlockNoN or ParallelSpMV operator computing the same products
+    """
+
+    if Blocks:
+        if Offsets is None:
+            raise ValueError("The block operator needs the domain block boundaries (Offsets)")
+        return BlockNoN.BlockNoN(M, Offsets)
+
+    if Threads is None or Threads <= 1:
+        return M
+
+    return ParallelSpMV.ParallelSpMV(M, Offsets, Threads)
+
+
+def close_operator(M):
+    """
+    Stop the threads of an operator built by product_operator
+    """
+
+    if isinstance(M, ParallelSpMV.ParallelSpMV):
+        M.close()
+
+
+def working_precision(Anorm, Ynorm, epsilon):
+    """
+    The dtype of the ranking vectors and the convergence parameter they can reach
+
+    In the compact mode (float32 Anorm and Ynorm, see Precomputation.compact_precomputation) the ranking vectors are
+    updated in float32, whose L1 change stalls around the float32 machine epsilon instead of reaching 1e-15, so
+    epsilon is raised to 10 times that machine epsilon.
+
+    :param Anorm: the aggregated normalized adjacency matrix of domain-specific networks
+    :param Ynorm: the normalized matrix encoding the cross-domain mapping information
+    :param epsilon: a convergence parameter
+    :return: the dtype of the iterations and the convergence parameter
+    """
+
+    Dtype = np.result_type(Anorm.dtype, Ynorm.dtype)
+    if Dtype != np.float64:
+        epsilon = max(epsilon, 10.0 * np.finfo(Dtype).eps)
+
+    return [Dtype, epsilon]
+
+
+def top_k(x, k):
+    """
+    Partial selection of the k largest entries
+
+    :param x: a dense vector
+    :param k: the number of selected entries
+    :return: the indices of the k largest entries of x in decreasing order of x (ties keep index order)
+    """
+
+    k = min(k, len(x))
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+
+    if k < len(x):
+        TopK = np.argpartition(-x, k - 1)[0:k]
+    else:
+        TopK = np.arange(len(x))
+
+    TopK = np.sort(TopK)  # ties keep index order
+    return TopK[np.argsort(-x[TopK], kind='mergesort')]
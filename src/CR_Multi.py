@@ -0,0 +1,82 @@
+import numpy as np
+import CR
+import Precomputation
+
+
+def cr_multi(Anorm, Ynorm, A_ID, s, d, k, alpha, c, MaxIter=1000, epsilon=1e-15, Queries=None, BlockSize=None,
+             MaxBytes=256 * 1024 * 1024, Threads=None, Blocks=False):
+    """
+    Multi-source Cross Rank
+
+    Solves CR for many query nodes of the source domain-specific network together, in blocks of query vectors
+    (CR.cr_block), and streams out the top k nodes of the target domain-specific network for each query. Only one
+    block of ranking vectors is held in memory at a time. The operator of M is built once and shared by all blocks.
+
+    :param Anorm: the aggregated normalized adjacency matrix of domain-specific networks
+    :param Ynorm: the normalized matrix encoding the cross-domain mapping information
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param s: the ID of the source domain-specific network
+    :param d: the ID of the target domain-specific network
+    :param k: the number of retrieved nodes
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param MaxIter: the maximal number of iterations
+    :param epsilon: a convergence parameter
+    :param Queries: the IDs of the query nodes, all nodes of the source domain-specific network if None
+    :param BlockSize: the number of queries solved together, derived from MaxBytes if None
+    :param MaxBytes: the memory budget of one block (about four dense n x BlockSize float64 matrices)
+    :param Threads: the number of threads of the products with M (see ParallelSpMV, None multiplies serially)
+    :param Blocks: multiply only the blocks of the domains which carry mass (see BlockNoN)
+    :return: a generator of (query ID, IDs of top k authors from the target domain, their ranking scores, number
+             of iterations), in the order of Queries
+    """
+
+    '''
+    Initialization
+    '''
+    Offsets = Precomputation.cumulative_ns(A_ID)  # the first row of each domain
+
+    n = Offsets[-1]  # the total number of domain nodes
+    SourceSt = Offsets[s]
+    st = Offsets[d]
+    ed = Offsets[d + 1]
+    k = min(k, ed - st)
+
+    SourceIDs = A_ID[0, s].ravel()
+    if Queries is None:
+        Queries = SourceIDs
+
+    SourceIdx = {}  # the local index of each node ID in the source domain
+    for i, ID in enumerate(SourceIDs):
+        SourceIdx[ID] = i
+
+    if BlockSize is None:
+        BlockSize = max(1, int(MaxBytes // (4 * 8 * n)))
+
+    '''
+    Solve block by block
+    '''
+    M = CR.cr_operator(Anorm, Ynorm, alpha, c, Threads, Offsets, Blocks)
+
+    try:
+        for BlockSt in range(0, len(Queries), BlockSize):
+
+            Block = Queries[BlockSt:BlockSt + BlockSize]
+
+            E = np.zeros((n, len(Block)))
+            for j in range(len(Block)):
+                if Block[j] in SourceIdx:
+                    E[SourceSt + SourceIdx[Block[j]], j] = 1
+
+            [R, Iters] = CR.cr_block(Anorm, Ynorm, E, alpha, c, MaxIter, epsilon, Operator=M)
+            Rd = R[st:ed, :]  # ranking scores in the target domain-specific network
+            del R
+
+            for j in range(len(Block)):
+
+                # select the top k by partial selection, then sort only those
+                TopK = CR.top_k(Rd[:, j], k)
+
+                yield (Block[j], A_ID[0, d][TopK, 0], Rd[TopK, j], Iters[j])
+    finally:
+        CR.close_operator(M)
@@ -8,8 +8,8 @@ def dijkstra_expansion(rp, ci, vi, H, P, Dis, Len):
     :param rp: row pointer of csr matrix
     :param ci: column index of csr matrix
     :param vi: value index of csr matrix
-    :param H: the heap of node indices
-    :param P: the positions of nodes
+    :param H: the heap of node indices (an integer n x 1 array)
+    :param P: the positions of nodes (an integer n x 1 array, 0 for nodes not in the heap)
     :param Dis: the distance vector of each node to the source/target node
     :param Len: the length of the leap
     :return
@@ -90,7 +90,7 @@ def Relax(rp, ci, vi, H, P, Dis, u, Len):
         if Dis[v, 0] > Dis[u, 0] + EdgeWeight:
 
             Dis[v, 0] = Dis[u, 0] + EdgeWeight
-            Pos = P[v, 0]
+            Pos = int(P[v, 0])
 
             if Pos == 0:  # v is not in the heap
 
@@ -110,8 +110,8 @@ def Relax(rp, ci, vi, H, P, Dis, u, Len):
                 else:
                     H[ParPos - 1, 0] = v
                     P[v, 0] = ParPos
-                    H[int(Pos) - 1] = Par
-                    P[Par] = Pos
+                    H[Pos - 1, 0] = Par
+                    P[Par, 0] = Pos
                     Pos = ParPos
 
     return [Len, H, P, Dis]
@@ -2,16 +2,70 @@ import math
 import numpy as np
 from scipy import sparse
 import DijkstraExpansion
+import BiDijkstra
 
 
-def extract_subnet(G, s, d, epsilon):
+def distance_graph(G):
+    """
+    Transform similarities in the main network to distances
+
+    The transform only touches the non-zero entries of G, so the distance graph stays sparse. Pairs of main nodes
+    with zero similarity are not stored: their distance is the constant -log10(eps) (eps is the float64 machine
+    epsilon), which extract_subnet accounts for when it initializes the heaps. The result only depends on G, so it
+    can be built once per dataset and passed to extract_subnet.
+
+    :param G: the adjacency matrix of the main network
+    :return: the distances between adjacent main nodes as a csr matrix (no diagonal, no zero distances)
+    """
+
+    dG = G.sum(axis=1).getA()
+    D_Gn = sparse.diags((dG ** (-0.5)).ravel())
+    Gnorm = sparse.coo_matrix(D_Gn.dot(G).dot(D_Gn))
+    eps = np.spacing(1.0)
+
+    OffDiag = Gnorm.row != Gnorm.col  # remove the diagonal
+    DisG = sparse.csr_matrix((-np.log10(np.maximum(Gnorm.data[OffDiag], eps)),
+                              (Gnorm.row[OffDiag], Gnorm.col[OffDiag])), shape=Gnorm.shape)
+    DisG.eliminate_zeros()  # zero distances are not edges
+
+    return DisG
+
+
+def extract_subnet(G, s, d, epsilon, DisG=None, Trace=None):
     """
     Extract a relevant subnetwork from the main network w.r.t. source and target domains
+
+    Runs the bidirectional Dijkstra engine of BiDijkstra, which returns the same subnetwork as
+    extract_subnet_basic.
+
+    :param G: the adjacency matrix of the main network
+    :param s: the index of the source domain-specific network
+    :param d: the index of the target domain-specific network
+    :param epsilon: an error factor to control the accuracy of results
+    :param DisG: the distance graph of G built by distance_graph (optional, built from G if not given)
+    :param Trace: a callback (e.g., Telemetry.TraceRecorder) called once per expansion with its radius, heap length
+                  and overlap (optional)
+    :return: ID of domain networks
+    """
+
+    if DisG is None:
+        DisG = distance_graph(G)
+
+    Background = -np.log10(np.spacing(1.0))  # the distance between main nodes with zero similarity
+
+    return BiDijkstra.bidirectional_expansion(DisG, s, d, epsilon, Background, Trace)
+
+
+def extract_subnet_basic(G, s, d, epsilon, DisG=None):
+    """
+    Extract a relevant subnetwork from the main network w.r.t. source and target domains (reference implementation
+    expanding one step at a time with DijkstraExpansion)
     
     :param G: the adjacency matrix of the main network
     :param s: the index of the source domain-specific network
     :param d: the index of the target domain-specific network
     :param epsilon: an error factor to control the accuracy of results
+    :param DisG: the distance graph of G built by distance_graph (optional, built from G if not given)
     :return: ID of domain networks
     """
 
@@ -30,39 +84,49 @@ def extract_subnet(G, s, d, epsilon):
     '''
     Transform similarities in the main network to distances
     '''
-    dG = G.sum(axis=1).getA()
-    D_Gn = sparse.diags((dG ** (-0.5)).ravel())
-    Gnorm = D_Gn.dot(G).dot(D_Gn)
-    eps = np.spacing(1.0)
-    Gnorm = np.maximum(Gnorm.todense().getA(), np.full(Gnorm.shape, eps))
-    DisG = -np.log10(Gnorm)
-    DisG = DisG - np.diag(np.diag(DisG))
+    if DisG is None:
+        DisG = distance_graph(G)
 
     '''
     Heap initialization
     '''
-    DisG = sparse.csr_matrix(DisG)  # csr format sparse matrix
     rp = DisG.indptr
     ci = DisG.indices
     vi = DisG.data
     n = len(rp) - 1  # the number of nodes
+    Background = -np.log10(np.spacing(1.0))  # the distance between main nodes with zero similarity
 
     Dis_s = np.full((n, 1), float('inf'))  # the distances from s to other nodes
-    Hs = np.zeros((n, 1))  # the heap of node indices for s
-    Ps = np.zeros((n, 1))  # the heap positions of nodes for s
+    Hs = np.zeros((n, 1), dtype=np.int64)  # the heap of node indices for s
+    Ps = np.zeros((n, 1), dtype=np.int64)  # the heap positions of nodes for s
     Len_s = 1  # the heap length of s
     Hs[Len_s - 1, 0] = s
     Ps[s, 0] = Len_s
     Dis_s[s, 0] = 0
 
     Dis_d = np.full((n, 1), float('inf'))  # the distances from d to other nodes
-    Hd = np.zeros((n, 1))  # the heap of node indices for d
-    Pd = np.zeros((n, 1))  # the heap positions of nodes for d
+    Hd = np.zeros((n, 1), dtype=np.int64)  # the heap of node indices for d
+    Pd = np.zeros((n, 1), dtype=np.int64)  # the heap positions of nodes for d
     Len_d = 1  # the heap length of d
     Hd[Len_d - 1, 0] = d
     Pd[d, 0] = Len_d
     Dis_d[d, 0] = 0
 
+    '''
+    First expansion
+
+    Pop s and d and relax them against every other node, including the ones at the background distance. Any other
+    path through a pair of nodes with zero similarity is longer than the direct one from s (or d), so later
+    expansions only need to relax the edges of the distance graph.
+    '''
+    [NextNgbr_s, Len_s, Hs, Ps, Dis_s] = first_expansion(rp, ci, vi, Hs, Ps, Dis_s, Len_s, Background)
+    Ns = np.hstack((Ns, NextNgbr_s))
+    rs = Dis_s[NextNgbr_s, 0]
+
+    [NextNgbr_d, Len_d, Hd, Pd, Dis_d] = first_expansion(rp, ci, vi, Hd, Pd, Dis_d, Len_d, Background)
+    Nd = np.hstack((Nd, NextNgbr_d))
+    rd = Dis_d[NextNgbr_d, 0]
+
     '''
     Neighbourhood expansion loop
     '''
@@ -125,3 +189,34 @@ def extract_subnet(G, s, d, epsilon):
             SubG_Idx = np.hstack((SubG_Idx, u))
 
     return SubG_Idx
+
+
+def first_expansion(rp, ci, vi, H, P, Dis, Len, Background):
+    """
+    First step expansion of Dijkstra's algorithm from the source/target node
+
+    The node on top of the heap is relaxed against every other node: its neighbors in the distance graph at their
+    distances, all other nodes at the background distance.
+
+    :param rp: row pointer of csr matrix
+    :param ci: column index of csr matrix
+    :param vi: value index of csr matrix
+    :param H: the heap of node indices
+    :param P: the positions of nodes
+    :param Dis: the distance vector of each node to the source/target node
+    :param Len: the length of the leap
+    :param Background: the distance between nodes with zero similarity
+    :return
+    """
+
+    n = len(rp) - 1  # the number of nodes
+    u = int(H[0, 0])
+
+    Row = np.full(n, Background)  # the dense row of u
+    Row[ci[rp[u]:rp[u + 1]]] = vi[rp[u]:rp[u + 1]]
+    RowCi = np.delete(np.arange(n), u)
+    RowVi = Row[RowCi]
+    RowPtr = np.zeros(n + 1, dtype=np.int64)  # a csr row pointer whose only non-empty row is u
+    RowPtr[u + 1:] = n - 1
+
+    return DijkstraExpansion.dijkstra_expansion(RowPtr, RowCi, RowVi, H, P, Dis, Len)
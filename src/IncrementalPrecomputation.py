@@ -0,0 +1,343 @@
+import numpy as np
+from scipy import sparse
+import ExtractSubNet
+import Precomputation
+import LoadData
+import NodeIndex
+
+
+def domain_sizes(A_ID):
+    """
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :return: the number of domain nodes in each domain-specific network (1-D array)
+    """
+
+    return np.array([A_ID[0, i].shape[0] for i in range(A_ID.shape[1])], dtype=np.int64)
+
+
+def replace_main_row(G, i, G_row):
+    """
+    Replace the ith row and column of the main network
+    :param G: the adjacency matrix of the main network
+    :param i: the index of the main node
+    :param G_row: the new similarities between main node i and every main node (including itself)
+    :return: the updated adjacency matrix (csc)
+    """
+
+    G_row = np.asarray(G_row, dtype=np.float64).ravel()
+    if len(G_row) != G.shape[0]:
+        raise ValueError("G_row has " + str(len(G_row)) + " entries, the main network has " + str(G.shape[0]) +
+                         " main nodes")
+
+    G = sparse.lil_matrix(G)
+    G[i, :] = G_row
+    G[:, i] = G_row.reshape(len(G_row), 1)
+    G = sparse.csc_matrix(G)
+    G.eliminate_zeros()
+
+    return G
+
+
+def update_domain(data, A, A_ID, G, i, A_i, A_ID_i, G_row=None):
+    """
+    Add (i == g) or replace (i < g) a domain-specific network and update the precomputed matrices incrementally
+    :param data: the dictionary of precomputed matrices of the current NoN
+    :param A: the domain-specific networks
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param G: the adjacency matrix of the main network
+    :param i: the index of the domain-specific network
+    :param A_i: the adjacency matrix of the new domain-specific network
+    :param A_ID_i: the IDs of domain nodes in the new domain-specific network
+    :param G_row: the similarities between main node i and every main node including itself, required when a
+                  domain is added, optional when a domain is replaced
+    :return: the updated precomputed matrices, A, A_ID and G
+    """
+
+    g = A.shape[1]
+
+    if i < 0 or i > g:
+        raise ValueError("The domain index " + str(i) + " is out of range, the NoN has " + str(g) + " domains")
+    if A_i.shape[0] != A_i.shape[1] or A_i.shape[0] != len(A_ID_i):
+        raise ValueError("A_i must be a square matrix with one row per entry of A_ID_i")
+
+    OldG = G
+
+    if i == g:  # add a new domain and a new main node
+
+        if G_row is None:
+            raise ValueError("G_row is required when a domain is added")
+
+        NewA = np.zeros((1, g + 1), dtype=object)
+        NewA_ID = np.zeros((1, g + 1), dtype=object)
+        NewA[0, :g] = A[0, :]
+        NewA_ID[0, :g] = A_ID[0, :]
+
+        G = sparse.bmat([[G, None], [None, sparse.csc_matrix((1, 1))]], format='csc')
+        OldG = G
+
+    else:  # replace an existing domain
+
+        NewA = A.copy()
+        NewA_ID = A_ID.copy()
+
+    NewA[0, i] = A_i
+    NewA_ID[0, i] = np.asarray(A_ID_i).reshape(len(A_ID_i), 1)
+
+    if G_row is not None:
+        G = replace_main_row(G, i, G_row)
+
+    Affected = set([i]) | changed_main_nodes(OldG, G)
+    data = incremental_update(data, A_ID, NewA, NewA_ID, G, Affected, set([i]))
+
+    return [data, NewA, NewA_ID, G]
+
+
+def update_main_row(data, A, A_ID, G, i, G_row):
+    """
+    Change the ith row (and column) of the main network and update the precomputed matrices incrementally
+    :param data: the dictionary of precomputed matrices of the current NoN
+    :param A: the domain-specific networks
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param G: the adjacency matrix of the main network
+    :param i: the index of the main node
+    :param G_row: the new similarities between main node i and every main node (including itself)
+    :return: the updated precomputed matrices and G
+    """
+
+    NewG = replace_main_row(G, i, G_row)
+    Affected = changed_main_nodes(G, NewG)
+    data = incremental_update(data, A_ID, A, A_ID, NewG, Affected, set())
+
+    return [data, NewG]
+
+
+def changed_main_nodes(OldG, G):
+    """
+    :param OldG: the old adjacency matrix of the main network
+    :param G: the new adjacency matrix of the main network
+    :return: the set of main nodes whose rows differ between OldG and G
+    """
+
+    Diff = sparse.csr_matrix(OldG - G)
+    Diff.eliminate_zeros()
+
+    return set(np.nonzero(np.diff(Diff.indptr))[0].tolist())
+
+
+def incremental_update(data, OldA_ID, A, A_ID, G, Affected, Renormalized):
+    """
+    Update precomputed matrices after a change of the NoN
+
+    Only the Anorm blocks of renormalized domains are recomputed. A domain is dirty if it is affected (its
+    domain-specific network, or its row of G, changed) or shares nodes with an affected domain, since then the
+    degree of its rows in O changes too. The block-rows of O, Y and Ynorm of dirty domains are recomputed, the
+    corresponding block-columns follow from symmetry, and the clean x clean blocks are copied from the old matrices.
+
+    :param data: the dictionary of precomputed matrices of the old NoN
+    :param OldA_ID: the IDs of domain nodes in each domain-specific network of the old NoN
+    :param A: the domain-specific networks of the new NoN
+    :param A_ID: the IDs of domain nodes in each domain-specific network of the new NoN
+    :param G: the adjacency matrix of the main network of the new NoN
+    :param Affected: the indices of domains whose domain-specific network or main node changed
+    :param Renormalized: the indices of domains whose domain-specific network changed
+    :return: the dictionary of updated precomputed matrices
+    """
+
+    '''
+    Initialization
+    '''
+    g = A.shape[1]
+    g_old = OldA_ID.shape[1]
+
+    OldSizes = domain_sizes(OldA_ID)
+    OldOffsets = np.hstack(([0], np.cumsum(OldSizes)))
+    Sizes = domain_sizes(A_ID)
+    Offsets = np.hstack(([0], np.cumsum(Sizes)))
+    n = int(Offsets[-1])
+
+    '''
+    Find dirty domains
+    '''
+    AffectedIDs = [A_ID[0, a].ravel() for a in Affected]
+    AffectedIDs += [OldA_ID[0, a].ravel() for a in Affected if a < g_old]
+    AffectedIDs = np.unique(np.hstack(AffectedIDs)) if len(AffectedIDs) > 0 else np.array([], dtype=np.int64)
+
+    Dirty = set(Affected)
+    for j in range(g):
+        if j not in Dirty and np.in1d(A_ID[0, j].ravel(), AffectedIDs).any():
+            Dirty.add(j)
+
+    Dirty = sorted(Dirty)
+    Clean = [j for j in range(g) if j not in set(Dirty)]
+
+    DirtyRows = np.hstack([np.arange(Offsets[j], Offsets[j + 1]) for j in Dirty] + [np.array([], dtype=np.int64)])
+    DirtyRows = DirtyRows.astype(np.int64)
+    CleanRows = np.hstack([np.arange(Offsets[j], Offsets[j + 1]) for j in Clean] + [np.array([], dtype=np.int64)])
+    CleanRows = CleanRows.astype(np.int64)
+    OldCleanRows = np.hstack([np.arange(OldOffsets[j], OldOffsets[j + 1]) for j in Clean] +
+                             [np.array([], dtype=np.int64)]).astype(np.int64)
+
+    '''
+    Anorm: renormalize changed domains, copy the other blocks
+    '''
+    OldAnorm = sparse.csr_matrix(data['Anorm'])
+    Anorms = []
+    for j in range(g):
+        if j in Renormalized:
+            Anorms.append(Precomputation.normalize_domain(A[0, j]))
+        else:
+            Anorms.append(OldAnorm[OldOffsets[j]:OldOffsets[j + 1], :][:, OldOffsets[j]:OldOffsets[j + 1]])
+
+    Anorm = sparse.block_diag(Anorms)
+
+    '''
+    Block-rows of O and Y of dirty domains
+    '''
+    dG = G.sum(axis=1).getA().ravel()  # degree of main nodes
+    dy = np.repeat(dG, Sizes)  # diagonal of Dy
+    dyn = dy ** (-0.5)  # diagonal of Dy^(-0.5)
+
+    LocalRow = np.full(n, -1, dtype=np.int64)  # the position of a dirty row among the dirty rows
+    LocalRow[DirtyRows] = np.arange(len(DirtyRows))
+
+    row = []
+    col = []
+    val = []
+    for b in Dirty:
+        for j in range(g):
+
+            w = G[min(b, j), max(b, j)]
+            if w == 0:
+                continue
+
+            [I1, I2] = Precomputation.common_nodes(A_ID[0, b], A_ID[0, j])
+            row.append(LocalRow[I1 + Offsets[b]])
+            col.append(I2 + Offsets[j])
+            val.append(np.full(len(I1), w, dtype=np.float64))
+
+    row = np.hstack(row + [np.array([], dtype=np.int64)])
+    col = np.hstack(col + [np.array([], dtype=np.int64)])
+    val = np.hstack(val + [np.array([], dtype=np.float64)])
+    O_rows = sparse.coo_matrix((val, (row, col)), shape=(len(DirtyRows), n)).tocsr()
+
+    # Y = O + (Dy - Do) on the dirty rows
+    do = O_rows.sum(axis=1).getA().ravel()
+    Dt_rows = sparse.coo_matrix((dy[DirtyRows] - do, (np.arange(len(DirtyRows)), DirtyRows)),
+                                shape=(len(DirtyRows), n))
+    Dt_rows = sparse.csr_matrix(Dt_rows)
+    Dt_rows.eliminate_zeros()
+    Y_rows = (O_rows + Dt_rows).tocoo()
+
+    '''
+    Assemble Y and Ynorm
+    '''
+    OldToNew = np.full(OldOffsets[-1], -1, dtype=np.int64)
+    OldToNew[OldCleanRows] = CleanRows
+
+    OldY = sparse.csr_matrix(data['Y'])[OldCleanRows, :][:, OldCleanRows].tocoo()
+    OldYnorm = sparse.csr_matrix(data['Ynorm'])[OldCleanRows, :][:, OldCleanRows].tocoo()
+
+    # the block-columns of dirty domains on clean rows, Y is symmetric
+    Y_cols = sparse.csr_matrix(Y_rows)[:, CleanRows].tocoo()
+
+    # dirty rows, clean rows x dirty columns and clean rows x clean columns
+    YRow = np.hstack((DirtyRows[Y_rows.row], CleanRows[Y_cols.col], OldToNew[OldCleanRows[OldY.row]]))
+    YCol = np.hstack((Y_rows.col, DirtyRows[Y_cols.row], OldToNew[OldCleanRows[OldY.col]]))
+    YVal = np.hstack((Y_rows.data, Y_cols.data, OldY.data))
+
+    Y = sparse.coo_matrix((YVal, (YRow, YCol)), shape=(n, n)).tocsr()
+    Y.eliminate_zeros()
+
+    # Ynorm = Dy^(-0.5) dot Y dot Dy^(-0.5), computed on the new entries only
+    k = len(Y_rows.data) + len(Y_cols.data)
+    YnVal = (dyn[YRow[:k]] * YVal[:k]) * dyn[YCol[:k]]
+    YnVal[YnVal < 1e-15] = 0.0  # eliminate small entries caused by precision problem, as in the full build
+
+    Ynorm = sparse.coo_matrix((np.hstack((YnVal, OldYnorm.data)),
+                               (np.hstack((YRow[:k], OldToNew[OldCleanRows[OldYnorm.row]])),
+                                np.hstack((YCol[:k], OldToNew[OldCleanRows[OldYnorm.col]])))), shape=(n, n))
+    Ynorm = Ynorm.tocsc()
+    Ynorm.eliminate_zeros()
+
+    '''
+    Collect precomputed matrices
+    '''
+    NewData = {}
+    NewData['Anorm'] = Anorm
+    NewData['Ynorm'] = Ynorm
+    NewData['Y'] = Y
+    NewData['I_n'] = sparse.eye(n)
+    NewData['DisG'] = ExtractSubNet.distance_graph(G)  # cheap, the main network is small
+
+    return NewData
+
+
+def check_precomputation(data, A, A_ID, G, tol=1e-12):
+    """
+    Compare precomputed matrices with a full rebuild
+    :param data: the dictionary of precomputed matrices
+    :param A: the domain-specific networks
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param G: the adjacency matrix of the main network
+    :param tol: the largest allowed absolute difference of an entry
+    :return: whether all matrices match, and the largest absolute difference of each matrix
+    """
+
+    Full = Precomputation.build_precomputation(A, A_ID, G)
+
+    Diffs = {}
+    for name in ['Anorm', 'Ynorm', 'Y', 'DisG']:
+        if data[name].shape != Full[name].shape:
+            Diffs[name] = float('inf')
+            continue
+        Diff = abs(sparse.csr_matrix(data[name]) - sparse.csr_matrix(Full[name]))
+        Diffs[name] = float(Diff.max()) if Diff.nnz > 0 else 0.0
+
+    Same = all(Diffs[name] <= tol for name in Diffs)
+
+    return [Same, Diffs]
+
+
+def incremental_precomputation(PrecompFileName, OutFileName, A, A_ID, G, i, A_i=None, A_ID_i=None, G_row=None,
+                               Check=False, AuthorDict=None, ConfDict=None):
+    """
+    Update a precomputation file after adding or replacing a domain-specific network, or changing a row of G
+
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) of the current precomputation
+    :param OutFileName: the file name (npy format) or directory (mmap format) to store the updated precomputation, a
+                        name without the .npy extension is stored in the mmap format. Do not overwrite a directory
+                        that is memory-mapped by a running process.
+    :param A: the domain-specific networks
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :param G: the adjacency matrix of the main network
+    :param i: the index of the changed domain (g to add a domain) or main node
+    :param A_i: the adjacency matrix of the new domain-specific network, None to only change the row of G
+    :param A_ID_i: the IDs of domain nodes in the new domain-specific network
+    :param G_row: the new similarities between main node i and every main node (including itself)
+    :param Check: compare the result with a full rebuild, raise ValueError on mismatch
+    :param AuthorDict: the names of authors, kept in the node index stored with the update (optional)
+    :param ConfDict: the names of conferences, including the one of an added domain (optional)
+    :return: the updated A, A_ID and G
+    """
+
+    data = LoadData.load_precomputation(PrecompFileName)
+
+    if A_i is not None:
+        [data, A, A_ID, G] = update_domain(data, A, A_ID, G, i, A_i, A_ID_i, G_row)
+    elif G_row is not None:
+        [data, G] = update_main_row(data, A, A_ID, G, i, G_row)
+    else:
+        raise ValueError("Nothing to update, give A_i and A_ID_i, or G_row")
+
+    if Check:
+        [Same, Diffs] = check_precomputation(data, A, A_ID, G)
+        if not Same:
+            raise ValueError("The incremental precomputation differs from a full rebuild: " + str(Diffs))
+
+    Format = "npy" if OutFileName.endswith('.npy') else "mmap"
+    Precomputation.save_precomputation(data, OutFileName, Format)
+
+    # the node index of the updated domain offsets, replacing the one of an overwritten precomputation
+    NodeIndex.NodeIndex.build(A_ID, AuthorDict, ConfDict).save(NodeIndex.index_file_name(OutFileName))
+
+    return [A, A_ID, G]
@@ -0,0 +1,243 @@
+import os
+import json
+import numpy as np
+from scipy import sparse
+import Precomputation
+import ExtractSubNet
+import NodeIndex
+
+
+def load_non(dataset):
+    """
+    Load an NoN dataset
+
+    :param dataset: the path of the dataset (e.g., ../data/DBLP_NoN.npy), or a directory in the NoN directory format
+    :return: a dictionary with CoAuthorNets, ConfNet, CoAuthorNetsID, AuthorDict and ConfDict
+    """
+
+    if os.path.isdir(dataset):
+        return load_non_dir(dataset)
+
+    return np.load(dataset, allow_pickle=True).item()
+
+
+class NoNDirWriter(object):
+    """
+    Streaming writer of the NoN directory format
+
+    The directory holds ConfNet.npz (the main network), one domains/<i>.npz file per domain-specific network with
+    its adjacency matrix and node IDs, AuthorDict.txt and ConfDict.txt (one name per line) and a manifest.json which
+    is written last. Domains are written one at a time, so an NoN never needs to be held in memory as a whole.
+    """
+
+    def __init__(self, Dir):
+        """
+        :param Dir: the directory to write the NoN into
+        """
+
+        self.Dir = Dir
+        self.g = 0  # the number of domains written so far
+        if not os.path.isdir(os.path.join(Dir, 'domains')):
+            os.makedirs(os.path.join(Dir, 'domains'))
+
+    def write_main(self, ConfNet):
+        """
+        Write the adjacency matrix of the main network
+        """
+
+        sparse.save_npz(os.path.join(self.Dir, 'ConfNet.npz'), sparse.csc_matrix(ConfNet))
+
+    def write_domain(self, A_i, ID_i):
+        """
+        Write the next domain-specific network and the IDs of its nodes
+        """
+
+        A_i = sparse.csc_matrix(A_i)
+        np.savez(os.path.join(self.Dir, 'domains', '%d.npz' % self.g), data=A_i.data, indices=A_i.indices,
+                 indptr=A_i.indptr, shape=np.array(A_i.shape), ids=np.ravel(ID_i))
+        self.g += 1
+
+    def write_names(self, FileName, Names):
+        """
+        Write names (an iterable of strings) into AuthorDict.txt or ConfDict.txt, one name per line
+        """
+
+        with open(os.path.join(self.Dir, FileName), 'w') as f:
+            for name in Names:
+                f.write(name + '\n')
+
+    def close(self, Meta=None):
+        """
+        Write the manifest, a directory without it is an incomplete NoN
+
+        :param Meta: extra information to keep in the manifest (e.g., the generator parameters)
+        """
+
+        manifest = {'version': 1, 'domains': self.g, 'meta': Meta if Meta is not None else {}}
+        with open(os.path.join(self.Dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+
+class NoNDirDomains(object):
+    """
+    Domain-specific networks of an NoN in the NoN directory format, read from disk on access
+
+    Indexed like CoAuthorNets (Domains[0, i]), so the streaming precomputation holds only the domains of its current
+    chunk in memory.
+    """
+
+    def __init__(self, Dir, g):
+        self.Dir = Dir
+        self.shape = (1, g)
+
+    def __getitem__(self, key):
+        Domain = np.load(os.path.join(self.Dir, 'domains', '%d.npz' % key[1]))
+
+        return sparse.csc_matrix((Domain['data'], Domain['indices'], Domain['indptr']), shape=tuple(Domain['shape']))
+
+
+def load_non_dir(Dir, Lazy=False):
+    """
+    Load an NoN stored in the NoN directory format into the layout of DBLP_NoN.npy
+
+    :param Dir: the directory of the NoN
+    :param Lazy: return CoAuthorNets as a NoNDirDomains reader instead of loading every domain-specific network
+    :return: a dictionary with CoAuthorNets, ConfNet, CoAuthorNetsID, AuthorDict and ConfDict
+    """
+
+    with open(os.path.join(Dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    g = manifest['domains']
+    CoAuthorNets = np.zeros((1, g), dtype=object) if not Lazy else NoNDirDomains(Dir, g)
+    CoAuthorNetsID = np.zeros((1, g), dtype=object)
+
+    for i in range(g):
+        Domain = np.load(os.path.join(Dir, 'domains', '%d.npz' % i))
+        if not Lazy:
+            CoAuthorNets[0, i] = sparse.csc_matrix((Domain['data'], Domain['indices'], Domain['indptr']),
+                                                   shape=tuple(Domain['shape']))
+        CoAuthorNetsID[0, i] = Domain['ids'].reshape(len(Domain['ids']), 1)
+
+    with open(os.path.join(Dir, 'AuthorDict.txt')) as f:
+        Names = f.read().splitlines()
+    AuthorDict = np.zeros((len(Names), 1), dtype=object)
+    for i in range(len(Names)):
+        AuthorDict[i, 0] = np.array([Names[i]])
+
+    with open(os.path.join(Dir, 'ConfDict.txt')) as f:
+        Names = f.read().splitlines()
+    ConfDict = np.zeros((1, len(Names)), dtype=object)
+    for i in range(len(Names)):
+        ConfDict[0, i] = np.array([Names[i]])
+
+    return {'CoAuthorNets': CoAuthorNets, 'ConfNet': sparse.load_npz(os.path.join(Dir, 'ConfNet.npz')),
+            'CoAuthorNetsID': CoAuthorNetsID, 'AuthorDict': AuthorDict, 'ConfDict': ConfDict}
+
+
+def prepare_precomputation(A, A_ID, G, PrecompFileName, AuthorDict=None, ConfDict=None):
+    """
+    Run the precomputation if its file does not exist yet, this step only needs to be done once for a dataset
+
+    :param A: the domain-specific networks
+    :param A_ID: the corresponding IDs of domain-specific networks in A
+    :param G: the adjacency matrix of the main network
+    :param PrecompFileName: the file name to store precomputation results, a name without the .npy extension is
+                            stored as a directory in the mmap format
+    :param AuthorDict: the names of authors, kept in the node index (optional)
+    :param ConfDict: the names of conferences, kept in the node index (optional)
+    """
+
+    if os.path.isfile(PrecompFileName) or os.path.isfile(os.path.join(PrecompFileName, 'manifest.json')):
+        print("A precomputation file has been detected ...")
+        if not os.path.isfile(NodeIndex.index_file_name(PrecompFileName)):  # precomputed before the index existed
+            NodeIndex.NodeIndex.build(A_ID, AuthorDict, ConfDict).save(NodeIndex.index_file_name(PrecompFileName))
+    else:
+        print("Precomputation starts ...")
+        Format = "npy" if PrecompFileName.endswith('.npy') else "mmap"
+        Precomputation.precomputation(A, A_ID, G, PrecompFileName, Format, AuthorDict=AuthorDict, ConfDict=ConfDict)
+
+
+def load_node_index(dataset, PrecompFileName, n=None):
+    """
+    Load the node index stored with precomputation results, building and storing it if it is missing
+
+    An index whose number of domain nodes differs from the one of the precomputation (e.g., one kept from before an
+    update which added a domain) is rebuilt from the dataset.
+
+    :param dataset: the path of the dataset
+    :param PrecompFileName: the file name of precomputation results
+    :param n: the number of rows of the precomputed matrices, read from the manifest of the mmap format if None
+              (the check is skipped for the npy format without n)
+    :return: a NodeIndex
+    """
+
+    if n is None and os.path.isfile(os.path.join(PrecompFileName, 'manifest.json')):
+        with open(os.path.join(PrecompFileName, 'manifest.json')) as f:
+            n = json.load(f)['n']
+
+    IndexFileName = NodeIndex.index_file_name(PrecompFileName)
+    if os.path.isfile(IndexFileName):
+        Index = NodeIndex.NodeIndex.load(IndexFileName)
+        if n is None or Index.Offsets[-1] == n:
+            return Index
+
+    data = load_non(dataset)
+    Index = NodeIndex.NodeIndex.build(data['CoAuthorNetsID'], data['AuthorDict'], data['ConfDict'])
+    if n is not None and Index.Offsets[-1] != n:
+        raise ValueError("The dataset has " + str(Index.Offsets[-1]) + " domain nodes, but the precomputation " +
+                         str(PrecompFileName) + " has " + str(n) + " rows")
+    if os.path.isfile(PrecompFileName) or os.path.isdir(PrecompFileName):
+        Index.save(IndexFileName)
+
+    return Index
+
+
+def load_precomputation(PrecompFileName):
+    """
+    Load precomputed matrices
+
+    :param PrecompFileName: the file name of precomputation results, or the directory of the mmap format
+    :return: a dictionary with Anorm, Ynorm, Y, DisG and I_n
+    """
+
+    if os.path.isdir(PrecompFileName):
+        return Precomputation.load_precomputation_mmap(PrecompFileName)
+
+    return np.load(PrecompFileName, allow_pickle=True).item()
+
+
+def load_all(dataset, PrecompFileName, Compact=False):
+    """
+    Load an NoN dataset together with its precomputed matrices, running the precomputation if needed
+
+    :param dataset: the path of the dataset
+    :param PrecompFileName: the file name of precomputation results
+    :param Compact: convert the precomputed matrices to the compact mode (float32 values, int32 indices, see
+                    Precomputation.compact_precomputation)
+    :return: a dictionary with G, A, A_ID, AuthorDict, ConfDict, Anorm, Ynorm, Y, DisG and I_n
+    """
+
+    data = load_non(dataset)
+
+    NoN = {}
+    NoN['G'] = sparse.csc_matrix(data['ConfNet'])  # the main network
+    NoN['A'] = data['CoAuthorNets']  # the domain-specific networks
+    NoN['A_ID'] = data['CoAuthorNetsID']  # the IDs of nodes in domain-specific networks
+    NoN['AuthorDict'] = data['AuthorDict']
+    NoN['ConfDict'] = data['ConfDict']
+
+    prepare_precomputation(NoN['A'], NoN['A_ID'], NoN['G'], PrecompFileName, NoN['AuthorDict'], NoN['ConfDict'])
+
+    print("Load the precomputation file ...")
+    data = load_precomputation(PrecompFileName)
+    if Compact:
+        data = Precomputation.compact_precomputation(data)
+    NoN.update(data)
+
+    if 'DisG' not in NoN:  # precomputed before the distance graph was stored
+        NoN['DisG'] = ExtractSubNet.distance_graph(NoN['G'])
+        if Compact:
+            NoN['DisG'] = Precomputation.compact_matrix(NoN['DisG'], 'csr', np.float64)
+
+    return NoN
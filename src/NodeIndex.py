@@ -0,0 +1,230 @@
+import os
+import numpy as np
+from scipy import sparse
+
+
+def index_file_name(PrecompFileName):
+    """
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) of precomputation results
+    :return: the file of the node index stored next to (or inside) the precomputation results
+    """
+
+    if PrecompFileName.endswith('.npy'):
+        return os.path.splitext(PrecompFileName)[0] + '_NodeIndex.npz'
+
+    return os.path.join(PrecompFileName, 'NodeIndex.npz')
+
+
+def encode_names(Dict):
+    """
+    Pack the names of AuthorDict ((N, 1)) or ConfDict ((1, g)) into one UTF-8 byte array
+
+    :return: the bytes of all names and the offset of each name in them (length + 1)
+    """
+
+    Names = [str(np.ravel(name)[0]).encode('utf-8') for name in np.ravel(Dict)]
+    Ptr = np.hstack(([0], np.cumsum([len(name) for name in Names]))).astype(np.int64)
+
+    return [np.frombuffer(b''.join(Names), dtype=np.uint8), Ptr]
+
+
+class NodeIndex(object):
+    """
+    Node-position index of an NoN
+
+    Maps the global ID of an author (1-based, as in AuthorDict) to the rows of all its copies in the aggregated
+    matrices Anorm, Ynorm and Y, and keeps the first row of each domain block, so the query vector of (q, s) is built
+    in O(1) without scanning the domains. The names of authors and conferences are stored packed as UTF-8, and
+    name -> ID hash tables are built on the first name lookup.
+
+    The positions are kept in csr form: the rows of ID q are IDRows[IDPtr[q]:IDPtr[q + 1]], in increasing order, so
+    they are also ordered by domain.
+    """
+
+    def __init__(self, Offsets, IDPtr, IDRows, AuthorBytes=None, AuthorPtr=None, ConfBytes=None, ConfPtr=None):
+        """
+        :param Offsets: the first row of each domain block followed by n (see Precomputation.cumulative_ns)
+        :param IDPtr: the start of the rows of each ID in IDRows (length max ID + 2)
+        :param IDRows: the global rows of all domain nodes, grouped by ID
+        :param AuthorBytes: the packed author names (optional)
+        :param AuthorPtr: the offset of each author name in AuthorBytes (optional)
+        :param ConfBytes: the packed conference names (optional)
+        :param ConfPtr: the offset of each conference name in ConfBytes (optional)
+        """
+
+        self.Offsets = np.asarray(Offsets, dtype=np.int64)
+        self.IDPtr = np.asarray(IDPtr, dtype=np.int64)
+        self.IDRows = np.asarray(IDRows, dtype=np.int64)
+        self.AuthorBytes = AuthorBytes
+        self.AuthorPtr = AuthorPtr
+        self.ConfBytes = ConfBytes
+        self.ConfPtr = ConfPtr
+        self.AuthorIDs = None  # name -> ID, built on first use
+        self.ConfIDs = None  # name -> domain, built on first use
+
+    @staticmethod
+    def build(A_ID, AuthorDict=None, ConfDict=None):
+        """
+        Build the index of an NoN
+
+        :param A_ID: the IDs of domain nodes in each domain-specific network
+        :param AuthorDict: the names of authors (optional)
+        :param ConfDict: the names of conferences (optional)
+        :return: a NodeIndex
+        """
+
+        ns = np.array([A_ID[0, i].shape[0] for i in range(A_ID.shape[1])], dtype=np.int64)
+        Offsets = np.hstack(([0], np.cumsum(ns)))
+
+        IDs = np.hstack([np.ravel(A_ID[0, i]) for i in range(A_ID.shape[1])]).astype(np.int64) if len(ns) > 0 \
+            else np.zeros(0, dtype=np.int64)
+        MaxID = int(IDs.max()) if len(IDs) > 0 else 0
+        if AuthorDict is not None:
+            MaxID = max(MaxID, AuthorDict.shape[0])
+
+        IDRows = np.argsort(IDs, kind='mergesort')  # stable, so the rows of an ID stay in increasing order
+        IDPtr = np.hstack(([0], np.cumsum(np.bincount(IDs, minlength=MaxID + 1)))).astype(np.int64)
+
+        [AuthorBytes, AuthorPtr] = encode_names(AuthorDict) if AuthorDict is not None else [None, None]
+        [ConfBytes, ConfPtr] = encode_names(ConfDict) if ConfDict is not None else [None, None]
+
+        return NodeIndex(Offsets, IDPtr, IDRows, AuthorBytes, AuthorPtr, ConfBytes, ConfPtr)
+
+    def save(self, FileName):
+        """
+        Store the index as an npz file (no pickling involved)
+        """
+
+        Arrays = {'Offsets': self.Offsets, 'IDPtr': self.IDPtr, 'IDRows': self.IDRows}
+        if self.AuthorBytes is not None:
+            Arrays['AuthorBytes'] = self.AuthorBytes
+            Arrays['AuthorPtr'] = self.AuthorPtr
+        if self.ConfBytes is not None:
+            Arrays['ConfBytes'] = self.ConfBytes
+            Arrays['ConfPtr'] = self.ConfPtr
+
+        with open(FileName, 'wb') as f:  # keep the name, np.savez would append .npz to a file name without it
+            np.savez(f, **Arrays)
+
+    @staticmethod
+    def load(FileName):
+        """
+        Load an index stored by save
+        """
+
+        Arrays = np.load(FileName)
+
+        return NodeIndex(Arrays['Offsets'], Arrays['IDPtr'], Arrays['IDRows'],
+                         Arrays['AuthorBytes'] if 'AuthorBytes' in Arrays else None,
+                         Arrays['AuthorPtr'] if 'AuthorPtr' in Arrays else None,
+                         Arrays['ConfBytes'] if 'ConfBytes' in Arrays else None,
+                         Arrays['ConfPtr'] if 'ConfPtr' in Arrays else None)
+
+    def rows(self, q):
+        """
+        :param q: the ID of a node
+        :return: the global rows of all copies of q, ordered by domain
+        """
+
+        if q < 0 or q + 1 >= len(self.IDPtr):
+            return np.zeros(0, dtype=np.int64)
+
+        return self.IDRows[self.IDPtr[q]:self.IDPtr[q + 1]]
+
+    def domains(self, q):
+        """
+        :param q: the ID of a node
+        :return: the domains which contain q
+        """
+
+        return np.searchsorted(self.Offsets, self.rows(q), side='right') - 1
+
+    def row(self, q, s):
+        """
+        :param q: the ID of a node
+        :param s: the ID of a domain-specific network
+        :return: the global row of q in domain s, None if q is not in s
+        """
+
+        Rows = self.rows(q)
+        Rows = Rows[(Rows >= self.Offsets[s]) & (Rows < self.Offsets[s + 1])]
+
+        return int(Rows[0]) if len(Rows) > 0 else None
+
+    def query_vector(self, q, s, dtype=np.float64):
+        """
+        :param q: the ID of the query node
+        :param s: the ID of the source domain-specific network
+        :param dtype: the dtype of the vector (e.g., the dtype of W)
+        :return: the query vector e (csc, n x 1), all zeros if q is not in s
+        """
+
+        n = self.Offsets[-1]
+        u = self.row(q, s)
+        if u is None:
+            return sparse.csc_matrix((n, 1), dtype=dtype)
+
+        return sparse.csc_matrix((np.ones(1, dtype=dtype), (np.array([u]), np.array([0]))), shape=(n, 1))
+
+    def author_name(self, q):
+        """
+        :param q: the ID of an author (1-based)
+        :return: the name of the author
+        """
+
+        if self.AuthorBytes is None:
+            raise ValueError("The node index has no author names")
+
+        return self.AuthorBytes[self.AuthorPtr[q - 1]:self.AuthorPtr[q]].tobytes().decode('utf-8')
+
+    def author_names(self, IDs):
+        return [self.author_name(int(q)) for q in IDs]
+
+    def author_id(self, name):
+        """
+        :param name: the name of an author
+        :return: the ID of the author (the smallest one if several authors share the name)
+        """
+
+        if self.AuthorBytes is None:
+            raise ValueError("The node index has no author names")
+
+        if self.AuthorIDs is None:
+            self.AuthorIDs = {}
+            for q in range(len(self.AuthorPtr) - 1, 0, -1):  # from the last ID, so the smallest ID is kept
+                self.AuthorIDs[self.author_name(q)] = q
+
+        if name not in self.AuthorIDs:
+            raise ValueError("Unknown author: " + name)
+
+        return self.AuthorIDs[name]
+
+    def domain_name(self, i):
+        """
+        :param i: the ID of a domain-specific network (0-based)
+        :return: the name of the domain (conference)
+        """
+
+        if self.ConfBytes is None:
+            raise ValueError("The node index has no conference names")
+
+        return self.ConfBytes[self.ConfPtr[i]:self.ConfPtr[i + 1]].tobytes().decode('utf-8')
+
+    def domain_id(self, name):
+        """
+        :param name: the name of a domain (conference)
+        :return: the ID of the domain-specific network
+        """
+
+        if self.ConfBytes is None:
+            raise ValueError("The node index has no conference names")
+
+        if self.ConfIDs is None:
+            self.ConfIDs = {}
+            for i in range(len(self.ConfPtr) - 2, -1, -1):
+                self.ConfIDs[self.domain_name(i)] = i
+
+        if name not in self.ConfIDs:
+            raise ValueError("Unknown conference: " + name)
+
+        return self.ConfIDs[name]
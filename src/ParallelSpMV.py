@@ -0,0 +1,140 @@
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from scipy import sparse
+
+try:
+    from scipy.sparse import _sparsetools
+except ImportError:  # SciPy < 1.8
+    from scipy.sparse import sparsetools as _sparsetools
+
+
+def partition_rows(indptr, Offsets, Parts):
+    """
+    Partition the rows of a csr matrix along the domain blocks into pieces with balanced numbers of non-zeros
+
+    :param indptr: the row pointer of the csr matrix
+    :param Offsets: the first row of each domain block followed by the number of rows (see
+                    Precomputation.cumulative_ns), None cuts anywhere
+    :param Parts: the number of pieces
+    :return: the row boundaries of the pieces (at most Parts + 1 increasing rows from 0 to n)
+    """
+
+    n = len(indptr) - 1
+    if Offsets is None:
+        Offsets = np.arange(n + 1)
+    Offsets = np.asarray(Offsets, dtype=np.int64)
+
+    # cut at the domain boundary closest to each multiple of nnz / Parts
+    Nnz = indptr[Offsets].astype(np.float64)
+    Targets = np.arange(1, Parts) * (float(indptr[-1]) / Parts)
+    Cuts = np.clip(np.searchsorted(Nnz, Targets), 1, len(Offsets) - 1)
+    Closer = np.abs(Nnz[Cuts - 1] - Targets) <= np.abs(Nnz[Cuts] - Targets)
+    Cuts[Closer] -= 1
+
+    return np.unique(np.hstack(([0], Offsets[Cuts], [n])))
+
+
+class ParallelSpMV(object):
+    """
+    Multi-threaded sparse matrix-vector and matrix-matrix products
+
+    The rows of a csr matrix (e.g., W of CQ_Basic or M of CR) are partitioned along the domain blocks into one piece
+    per thread with about the same number of non-zeros. Anorm is block-diagonal and Ynorm only couples rows of the
+    same domain block with their copies, so a piece reads a contiguous slice of the matrix and writes a contiguous
+    slice of the output. The pieces share the arrays of the matrix (only their row pointers are rebased), the output
+    is allocated once per product and every thread writes its slice in place with the SciPy sparsetools kernels,
+    which release the GIL.
+
+    The operator has dot, max, shape and dtype, so it can replace W in cq_basic and M in the power method of CR.
+    Sparse vectors (the early walk vectors of cq_basic) are multiplied serially by SciPy while they have few
+    non-zeros, and densified otherwise, the result is then returned as a sparse column again.
+    """
+
+    def __init__(self, M, Offsets=None, Threads=None, SparseFraction=0.05):
+        """
+        :param M: a sparse matrix
+        :param Offsets: the domain block boundaries (see Precomputation.cumulative_ns), None partitions by rows only
+        :param Threads: the number of threads (None uses every core)
+        :param SparseFraction: sparse vectors with fewer non-zeros than this fraction of rows are multiplied serially
+        """
+
+        self.M = sparse.csr_matrix(M)
+        self.M.sum_duplicates()
+        self.shape = self.M.shape
+        self.dtype = self.M.dtype
+        self.Threads = Threads if Threads is not None else multiprocessing.cpu_count()
+        self.SparseFraction = SparseFraction
+
+        indptr = self.M.indptr
+        self.Bounds = partition_rows(indptr, Offsets, self.Threads)
+        self.Pieces = []  # (first row, last row + 1, rebased row pointer, indices, data) of each piece
+        for (st, ed) in zip(self.Bounds[:-1], self.Bounds[1:]):
+            self.Pieces.append((st, ed, indptr[st:ed + 1] - indptr[st], self.M.indices[indptr[st]:indptr[ed]],
+                                self.M.data[indptr[st]:indptr[ed]]))
+
+        self.Pool = ThreadPool(self.Threads) if self.Threads > 1 else None
+
+    def max(self, axis=None):
+        return self.M.max(axis=axis)
+
+    def close(self):
+        """
+        Stop the threads
+        """
+
+        if self.Pool is not None:
+            self.Pool.close()
+            self.Pool.join()
+            self.Pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def dot(self, x, out=None):
+        """
+        The product M x
+
+        :param x: a dense vector, a dense n x b matrix or a sparse column
+        :param out: a preallocated C-contiguous output of the shape of M x (optional, dense x only)
+        :return: M x, dense for dense x and a sparse column (csc) for a sparse x
+        """
+
+        if sparse.issparse(x):
+            if x.nnz < self.SparseFraction * self.shape[1] or self.Pool is None:
+                return self.M.dot(x)
+            return sparse.csc_matrix(self.dot(x.toarray()))
+
+        x = np.asarray(x)
+        if np.result_type(self.dtype, x.dtype) != self.dtype:  # e.g., a float64 vector with a compact matrix
+            return self.M.dot(x)
+
+        x = np.ascontiguousarray(x, dtype=self.dtype)
+        if out is None:
+            out = np.empty((self.shape[0],) + x.shape[1:], dtype=x.dtype)
+
+        if self.Pool is None:
+            for Piece in self.Pieces:
+                self.multiply(Piece, x, out)
+        else:
+            self.Pool.map(lambda Piece: self.multiply(Piece, x, out), self.Pieces)
+
+        return out
+
+    def multiply(self, Piece, x, out):
+        """
+        Write one piece of M x into out
+        """
+
+        (st, ed, indptr, indices, data) = Piece
+        y = out[st:ed]
+        y.fill(0)  # the kernels accumulate into y
+
+        if x.ndim == 1:
+            _sparsetools.csr_matvec(ed - st, self.shape[1], indptr, indices, data, x, y)
+        else:
+            b = int(np.prod(x.shape[1:]))
+            _sparsetools.csr_matvecs(ed - st, self.shape[1], b, indptr, indices, data, x.ravel(), y.reshape(-1))
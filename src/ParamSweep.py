@@ -0,0 +1,304 @@
+import sys
+import json
+import time
+import getopt
+import itertools
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+from scipy import stats
+import LoadData
+import CR
+import Benchmark
+
+
+def grid_rays(Grid):
+    """
+    Group the grid points by ray
+
+    M = gamma Anorm + kappa Ynorm = gamma (Anorm + rho Ynorm) with rho = kappa / gamma = 2 alpha / c, so the grid
+    points with the same rho only differ in the scale gamma of the same matrix.
+
+    :param Grid: the (alpha, c) pairs
+    :return: the indices of the grid points on each ray
+    """
+
+    Rays = OrderedDict()
+    for (j, (alpha, c)) in enumerate(Grid):
+        Rays.setdefault(round(2.0 * alpha / c, 12), []).append(j)
+
+    return list(Rays.values())
+
+
+def cr_sweep(Anorm, Ynorm, E, Grid, MaxIter=1000, epsilon=1e-15, Ranges=None, Columns=16, Threads=None,
+             Offsets=None):
+    """
+    Cross Rank over a grid of (alpha, c) values
+
+    The ranking vector of a grid point is the Neumann series r = eta sum_t M^t e with M = gamma (Anorm + rho Ynorm)
+    (see grid_rays). On each ray, the vectors p_t = M_ref^t e of the grid point with the largest gamma are computed
+    once, with one sparse product per iteration for a block of up to Columns queries, and every grid point j of the
+    ray adds eta_j (gamma_j / gamma_ref)^t p_t to its scores. Only the rows of Ranges are accumulated (e.g., the
+    target domain of each query), and a grid point stops adding terms once the L1 norm of its term is at most
+    epsilon, which is read off the single L1 norm of p_t. The ranking vectors are the fixed point of the power
+    method of CR.cr_solve.
+
+    :param Anorm: the aggregated normalized adjacency matrix of domain-specific networks
+    :param Ynorm: the normalized matrix encoding the cross-domain mapping information
+    :param E: the query vectors as the columns of a dense n x b matrix
+    :param Grid: the (alpha, c) pairs
+    :param MaxIter: the maximal number of iterations
+    :param epsilon: a convergence parameter
+    :param Ranges: the (first row, last row + 1) of the scores kept for each query, None keeps all n rows
+    :param Columns: the number of queries solved together
+    :param Threads: the number of threads of the products with M (see ParallelSpMV, None multiplies serially)
+    :param Offsets: the domain block boundaries used to partition M among the threads (see
+                    Precomputation.cumulative_ns)
+
+    :returns Scores: the scores of each query, a len(Grid) x (last row - first row) array per query
+    :returns Iters: the number of terms of each grid point and query (len(Grid) x b)
+    """
+
+    [Dtype, epsilon] = CR.working_precision(Anorm, Ynorm, epsilon)
+    E = np.asarray(E, dtype=Dtype)
+    (n, b) = E.shape
+    m = len(Grid)
+
+    if Ranges is None:
+        Ranges = [(0, n)] * b
+
+    alpha = np.array([float(alpha) for (alpha, c) in Grid])
+    c = np.array([float(c) for (alpha, c) in Grid])
+    gamma = c / (1.0 + 2.0 * alpha)
+    kappa = 2.0 * alpha / (1.0 + 2.0 * alpha)
+    eta = (1.0 - c) / (1.0 + 2 * alpha)
+
+    Scores = [np.zeros((m, ed - st)) for (st, ed) in Ranges]
+    Iters = np.zeros((m, b), dtype=np.int64)
+
+    for Ray in grid_rays(Grid):
+
+        Ref = Ray[int(np.argmax(gamma[Ray]))]  # the slowest grid point of the ray, its powers never grow faster
+        M = CR.product_operator(sparse.csr_matrix(gamma[Ref] * Anorm + kappa[Ref] * Ynorm), Threads, Offsets)
+
+        for st in range(0, b, Columns):
+
+            Active = np.arange(st, min(st + Columns, b))  # the queries which still add terms
+            P = np.ascontiguousarray(E[:, Active])  # p_t of the active queries
+            Open = np.ones((len(Ray), len(Active)), dtype=bool)  # the grid points which still add terms
+            Iter = 0
+
+            while len(Active) > 0 and Iter < MaxIter:
+
+                Norms = np.abs(P).sum(axis=0, dtype=np.float64)
+                for (a, j) in enumerate(Ray):
+                    w = eta[j] * (gamma[j] / gamma[Ref]) ** Iter
+                    for (col, i) in enumerate(Active):
+                        if Open[a, col]:
+                            Scores[i][j] += w * P[Ranges[i][0]:Ranges[i][1], col]
+                            if w * Norms[col] <= epsilon:
+                                Open[a, col] = False
+                                Iters[j, i] = Iter + 1
+
+                Iter += 1
+
+                # drop the queries whose grid points have all converged
+                Keep = np.any(Open, axis=0)
+                if not np.all(Keep):
+                    P = np.ascontiguousarray(P[:, Keep])
+                    Open = Open[:, Keep]
+                    Active = Active[Keep]
+                if len(Active) > 0 and Iter < MaxIter:
+                    P = M.dot(P)
+
+            for (a, j) in enumerate(Ray):
+                Iters[j, Active[Open[a]]] = Iter
+
+        CR.close_operator(M)
+
+    return [Scores, Iters]
+
+
+def rank_stability(Scores, TopK, Reference=0):
+    """
+    Rank-stability metrics of the top k of one query across the grid
+
+    :param Scores: the scores of the target domain at each grid point (len(Grid) x n_d)
+    :param TopK: the local indices of the top k at each grid point
+    :param Reference: the index of the reference grid point
+    :return: the top-k overlap (|intersection| / k) and the Kendall tau-b (on the union of both top k, 0 if only one
+             of the two is all ties) of every grid point with the reference, and the top-k overlap of every pair of
+             grid points (len(Grid) x len(Grid))
+    """
+
+    m = len(TopK)
+    k = max(len(TopK[j]) for j in range(m))
+    Sets = [set(int(x) for x in TopK[j]) for j in range(m)]
+
+    Pairwise = np.ones((m, m))
+    for i in range(m):
+        for j in range(i + 1, m):
+            Pairwise[i, j] = Pairwise[j, i] = float(len(Sets[i] & Sets[j])) / k if k > 0 else 1.0
+
+    Taus = np.ones(m)
+    for j in range(m):
+        Union = np.array(sorted(Sets[Reference] | Sets[j]), dtype=np.int64)
+        if len(Union) < 2 or j == Reference:
+            continue
+        [x, y] = [Scores[Reference, Union], Scores[j, Union]]
+        if np.ptp(x) == 0 or np.ptp(y) == 0:  # all ties (e.g., an unreachable target), tau is undefined
+            Taus[j] = 1.0 if np.ptp(x) == np.ptp(y) else 0.0
+        else:
+            Taus[j] = stats.kendalltau(x, y)[0]
+
+    return [Pairwise[Reference], Taus, Pairwise]
+
+
+def param_sweep(dataset, PrecompFileName, Grid, Queries=None, NumQueries=10, k=10, MaxIter=1000, epsilon=1e-15,
+                Columns=16, Threads=None, Compare=False, seed=0):
+    """
+    Sweep CrossRank over a grid of (alpha, c) values for a query set
+
+    All grid points and queries are solved by cr_sweep, keeping the scores of the target domain of each query only,
+    and the top k of the target domain is selected at every grid point. CrossQuery-basic ranks the target domain by
+    the same scores (up to a constant factor), so the top k also hold for cq_basic.
+
+    :param dataset: the path of the dataset
+    :param PrecompFileName: the file name of precomputation results
+    :param Grid: the (alpha, c) pairs, the first one is the reference of the stability metrics
+    :param Queries: a list of (q, s, d), None draws NumQueries random queries (see Benchmark.query_workload)
+    :param NumQueries: the number of random queries
+    :param k: the number of retrieved nodes
+    :param MaxIter: the maximal number of iterations
+    :param epsilon: a convergence parameter
+    :param Columns: the number of queries solved together by cr_sweep
+    :param Threads: the number of threads of the sparse products (see ParallelSpMV, None multiplies serially)
+    :param Compare: also time independent CR.cr_block runs, one per grid point for blocks of Columns queries
+    :param seed: the random seed of the query workload
+    :return: a dictionary with the grid, the queries, the top k IDs (grid point x query), the iterations, the
+             runtime, the stability metrics (mean over queries) and, with Compare, the runtime of independent runs
+    """
+
+    NoN = LoadData.load_all(dataset, PrecompFileName)
+    Index = LoadData.load_node_index(dataset, PrecompFileName, NoN['Anorm'].shape[0])
+    A_ID = NoN['A_ID']
+    Offsets = Index.Offsets
+    Grid = [(float(alpha), float(c)) for (alpha, c) in Grid]
+    m = len(Grid)
+
+    if Queries is None:
+        Queries = Benchmark.query_workload(A_ID, NumQueries, seed)
+    b = len(Queries)
+
+    '''
+    Solve the grid
+    '''
+    TopK = [[None] * b for j in range(m)]
+    Overlap = np.zeros((m, b))
+    Tau = np.zeros((m, b))
+    Pairwise = np.zeros((m, m))
+
+    start = time.time()
+    E = np.hstack([Index.query_vector(q, s).toarray() for (q, s, d) in Queries])
+    Ranges = [(Offsets[d], Offsets[d + 1]) for (q, s, d) in Queries]
+
+    [Scores, Iterations] = cr_sweep(NoN['Anorm'], NoN['Ynorm'], E, Grid, MaxIter, epsilon, Ranges, Columns, Threads,
+                                    Offsets)
+
+    for (i, (q, s, d)) in enumerate(Queries):
+        Local = [CR.top_k(Scores[i][j], k) for j in range(m)]  # grid point x target node
+        for j in range(m):
+            TopK[j][i] = [int(ID) for ID in A_ID[0, d][Local[j], 0]]
+        [Overlap[:, i], Tau[:, i], Pairs] = rank_stability(Scores[i], Local)
+        Pairwise += Pairs / b
+    Runtime = time.time() - start
+
+    Result = {'grid': [list(point) for point in Grid],
+              'queries': [list(query) for query in Queries],
+              'k': k,
+              'topk': TopK,
+              'iterations': Iterations.tolist(),
+              'runtime': Runtime,
+              'stability': {'overlap': Overlap.mean(axis=1).tolist(),
+                            'kendall_tau': Tau.mean(axis=1).tolist(),
+                            'pairwise_overlap': Pairwise.tolist()}}
+
+    '''
+    Independent runs, one grid point at a time
+    '''
+    if Compare:
+        start = time.time()
+        for (alpha, c) in Grid:
+            for st in range(0, b, Columns):
+                CR.cr_block(NoN['Anorm'], NoN['Ynorm'], E[:, st:st + Columns], alpha, c, MaxIter, epsilon, Threads,
+                            Offsets)
+        Result['independent_runtime'] = time.time() - start
+        Result['speedup'] = Result['independent_runtime'] / Runtime
+
+    return Result
+
+
+if __name__ == '__main__':
+
+    dataset = "../data/DBLP_NoN.npy"
+    precomp = "Precomp_Values_DBLP.npy"
+    alphas = [0.1, 0.2, 0.3]
+    cs = [0.8, 0.85, 0.9]
+    grid = None
+    queries = None
+    num_queries = 10
+    k = 10
+    threads = None
+    compare = False
+    out = None
+
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["dataset=", "precomp=", "alphas=", "cs=", "grid=", "queries=",
+                                                   "num_queries=", "k=", "threads=", "compare", "out="])
+    for option, value in opts:
+        if option == "-h":
+            print("python ParamSweep.py [--dataset ../data/DBLP_NoN.npy] [--precomp Precomp_Values_DBLP.npy] "
+                  "[--alphas 0.1,0.2,0.3 --cs 0.8,0.85,0.9 | --grid 0.2,0.85;0.1,0.9] [--queries 121:0:19,...] "
+                  "[--num_queries 10] [--k 10] "
+                  "[--threads 4] [--compare] [--out ParamSweep.json]")
+            exit(0)
+        if option == "--dataset":
+            dataset = value
+        if option == "--precomp":
+            precomp = value
+        if option == "--alphas":
+            alphas = [float(x) for x in value.split(',')]
+        if option == "--cs":
+            cs = [float(x) for x in value.split(',')]
+        if option == "--grid":
+            grid = [tuple(float(x) for x in pair.split(',')) for pair in value.split(';')]
+        if option == "--queries":
+            queries = [tuple(int(x) for x in query.split(':')) for query in value.split(',')]
+        if option == "--num_queries":
+            num_queries = int(value)
+        if option == "--k":
+            k = int(value)
+        if option == "--threads":
+            threads = int(value)
+        if option == "--compare":
+            compare = True
+        if option == "--out":
+            out = value
+
+    if grid is None:
+        grid = list(itertools.product(alphas, cs))
+
+    Result = param_sweep(dataset, precomp, grid, queries, num_queries, k, Threads=threads, Compare=compare)
+
+    print("%-8s %-8s %10s %12s %10s" % ('alpha', 'c', 'overlap', 'kendall_tau', 'iters'))
+    for (j, (alpha, c)) in enumerate(Result['grid']):
+        print("%-8.3f %-8.3f %10.3f %12.3f %10.1f" % (alpha, c, Result['stability']['overlap'][j],
+                                                     Result['stability']['kendall_tau'][j],
+                                                     np.mean(Result['iterations'][j])))
+    print("The sweep took " + str(Result['runtime']) + " seconds.")
+    if compare:
+        print("Independent runs took " + str(Result['independent_runtime']) + " seconds (speedup " +
+              str(Result['speedup']) + ").")
+
+    if out is not None:
+        with open(out, 'w') as f:
+            json.dump(Result, f, indent=2)
@@ -1,14 +1,134 @@
+import os
+import json
+import multiprocessing
 import numpy as np
 from scipy import sparse
+import ExtractSubNet
+import NodeIndex
 
 
-def precomputation(A, A_ID, G, PrecompFileName):
+def precomputation(A, A_ID, G, PrecompFileName, Format="npy", Processes=None, Compact=False, AuthorDict=None,
+                   ConfDict=None):
     """
     CR and CQ precomputation
     :param A: the domain-specific networks
     :param A_ID: the corresponding IDs of domain-specific networks in A
     :param G: the adjacency matrix of the main network
-    :param PrecompFileName: the file name to store precomputation results
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) to store precomputation results
+    :param Format: npy stores a pickled dictionary, mmap stores raw sparse arrays which are loaded with mmap
+    :param Processes: the number of worker processes normalizing domain-specific networks
+    :param Compact: store the compact mode (float32 values, int32 indices, see compact_precomputation)
+    :param AuthorDict: the names of authors, kept in the node index for name lookups (optional)
+    :param ConfDict: the names of conferences, kept in the node index for name lookups (optional)
+    """
+
+    data = build_precomputation(A, A_ID, G, Processes)
+    if Compact:
+        data = compact_precomputation(data)
+    save_precomputation(data, PrecompFileName, Format)
+
+    # the node-position index (ID -> rows, name -> ID) is stored next to the precomputed matrices
+    if Format == "mmap" or PrecompFileName.endswith('.npy'):
+        IndexFileName = NodeIndex.index_file_name(PrecompFileName)
+    else:  # np.save appends the extension
+        IndexFileName = NodeIndex.index_file_name(PrecompFileName + '.npy')
+    NodeIndex.NodeIndex.build(A_ID, AuthorDict, ConfDict).save(IndexFileName)
+
+
+def save_precomputation(data, PrecompFileName, Format="npy"):
+    """
+    Store precomputed matrices
+    :param data: the dictionary of precomputed matrices
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) to store precomputation results
+    :param Format: npy stores a pickled dictionary, mmap stores raw sparse arrays which are loaded with mmap
+    """
+
+    if Format == "mmap":
+        save_precomputation_mmap(data, PrecompFileName)
+    else:
+        np.save(PrecompFileName, data)
+
+
+def normalize_domain(A_i):
+    """
+    Normalize a domain-specific network: D^(-0.5) dot A_i dot D^(-0.5), where D is the degree matrix of A_i
+    :param A_i: the adjacency matrix of the domain-specific network
+    :return: the normalized adjacency matrix
+    """
+
+    D = A_i.sum(axis=1)  # sum matrix A_i over axis=1 (now D is the type of numpy.matrix)
+    D = D.getA()  # convert D to the type of numpy.ndarray
+    D = D ** (-0.5)  # performs element-wise power
+    D = D.ravel()  # get a flattened array
+    D = sparse.diags(D)  # construct a diagonal matrix which is sparse
+
+    return D.dot(A_i).dot(D)
+
+
+def common_nodes(ID_i, ID_j):
+    """
+    Map the common nodes of two domain-specific networks
+    :param ID_i: the IDs of domain nodes in the first domain-specific network
+    :param ID_j: the IDs of domain nodes in the second domain-specific network
+    :return: the indices of common nodes in ID_i and the corresponding indices in ID_j
+    """
+
+    [proj, I1, I2] = np.intersect1d(np.ravel(ID_i), np.ravel(ID_j), assume_unique=True, return_indices=True)
+
+    return [I1, I2]
+
+
+def cumulative_ns(A_ID):
+    """
+    :param A_ID: the corresponding IDs of domain-specific networks in A
+    :return: the first row of each domain block in Anorm, Ynorm and Y followed by the total number of domain nodes n
+    """
+
+    ns = np.array([A_ID[0, i].shape[0] for i in range(A_ID.shape[1])], dtype=np.int64)
+
+    return np.hstack(([0], np.cumsum(ns)))
+
+
+def common_node_pairs(A_ID):
+    """
+    Map the common nodes of all domain-specific networks at once with an inverted index
+
+    The occurrences of all IDs are sorted by ID, so the occurrences of one main node ID form a group, and every
+    ordered pair of occurrences in a group (including an occurrence with itself) is a nonzero entry of O. The work
+    grows with the number of such pairs instead of with the number of domain pairs.
+
+    :param A_ID: the IDs of domain nodes in each domain-specific network
+    :return: the row and column indices of the common-node pairs in the aggregated matrices
+    """
+
+    IDs = np.hstack([np.ravel(A_ID[0, i]) for i in range(A_ID.shape[1])])
+
+    # the inverted index: occurrences sorted by ID, grouped by equal IDs
+    Order = np.argsort(IDs, kind='mergesort')
+    Sorted = IDs[Order]
+    GroupStart = np.flatnonzero(np.hstack(([True], Sorted[1:] != Sorted[:-1]))) if len(Sorted) > 0 \
+        else np.array([], dtype=np.int64)
+    GroupSize = np.diff(np.hstack((GroupStart, [len(Sorted)])))
+
+    # every occurrence is paired with every occurrence in its group
+    Size = np.repeat(GroupSize, GroupSize)  # the group size of each occurrence
+    Start = np.repeat(GroupStart, GroupSize)  # the group start of each occurrence
+    First = np.repeat(np.arange(len(Sorted)), Size)
+    PairStart = np.repeat(np.cumsum(Size) - Size, Size)  # the first pair of each occurrence
+    Second = np.arange(len(First)) - PairStart + np.repeat(Start, Size)
+
+    return [Order[First].astype(np.int64), Order[Second].astype(np.int64)]
+
+
+def build_precomputation(A, A_ID, G, Processes=None):
+    """
+    Compute the precomputed matrices of CR and CQ in memory
+    :param A: the domain-specific networks
+    :param A_ID: the corresponding IDs of domain-specific networks in A
+    :param G: the adjacency matrix of the main network
+    :param Processes: the number of worker processes normalizing domain-specific networks (None runs them in this
+                      process)
+    :return: a dictionary with Anorm, Ynorm, Y, I_n and DisG
     """
 
     '''
@@ -27,15 +147,16 @@ def precomputation(A, A_ID, G, PrecompFileName):
     '''
     Anorms = np.zeros(A.shape, dtype=object)  # create a block matrix (cell matrix in MatLab) with A's shape
 
-    for i in range(g):
-
-        D = A[0, i].sum(axis=1)  # sum matrix A[0, i] over axis=1 (now D is the type of numpy.matrix)
-        D = D.getA()  # convert D to the type of numpy.ndarray
-        D = D ** (-0.5)  # performs element-wise power
-        D = D.ravel()  # get a flattened array
-        D = sparse.diags(D)  # construct a diagonal matrix which is sparse
-
-        Anorms[0, i] = (D.dot(A[0, i]).dot(D))
+    if Processes is not None and Processes > 1:
+        Pool = multiprocessing.Pool(Processes)
+        try:
+            Anorms[0, :] = Pool.map(normalize_domain, list(A[0, :]))
+        finally:
+            Pool.close()
+            Pool.join()
+    else:
+        for i in range(g):
+            Anorms[0, i] = normalize_domain(A[0, i])
 
     # create a block diagonal matrix from provided matrice
     Anorm = sparse.block_diag(Anorms[0, :])
@@ -43,51 +164,22 @@ def precomputation(A, A_ID, G, PrecompFileName):
     '''
     Common node mapping (get the block matrix O)
     '''
-    Dy = np.zeros((g, 1), dtype=object)  # degree matrix of Y
-    dG = G.sum(axis=1)  # degree of main nodes
-
-    # compute cumulative ns to reduce redundant computation
-    cumulative_ns = np.cumsum(ns[0, :])
-    cumulative_ns = np.hstack(([0], cumulative_ns))
-
-    # initialize row, col, data for constructing coo_matrix (A[row[k], col[k]] = data[k])
-    row = np.array([], dtype=np.int64)
-    col = np.array([], dtype=np.int64)
-    data = np.array([], dtype=np.float64)
-
-    for i in range(g):
-
-        Dy[i, 0] = dG[i, 0] * sparse.eye(ns[0, i], dtype=np.float64)
+    dG = G.sum(axis=1).getA().ravel()  # degree of main nodes
 
-        for j in range(i, g):
+    [row, col] = common_node_pairs(A_ID)
 
-            proj = np.intersect1d(A_ID[0, i], A_ID[0, j])  # common elements of A_ID[0, i] and A_ID[0, j]
-            I1 = np.in1d(A_ID[0, i], proj).nonzero()[0]  # indices of common elements in A_ID[0, i]
-            I2 = np.in1d(A_ID[0, j], proj).nonzero()[0]  # indices of common elements in A_ID[0, j]
-            Oij = sparse.coo_matrix((np.ones(len(proj), dtype=np.float64), (I1, I2)), shape=(ns[0, i], ns[0, j]))
-
-            O_ij_block = Oij.multiply(G[i, j])  # (i, j)th block of O
-            O_ij_block.eliminate_zeros()  # in-place operation!!!
-            O_ij_block = O_ij_block.tocoo()
-
-            row = np.hstack((row, O_ij_block.row + cumulative_ns[i]))
-            col = np.hstack((col, O_ij_block.col + cumulative_ns[j]))
-            data = np.hstack((data, O_ij_block.data))
-
-    O = sparse.coo_matrix((data, (row, col)), shape=(n, n))
-
-    O = sparse.triu(O) + sparse.triu(O).transpose() - sparse.diags(O.diagonal())
+    # O[row, col] = G[i, j] where i and j are the domains of the two occurrences, blocks with G[i, j] = 0 vanish
+    Domain = np.repeat(np.arange(g), ns[0, :])  # the domain of each domain node
+    data = np.asarray(sparse.csr_matrix(G)[Domain[row], Domain[col]], dtype=np.float64).ravel()
+    Mask = data != 0
+    O = sparse.coo_matrix((data[Mask], (row[Mask], col[Mask])), shape=(n, n)).tocsr()
 
     '''
     Construct normalized Y
     '''
-    Dy = sparse.block_diag(Dy[:, 0])
-    Dy = Dy.tocsc()
+    Dy = sparse.diags(np.repeat(dG, ns[0, :])).tocsc()  # degree matrix of Y
     Do = sparse.diags(O.sum(axis=1).getA().ravel())
     Do = Do.tocsc()
-    # print Dy[0, 0]
-    # print Do[0, 0]
-    # print Dy[0, 0] - Do[0, 0]
     Dt = Dy - Do  # have precision problem, cause small entries in sparse matrix
     Y = O + Dt
     Dyn = Dy.power(-0.5)
@@ -95,18 +187,168 @@ def precomputation(A, A_ID, G, PrecompFileName):
 
     # eliminate small entries caused by precision problem (optional)
     # number of nonzero entries (nnz): 3463488 -> 3332249
-    Ynorm_data = Ynorm.data
-    vfunc = np.vectorize(lambda elem: elem if elem >= 1e-15 else 0.0)
-    Ynorm_data = vfunc(Ynorm_data)
-    Ynorm = sparse.csc_matrix((Ynorm_data, Ynorm.indices, Ynorm.indptr), shape=Ynorm.shape)
+    Ynorm = sparse.csc_matrix(Ynorm)
+    Ynorm.data[Ynorm.data < 1e-15] = 0.0
     Ynorm.eliminate_zeros()
 
     '''
-    Save precomputed matrices
+    Collect precomputed matrices
     '''
     data = {}
     data['Anorm'] = Anorm
     data['Ynorm'] = Ynorm
     data['Y'] = Y
     data['I_n'] = I_n
-    np.save(PrecompFileName, data)
+    data['DisG'] = ExtractSubNet.distance_graph(G)  # the distance graph of the main network used by CQ_Fast
+
+    return data
+
+
+def compact_matrix(M, Format, Dtype=np.float32):
+    """
+    Convert a sparse matrix to the compact mode
+
+    :param M: a sparse matrix
+    :param Format: the sparse format of the result, csr or csc
+    :param Dtype: the dtype of the values
+    :return: M in the given format with values of Dtype and int32 indices (int64 if they do not fit)
+    """
+
+    M = M.asformat(Format).astype(Dtype)
+    M.sum_duplicates()
+
+    if max(M.nnz, max(M.shape)) < np.iinfo(np.int32).max:
+        M.indptr = M.indptr.astype(np.int32, copy=False)
+        M.indices = M.indices.astype(np.int32, copy=False)
+
+    return M
+
+
+def compact_precomputation(data, Dtype=np.float32):
+    """
+    Convert precomputed matrices to the compact mode
+
+    SpMV with Anorm and Ynorm is memory-bandwidth bound, so float32 values and int32 indices halve the bytes read per
+    iteration of CQ_Basic and CR. The distances of DisG keep float64 values (only their indices are compacted), so
+    ExtractSubNet extracts the same sub-networks in both modes. Use ValidateCompact to check the top-k agreement
+    with the float64 path on a dataset.
+
+    :param data: the dictionary of precomputed matrices
+    :param Dtype: the dtype of the values of Anorm, Ynorm, Y and I_n
+    :return: a dictionary with the compact Anorm (csr), Ynorm (csc), Y (csr), DisG (csr) and I_n
+    """
+
+    Compact = {}
+    Compact['Anorm'] = compact_matrix(data['Anorm'], 'csr', Dtype)
+    Compact['Ynorm'] = compact_matrix(data['Ynorm'], 'csc', Dtype)
+    Compact['Y'] = compact_matrix(data['Y'], 'csr', Dtype)
+    Compact['I_n'] = sparse.eye(data['Anorm'].shape[0], dtype=Dtype)
+    if 'DisG' in data:
+        Compact['DisG'] = compact_matrix(data['DisG'], 'csr', np.float64)
+
+    return Compact
+
+
+# the precomputed sparse matrices kept by the mmap format and their storage formats
+MmapMatrices = [('Anorm', 'csr'), ('Ynorm', 'csc'), ('Y', 'csr'), ('DisG', 'csr')]
+
+
+def save_precomputation_mmap(data, PrecompDir):
+    """
+    Store precomputed matrices in the mmap format
+
+    The indptr/indices/data arrays of each sparse matrix are written as raw files into PrecompDir, together with a
+    small manifest.json describing their dtypes, lengths and the matrix shapes. No pickling is involved.
+
+    :param data: the dictionary of precomputed matrices
+    :param PrecompDir: the directory to store precomputation results
+    """
+
+    if not os.path.isdir(PrecompDir):
+        os.makedirs(PrecompDir)
+
+    manifest = {'version': 1, 'n': int(data['Anorm'].shape[0]), 'matrices': {}}
+
+    for (name, fmt) in MmapMatrices:
+
+        if name not in data:  # e.g., files precomputed before DisG was added
+            continue
+
+        M = data[name].asformat(fmt)
+        M.sum_duplicates()  # canonical format, so that read-only arrays never need to be sorted in place
+
+        # scipy downcasts int64 indices which fit in int32 on construction, store them as int32 to avoid the copy
+        if max(M.nnz, max(M.shape)) < np.iinfo(np.int32).max:
+            IdxDtype = np.int32
+        else:
+            IdxDtype = np.int64
+
+        arrays = {}
+        for (field, array) in [('indptr', M.indptr.astype(IdxDtype)), ('indices', M.indices.astype(IdxDtype)),
+                               ('data', M.data)]:
+            FileName = name + '.' + field
+            array.tofile(os.path.join(PrecompDir, FileName))
+            arrays[field] = {'file': FileName, 'dtype': array.dtype.str, 'length': int(len(array))}
+
+        manifest['matrices'][name] = {'format': fmt, 'shape': [int(M.shape[0]), int(M.shape[1])], 'arrays': arrays}
+
+    # write the manifest last, a directory without it is an incomplete precomputation
+    with open(os.path.join(PrecompDir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_precomputation_mmap(PrecompDir, mode='r'):
+    """
+    Load precomputed matrices stored in the mmap format
+
+    The raw arrays are memory-mapped and the scipy matrices are built on top of them without copying, so loading
+    takes milliseconds and processes loading the same directory share the page cache.
+
+    :param PrecompDir: the directory of precomputation results
+    :param mode: the numpy.memmap mode, r (read-only) or c (copy-on-write)
+    :return: a dictionary with Anorm, Ynorm, Y, DisG and I_n
+    """
+
+    with open(os.path.join(PrecompDir, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    data = {}
+
+    for name in manifest['matrices']:
+
+        entry = manifest['matrices'][name]
+
+        arrays = {}
+        for field in entry['arrays']:
+            spec = entry['arrays'][field]
+            if spec['length'] == 0:  # empty files cannot be memory-mapped
+                arrays[field] = np.zeros(0, dtype=np.dtype(spec['dtype']))
+            else:
+                arrays[field] = np.memmap(os.path.join(PrecompDir, spec['file']), dtype=np.dtype(spec['dtype']),
+                                          mode=mode, shape=(spec['length'],))
+
+        if entry['format'] == 'csr':
+            M = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(entry['shape']),
+                                  copy=False)
+        else:
+            M = sparse.csc_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(entry['shape']),
+                                  copy=False)
+        M.has_canonical_format = True  # stored canonical, never sort the (read-only) arrays in place
+
+        data[name] = M
+
+    data['I_n'] = sparse.eye(manifest['n'], dtype=data['Anorm'].dtype)
+
+    return data
+
+
+def convert_precomputation(PrecompFileName, PrecompDir):
+    """
+    Convert precomputation results from the npy format to the mmap format
+
+    :param PrecompFileName: the file name of precomputation results in the npy format
+    :param PrecompDir: the directory to store precomputation results in the mmap format
+    """
+
+    data = np.load(PrecompFileName, allow_pickle=True).item()
+    save_precomputation_mmap(data, PrecompDir)
@@ -0,0 +1,52 @@
+import json
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:  # Python 2
+    from urllib2 import Request, urlopen, HTTPError
+
+
+class QueryClient(object):
+    """
+    Python client of the resident query service (see QueryServer.py)
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, timeout=60):
+        self.url = "http://" + host + ":" + str(port)
+        self.timeout = timeout
+
+    def request(self, path, params=None):
+        if params is None:
+            req = Request(self.url + path)
+        else:
+            req = Request(self.url + path, json.dumps(params).encode('utf-8'), {'Content-Type': 'application/json'})
+        try:
+            response = urlopen(req, timeout=self.timeout)
+        except HTTPError as error:
+            raise ValueError(json.loads(error.read().decode('utf-8'))['error'])
+        return json.loads(response.read().decode('utf-8'))
+
+    def status(self):
+        return self.request('/status')
+
+    def cq_basic(self, q, s, d, k=10, alpha=0.2, c=0.85):
+        """
+        :return: a dictionary with the IDs (results) and names of top k authors and the server-side latency
+        """
+        return self.request('/cq_basic', {'q': q, 's': s, 'd': d, 'k': k, 'alpha': alpha, 'c': c})
+
+    def cq_fast(self, q, s, d, k=10, alpha=0.2, c=0.85, epsilon=0.003):
+        """
+        :return: a dictionary with the IDs (results) and names of top k authors, the relevant domains and the
+                 server-side latency
+        """
+        return self.request('/cq_fast', {'q': q, 's': s, 'd': d, 'k': k, 'alpha': alpha, 'c': c, 'epsilon': epsilon})
+
+    def cr(self, q, s, d, k=10, alpha=0.2, c=0.85, max_iter=1000, epsilon=1e-15, solver='power'):
+        """
+        :return: a dictionary with the IDs (results) and names of top k authors, the solver report (iterations,
+                 residual, runtime) and the server-side latency
+        """
+        return self.request('/cr', {'q': q, 's': s, 'd': d, 'k': k, 'alpha': alpha, 'c': c,
+                                    'max_iter': max_iter, 'epsilon': epsilon, 'solver': solver})
@@ -0,0 +1,395 @@
+import os
+import sys
+import json
+import time
+import getopt
+import threading
+import LoadData
+import CQ_Basic
+import CQ_Fast
+import CR
+import SubNoNCache
+import ResultCache
+import NodeIndex
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class NoNQueryService(object):
+    """
+    Resident query service
+
+    Loads an NoN dataset and its precomputed matrices once, keeps G, its distance graph, A_ID, Anorm, Ynorm and Y in
+    memory, prebuilds the transition matrix W for each (alpha, c) pair, and answers cq_basic, cq_fast and cr queries
+    against them. Query results are kept in a ResultCache bound to the fingerprint of the dataset and precomputation
+    files; cr results are computed for at least ResultPrefix nodes, so that later requests with a smaller k are
+    answered from the cached ranked prefix. The fingerprint is checked again at most every FingerprintInterval
+    seconds, and once the files change (e.g., an incremental update overwrote them) the cached results are dropped
+    and no more results are cached, since the resident matrices no longer match the files (restart the service to
+    load them).
+    """
+
+    def __init__(self, dataset="../data/DBLP_NoN.npy", PrecompFileName='Precomp_Values_DBLP.npy',
+                 Params=((0.2, 0.85),), CacheBytes=512 * 1024 * 1024, ResultBytes=64 * 1024 * 1024, ResultTTL=None,
+                 ResultPrefix=50, ResultCacheFile=None, FingerprintInterval=10.0):
+        """
+        :param dataset: the path for the dataset
+        :param PrecompFileName: the file name of precomputation results
+        :param Params: the (alpha, c) pairs whose transition matrices are prebuilt
+        :param CacheBytes: the memory budget of the cache of sub-NoNs extracted by cq_fast
+        :param ResultBytes: the memory budget of the cache of query results (0 disables it)
+        :param ResultTTL: the time to live of a cached query result in seconds (None never expires)
+        :param ResultPrefix: the smallest number of ranked results computed and cached by cr (except the topk solver,
+                             whose cost grows with k)
+        :param ResultCacheFile: load the result cache from this file on start and store it there on shutdown
+                                (optional)
+        :param FingerprintInterval: the shortest time in seconds between two checks of the fingerprint of the files
+        """
+
+        start = time.time()
+        NoN = LoadData.load_all(dataset, PrecompFileName)
+        self.G = NoN['G']
+        self.A_ID = NoN['A_ID']
+        self.AuthorDict = NoN['AuthorDict']
+        self.ConfDict = NoN['ConfDict']
+        self.Anorm = NoN['Anorm']
+        self.Ynorm = NoN['Ynorm']
+        self.Y = NoN['Y']
+        self.I_n = NoN['I_n']
+        self.DisG = NoN['DisG']
+        # ID -> rows and name -> ID lookups
+        self.Index = LoadData.load_node_index(dataset, PrecompFileName, self.Anorm.shape[0])
+
+        self.Offsets = self.Index.Offsets  # the first row of each domain
+
+        self.SubNoNs = SubNoNCache.SubNoNCache(CacheBytes)
+
+        self.Files = (dataset, PrecompFileName, NodeIndex.index_file_name(PrecompFileName))
+        self.Fingerprint = ResultCache.dataset_fingerprint(*self.Files)
+        self.FingerprintInterval = FingerprintInterval
+        self.FingerprintTime = time.time()  # the time of the last check of the fingerprint
+        self.Stale = False  # the files changed since they were loaded
+        self.Results = ResultCache.ResultCache(ResultBytes, ResultTTL, self.Fingerprint)
+        self.ResultPrefix = ResultPrefix
+        self.ResultCacheFile = ResultCacheFile
+        if ResultCacheFile is not None and os.path.isfile(ResultCacheFile):
+            self.Results.load(ResultCacheFile)
+
+        self.Transitions = {}  # (alpha, c) -> (W, tilde_c)
+        self.Lock = threading.Lock()
+        for (alpha, c) in Params:
+            self.transition(alpha, c)
+
+        self.LoadTime = time.time() - start
+
+    def transition(self, alpha, c):
+        """
+        Get the transition matrix W and the normalized parameter tilde_c for (alpha, c), building them on first use
+        """
+
+        key = (float(alpha), float(c))
+        with self.Lock:
+            if key not in self.Transitions:
+                tilde_c = (c + 2.0 * alpha) / (1.0 + 2.0 * alpha)
+                W = (c / (c + 2.0 * alpha)) * self.Anorm + ((2.0 * alpha) / (c + 2.0 * alpha)) * self.Ynorm
+                self.Transitions[key] = (W.tocsr(), tilde_c)
+            return self.Transitions[key]
+
+    def query_vector(self, q, s):
+        """
+        Build the query vector of node q in the source domain-specific network s
+        """
+
+        return self.Index.query_vector(q, s)
+
+    def author_names(self, TopKResults):
+        """
+        Map the IDs of authors to their names
+        """
+
+        return self.Index.author_names(TopKResults)
+
+    def cq_basic(self, q, s, d, k=10, alpha=0.2, c=0.85):
+        """
+        CrossQuery-Basic on the resident NoN
+        """
+
+        [W, tilde_c] = self.transition(alpha, c)
+        TopKResults = CQ_Basic.cq_basic(W, q, s, d, k, tilde_c, self.A_ID, Index=self.Index)
+
+        return {'results': [int(ID) for ID in TopKResults]}
+
+    def cq_fast(self, q, s, d, k=10, alpha=0.2, c=0.85, epsilon=0.003):
+        """
+        CrossQuery-Fast on the resident NoN
+        """
+
+        [TopKResults, SubG_Idx] = CQ_Fast.cq_fast(self.Anorm, self.Y, self.G, q, s, d, k, alpha, c, epsilon, self.A_ID,
+                                                  self.DisG, self.SubNoNs)
+
+        return {'results': [int(ID) for ID in TopKResults], 'domains': [int(i) for i in SubG_Idx]}
+
+    def cr(self, q, s, d, k=10, alpha=0.2, c=0.85, max_iter=1000, epsilon=1e-15, solver='power'):
+        """
+        CrossRank on the resident NoN
+        """
+
+        e = self.query_vector(q, s)
+        if solver == 'topk':
+            [TopK, Scores, Info] = CR.cr_topk(self.Anorm, self.Ynorm, e, alpha, c, self.Offsets[d],
+                                              self.Offsets[d + 1], k, max_iter, epsilon)
+        else:
+            [r, Info] = CR.cr_solve(self.Anorm, self.Ynorm, e, alpha, c, max_iter, epsilon, solver)
+            TopK = CR.top_k(r[self.Offsets[d]:self.Offsets[d + 1]], k)  # the top k of the target domain
+        TopKResults = self.A_ID[0, d][TopK, 0]
+
+        return {'results': [int(ID) for ID in TopKResults], 'solver': Info}
+
+    def check_solvers(self, q, s, d, k=10, alpha=0.2, c=0.85, MaxIters=(1000, 3)):
+        """
+        Check that the responses of every CR solver can be sent as JSON, for runs which converge and for runs cut by
+        the iteration cap (an uncertified top k)
+
+        :param MaxIters: the maximal numbers of iterations to check
+        :return: the solvers checked
+        """
+
+        Checked = []
+        for solver in CR.Solvers + ['topk']:
+            for max_iter in MaxIters:
+                response = self.cr(q, s, d, k, alpha, c, max_iter, 1e-15, solver)
+                try:
+                    json.dumps(response)
+                except TypeError as error:
+                    raise ValueError("The response of the " + solver + " solver is not JSON serializable: " +
+                                     str(error))
+            Checked.append(solver)
+
+        return Checked
+
+    def query(self, algorithm, params):
+        """
+        Answer one query and report its latency
+
+        :param algorithm: cq_basic, cq_fast or cr
+        :param params: the keyword arguments of the algorithm (q, s, d, k, alpha, c, epsilon, max_iter), the query
+                       node and the domains can also be given by name (query_name, source_name, target_name)
+        :return: a dictionary with the IDs and names of the top k authors and the latency in seconds
+        """
+
+        if algorithm not in ('cq_basic', 'cq_fast', 'cr'):
+            raise ValueError("Invalid algorithm: " + str(algorithm))
+
+        start = time.time()
+        params = self.query_params(algorithm, self.resolve_names(params))
+        key = ResultCache.result_key(algorithm, params)
+        k = int(params['k'])
+
+        Cached = self.check_fingerprint()
+        response = self.Results.get(key, k) if Cached else None
+        if response is None:
+            # ranked results are computed for a longer prefix, which answers later requests with a smaller k
+            Ranked = algorithm == 'cr'
+            K = max(k, self.ResultPrefix) if Ranked and params['solver'] != 'topk' and Cached else k
+            params['k'] = K
+            response = getattr(self, algorithm)(**params)
+            if Cached:
+                self.Results.put(key, K, response, Ranked)
+            response = ResultCache.cut_response(response, k)
+            response['cached'] = False
+        else:
+            response['cached'] = True
+
+        response['latency'] = time.time() - start
+        response['algorithm'] = algorithm
+        response['names'] = self.author_names(response['results'])
+
+        return response
+
+    def resolve_names(self, params):
+        """
+        :return: a copy of the query parameters with query_name, source_name and target_name replaced by q, s and d
+        """
+
+        params = dict(params)
+        if 'query_name' in params:
+            params['q'] = self.Index.author_id(params.pop('query_name'))
+        if 'source_name' in params:
+            params['s'] = self.Index.domain_id(params.pop('source_name'))
+        if 'target_name' in params:
+            params['d'] = self.Index.domain_id(params.pop('target_name'))
+
+        return params
+
+    def query_params(self, algorithm, params):
+        """
+        :return: the keyword arguments of the algorithm with the defaults of the omitted ones filled in, so that
+                 equal queries get equal cache keys
+        """
+
+        Method = getattr(self, algorithm)
+        Names = Method.__code__.co_varnames[1:Method.__code__.co_argcount]
+        Defaults = dict(zip(Names[len(Names) - len(Method.__defaults__):], Method.__defaults__))
+        Defaults.update(params)
+
+        return Defaults
+
+    def check_fingerprint(self):
+        """
+        Compare the fingerprint of the files with the one they had when they were loaded, at most every
+        FingerprintInterval seconds, and drop the cached results once they differ
+
+        :return: True if results may be cached, False once the files changed
+        """
+
+        with self.Lock:
+            if self.Stale or time.time() - self.FingerprintTime < self.FingerprintInterval:
+                return not self.Stale
+            self.FingerprintTime = time.time()
+
+        Fingerprint = ResultCache.dataset_fingerprint(*self.Files)
+        if Fingerprint != self.Fingerprint:
+            self.Stale = True
+            self.Results.validate(Fingerprint)
+
+        return not self.Stale
+
+    def save_results(self):
+        """
+        Store the result cache into ResultCacheFile, if any and the files did not change
+        """
+
+        if self.ResultCacheFile is not None and self.check_fingerprint():
+            self.Results.save(self.ResultCacheFile)
+
+    def status(self):
+        """
+        Describe the resident NoN
+        """
+
+        return {'domains': int(self.A_ID.shape[1]),
+                'nodes': int(self.Offsets[-1]),
+                'transitions': [list(key) for key in sorted(self.Transitions.keys())],
+                'load_time': self.LoadTime,
+                'stale': not self.check_fingerprint(),
+                'sub_non_cache': self.SubNoNs.stats(),
+                'result_cache': self.Results.stats()}
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API of the query service
+
+    GET /status returns the description of the resident NoN, POST /cq_basic, /cq_fast or /cr with a JSON object of
+    query parameters returns the query response as a JSON object.
+    """
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/status':
+            self.reply(200, self.server.service.status())
+        else:
+            self.reply(404, {'error': 'Unknown path: ' + self.path})
+
+    def do_POST(self):
+        algorithm = self.path.strip('/')
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length).decode('utf-8')) if length > 0 else {}
+            self.reply(200, self.server.service.query(algorithm, params))
+        except (ValueError, TypeError, KeyError, IndexError) as error:
+            self.reply(400, {'error': str(error)})
+
+    def reply(self, code, response):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QueryHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        HTTPServer.__init__(self, address, QueryRequestHandler)
+        self.service = service
+
+
+def serve(service, host="127.0.0.1", port=8765):
+    """
+    Serve the query service over HTTP until interrupted
+
+    :param service: a NoNQueryService
+    :param host: the address to bind, local only by default
+    :param port: the port to bind
+    """
+
+    server = QueryHTTPServer((host, port), service)
+    print("Query server listening on http://" + host + ":" + str(port) + " ...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    service.save_results()
+
+
+if __name__ == '__main__':
+
+    host = "127.0.0.1"
+    port = 8765
+    dataset = "../data/DBLP_NoN.npy"
+    precomp = 'Precomp_Values_DBLP.npy'
+    params = [(0.2, 0.85)]
+    cache_mb = 512
+    result_mb = 64
+    result_ttl = None
+    result_file = None
+    check = None
+
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["host=", "port=", "dataset=", "precomp=", "params=", "cache_mb=",
+                                                   "result_mb=", "result_ttl=", "result_file=", "check="])
+    for option, value in opts:
+        if option == "-h":
+            print("python QueryServer.py [--host 127.0.0.1] [--port 8765] [--dataset ../data/DBLP_NoN.npy] "
+                  "[--precomp Precomp_Values_DBLP.npy] [--params 0.2,0.85;0.1,0.9] [--cache_mb 512] "
+                  "[--result_mb 64] [--result_ttl 3600] [--result_file ResultCache.json] [--check q,s,d]")
+            exit(0)
+        if option == "--host":
+            host = value
+        if option == "--port":
+            port = int(value)
+        if option == "--dataset":
+            dataset = value
+        if option == "--precomp":
+            precomp = value
+        if option == "--params":
+            params = [tuple(float(x) for x in pair.split(',')) for pair in value.split(';')]
+        if option == "--cache_mb":
+            cache_mb = int(value)
+        if option == "--result_mb":
+            result_mb = int(value)
+        if option == "--result_ttl":
+            result_ttl = float(value)
+        if option == "--result_file":
+            result_file = value
+        if option == "--check":
+            check = [int(x) for x in value.split(',')]
+
+    service = NoNQueryService(dataset, precomp, params, cache_mb * 1024 * 1024, result_mb * 1024 * 1024, result_ttl,
+                              ResultCacheFile=result_file)
+    if check is not None:
+        # check the responses of every CR solver for the query q, s, d and exit
+        print("JSON responses checked for the solvers: " + ", ".join(service.check_solvers(*check)))
+        exit(0)
+
+    serve(service, host, port)
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def dataset_fingerprint(*Paths):
+    """
+    Fingerprint of the files of a dataset and its precomputation artifacts
+
+    Hashes the path, size and modification time of every file (the files inside a directory, e.g., the NoN directory
+    format or the mmap format of precomputation results), so rebuilding or updating any of them changes the
+    fingerprint without reading their contents.
+
+    :param Paths: the files or directories (missing paths are skipped)
+    :return: a hex digest
+    """
+
+    Hash = hashlib.sha1()
+
+    for Path in Paths:
+        if os.path.isdir(Path):
+            Files = []
+            for (Root, Dirs, Names) in os.walk(Path):
+                Files.extend(os.path.join(Root, Name) for Name in Names)
+            Files.sort()
+        elif os.path.isfile(Path):
+            Files = [Path]
+        else:
+            continue
+
+        for File in Files:
+            Stat = os.stat(File)
+            Line = "%s %d %d\n" % (os.path.abspath(File), Stat.st_size, int(Stat.st_mtime * 1e6))
+            Hash.update(Line.encode('utf-8'))
+
+    return Hash.hexdigest()
+
+
+def result_key(algorithm, params):
+    """
+    The cache key of a query: (algorithm, q, s, d, alpha, c, epsilon, other parameters), k is left out so that
+    queries which only differ in k share an entry
+
+    :param algorithm: cq_basic, cq_fast or cr
+    :param params: the keyword arguments of the algorithm, with their defaults filled in
+    :return: a hashable key
+    """
+
+    Other = tuple(sorted((name, value) for (name, value) in params.items()
+                         if name not in ('q', 's', 'd', 'k', 'alpha', 'c', 'epsilon')))
+
+    return (algorithm, int(params['q']), int(params['s']), int(params['d']), float(params['alpha']),
+            float(params['c']), float(params['epsilon']) if 'epsilon' in params else None, Other)
+
+
+class ResultCache(object):
+    """
+    Bounded LRU cache of query results with expiry and dataset fingerprinting
+
+    Maps result_key(algorithm, params) to the response of a query together with the k it was computed for. Ranked
+    results (e.g., the top k of cr, which is in decreasing order of score) also answer any smaller k with a prefix
+    of the cached list. The top k of cq_basic and cq_fast is a set certified by the score bounds, not a ranking, so
+    such entries only answer the same k.
+
+    Entries expire TTL seconds after they were stored, and the least recently used entries are evicted once the
+    total size of the cached responses (the length of their JSON encoding) exceeds the memory budget. The cache is
+    bound to the fingerprint of the dataset and precomputation artifacts: validate with another fingerprint, or
+    loading a saved cache of another fingerprint, drops every entry.
+    """
+
+    def __init__(self, MaxBytes=64 * 1024 * 1024, TTL=None, Fingerprint=None):
+        """
+        :param MaxBytes: the memory budget of the cached responses in bytes
+        :param TTL: the time to live of an entry in seconds (None never expires)
+        :param Fingerprint: the fingerprint of the dataset the results belong to (see dataset_fingerprint)
+        """
+
+        self.MaxBytes = MaxBytes
+        self.TTL = TTL
+        self.Fingerprint = Fingerprint
+        self.Entries = OrderedDict()  # key -> (k, ranked, response, expiry time, size in bytes), LRU first
+        self.Bytes = 0
+        self.Hits = 0
+        self.PrefixHits = 0  # the hits answered with a prefix of a larger k
+        self.Misses = 0
+        self.Expirations = 0
+        self.Evictions = 0
+        self.Invalidations = 0
+        self.Lock = threading.Lock()
+
+    def validate(self, Fingerprint):
+        """
+        Drop every entry if the results were computed on another version of the dataset
+
+        :param Fingerprint: the current fingerprint of the dataset
+        :return: True if the cached entries were kept
+        """
+
+        with self.Lock:
+            if Fingerprint == self.Fingerprint:
+                return True
+            if len(self.Entries) > 0:
+                self.Invalidations += 1
+            self.Entries.clear()
+            self.Bytes = 0
+            self.Fingerprint = Fingerprint
+            return False
+
+    def get(self, key, k):
+        """
+        :param key: see result_key
+        :param k: the number of requested results
+        :return: a copy of the cached response with its results (and scores) cut to the first k, or None
+        """
+
+        with self.Lock:
+            if key in self.Entries:
+                (K, Ranked, Response, Expiry, Size) = self.Entries.pop(key)
+                if Expiry is not None and time.time() > Expiry:
+                    self.Bytes -= Size
+                    self.Expirations += 1
+                elif K == k or (Ranked and K > k):
+                    self.Entries[key] = (K, Ranked, Response, Expiry, Size)  # move to the most recently used end
+                    self.Hits += 1
+                    if K != k:
+                        self.PrefixHits += 1
+                    return cut_response(Response, k)
+                else:
+                    self.Entries[key] = (K, Ranked, Response, Expiry, Size)
+            self.Misses += 1
+            return None
+
+    def put(self, key, k, Response, Ranked=False):
+        """
+        :param key: see result_key
+        :param k: the number of results the response was computed for
+        :param Response: the response (a JSON-serializable dictionary with the list of results)
+        :param Ranked: the results are in decreasing order of relevance, so their prefixes answer smaller k
+        """
+
+        Size = len(json.dumps(Response))
+        if Size > self.MaxBytes:
+            return
+
+        with self.Lock:
+            if key in self.Entries:
+                Entry = self.Entries[key]
+                if Entry[1] and Entry[0] > k and (Entry[3] is None or time.time() <= Entry[3]):
+                    return  # keep the longer ranked prefix
+                self.Bytes -= self.Entries.pop(key)[4]
+            Expiry = time.time() + self.TTL if self.TTL is not None else None
+            self.Entries[key] = (k, Ranked, Response, Expiry, Size)
+            self.Bytes += Size
+            while self.Bytes > self.MaxBytes:
+                self.Bytes -= self.Entries.popitem(last=False)[1][4]
+                self.Evictions += 1
+
+    def clear(self):
+        with self.Lock:
+            self.Entries.clear()
+            self.Bytes = 0
+
+    def save(self, FileName):
+        """
+        Store the entries with the fingerprint as a JSON file, so a restarted service starts with a warm cache
+        """
+
+        with self.Lock:
+            Entries = [[list(key[:7]) + [[list(item) for item in key[7]]], K, Ranked, Response, Expiry]
+                       for (key, (K, Ranked, Response, Expiry, Size)) in self.Entries.items()]
+            Data = {'fingerprint': self.Fingerprint, 'entries': Entries}
+
+        with open(FileName, 'w') as f:
+            json.dump(Data, f)
+
+    def load(self, FileName):
+        """
+        Load the entries stored by save, unless they belong to another fingerprint or have expired
+
+        :return: the number of loaded entries
+        """
+
+        with open(FileName) as f:
+            Data = json.load(f)
+
+        if Data['fingerprint'] != self.Fingerprint:
+            with self.Lock:
+                self.Invalidations += 1
+            return 0
+
+        Now = time.time()
+        Loaded = 0
+        for (key, K, Ranked, Response, Expiry) in Data['entries']:
+            if Expiry is not None and Now > Expiry:
+                continue
+            key = tuple(key[:7]) + (tuple(tuple(item) for item in key[7]),)
+            Size = len(json.dumps(Response))
+            with self.Lock:
+                if key in self.Entries:
+                    self.Bytes -= self.Entries.pop(key)[4]
+                self.Entries[key] = (K, Ranked, Response, Expiry, Size)
+                self.Bytes += Size
+                while self.Bytes > self.MaxBytes:
+                    self.Bytes -= self.Entries.popitem(last=False)[1][4]
+                    self.Evictions += 1
+            Loaded += 1
+
+        return Loaded
+
+    def stats(self):
+        """
+        :return: a dictionary with hits, prefix_hits, misses, hit_rate, expirations, evictions, invalidations,
+                 entries, bytes, max_bytes and the fingerprint
+        """
+
+        with self.Lock:
+            Requests = self.Hits + self.Misses
+            return {'hits': self.Hits,
+                    'prefix_hits': self.PrefixHits,
+                    'misses': self.Misses,
+                    'hit_rate': float(self.Hits) / Requests if Requests > 0 else 0.0,
+                    'expirations': self.Expirations,
+                    'evictions': self.Evictions,
+                    'invalidations': self.Invalidations,
+                    'entries': len(self.Entries),
+                    'bytes': self.Bytes,
+                    'max_bytes': self.MaxBytes,
+                    'fingerprint': self.Fingerprint}
+
+
+def cut_response(Response, k):
+    """
+    :return: a copy of a cached response with its results (and scores, if any) cut to the first k
+    """
+
+    Response = dict(Response)
+    Response['results'] = Response['results'][0:k]
+    if 'scores' in Response:
+        Response['scores'] = Response['scores'][0:k]
+
+    return Response
@@ -1,13 +1,16 @@
-import os
 import time
-import numpy as np
 from scipy import sparse
-import Precomputation
+import LoadData
 import CQ_Basic
+import Telemetry
+import ParallelSpMV
+import BlockNoN
 
 
 # note that python index start from 0, while matlab index start from 1.
-def run_cq_basic(alpha=0.2, c=0.85, q=121, s=0, d=19, k=10, dataset="../data/DBLP_NoN.npy"):
+def run_cq_basic(alpha=0.2, c=0.85, q=121, s=0, d=19, k=10, dataset="../data/DBLP_NoN.npy",
+                 PrecompFileName="Precomp_Values_DBLP.npy", TraceFileName=None, Threads=None,
+                 Blocks=False):
     """
     CrossQuery-Basic evaluation on DBLP dataset
     
@@ -17,6 +20,11 @@ def run_cq_basic(alpha=0.2, c=0.85, q=121, s=0, d=19, k=10, dataset="../data/DBL
     :param s: the ID of the source domain-specific network (s = 0 by default, which represents the ID of KDD Conference)
     :param d: the ID of the target domain-specific network (d = 19 by default, which represents the ID of SIGMOD Conference)
     :param k: the number of retrieved nodes
+    :param dataset: the path for the dataset
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) of precomputation results
+    :param TraceFileName: append the per-iteration telemetry of the query to this JSON lines file (optional)
+    :param Threads: the number of threads of the products W p (see ParallelSpMV, None multiplies serially)
+    :param Blocks: multiply only the blocks of the domains which carry mass in p (see BlockNoN)
     :return: the names of top k relevant authors from the target domain-specific network
     
     Looking at ConfDict in ../data/DBLP_NoN.npy to determine source and target domain IDs, s and d.
@@ -27,7 +35,7 @@ def run_cq_basic(alpha=0.2, c=0.85, q=121, s=0, d=19, k=10, dataset="../data/DBL
     '''
     Load NoN data
     '''
-    data = np.load(dataset).item()
+    data = LoadData.load_non(dataset)
     CoAuthorNets = data['CoAuthorNets']
     ConfNet = data['ConfNet']
     ConfDict = data['ConfDict']
@@ -45,16 +53,11 @@ def run_cq_basic(alpha=0.2, c=0.85, q=121, s=0, d=19, k=10, dataset="../data/DBL
     '''
     Precomputation, this step only needs to be done once for a dataset
     '''
-    PrecompFileName = 'Precomp_Values_DBLP.npy'
-
-    if os.path.isfile(PrecompFileName):
-        print("A precomputation file has been detected ...")
-    else:
-        print("Precomputation starts ...")
-        Precomputation.precomputation(A, A_ID, G, PrecompFileName)
+    LoadData.prepare_precomputation(A, A_ID, G, PrecompFileName, AuthorDict, ConfDict)
 
     print("Load the precomputation file ...")
-    data = np.load(PrecompFileName).item()
+    data = LoadData.load_precomputation(PrecompFileName)
+    Index = LoadData.load_node_index(dataset, PrecompFileName, data['Anorm'].shape[0])
     I_n = data['I_n']
     Anorm = data['Anorm']
     Ynorm = data['Ynorm']
@@ -66,14 +69,84 @@ def run_cq_basic(alpha=0.2, c=0.85, q=121, s=0, d=19, k=10, dataset="../data/DBL
     start = time.time()
     tilde_c = (c + 2.0 * alpha) / (1.0 + 2.0 * alpha)
     W = (c / (c + 2.0 * alpha)) * Anorm + ((2.0 * alpha) / (c + 2.0 * alpha)) * Ynorm
+    if Blocks:
+        W = BlockNoN.BlockNoN(W, Index.Offsets)
+    elif Threads is not None and Threads > 1:
+        W = ParallelSpMV.ParallelSpMV(W, Index.Offsets, Threads)
 
     # CQ_Basic
-    TopKResults = CQ_Basic.cq_basic(W, q, s, d, k, tilde_c, A_ID)
+    Trace = Telemetry.TraceRecorder(algorithm='cq_basic', q=q, s=s, d=d) if TraceFileName is not None else None
+    TopKResults = CQ_Basic.cq_basic(W, q, s, d, k, tilde_c, A_ID, Trace=Trace, Index=Index)
+    if isinstance(W, ParallelSpMV.ParallelSpMV):
+        W.close()
     end = time.time()
     Runtime = end - start
 
     print("The running time of CQ_Basic is " + str(Runtime) + " seconds.")
 
+    if Trace is not None:
+        Trace.write_jsonl(TraceFileName)
+
     TopKAuthorNames = AuthorDict[TopKResults - 1, 0]
 
     return TopKAuthorNames
+
+
+def run_cq_basic_multi(alpha=0.2, c=0.85, q=121, s=0, Targets=None, k=10, dataset="../data/DBLP_NoN.npy",
+                       PrecompFileName="Precomp_Values_DBLP.npy", Threads=None, Blocks=False):
+    """
+    Multi-target CrossQuery-Basic evaluation on DBLP dataset, the top k of q in several target domains from one
+    random walk
+
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param q: the ID of the query node of interest
+    :param s: the ID of the source domain-specific network
+    :param Targets: the IDs of the target domain-specific networks (None uses every domain except s)
+    :param k: the number of retrieved nodes
+    :param dataset: the path for the dataset
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) of precomputation results
+    :param Threads: the number of threads of the products W p (see ParallelSpMV, None multiplies serially)
+    :param Blocks: multiply only the blocks of the domains which carry mass in p (see BlockNoN)
+    :return: the names of the target domains and the names of top k relevant authors from each of them
+    """
+
+    '''
+    Load NoN data and precomputation
+    '''
+    data = LoadData.load_non(dataset)
+    AuthorDict = data['AuthorDict']
+    ConfDict = data['ConfDict']
+    A_ID = data['CoAuthorNetsID']
+
+    LoadData.prepare_precomputation(data['CoAuthorNets'], A_ID, sparse.csc_matrix(data['ConfNet']), PrecompFileName,
+                                    AuthorDict, ConfDict)
+
+    print("Load the precomputation file ...")
+    data = LoadData.load_precomputation(PrecompFileName)
+    Index = LoadData.load_node_index(dataset, PrecompFileName, data['Anorm'].shape[0])
+
+    '''
+    Run CQ_Basic for all targets
+    '''
+    start = time.time()
+    tilde_c = (c + 2.0 * alpha) / (1.0 + 2.0 * alpha)
+    W = (c / (c + 2.0 * alpha)) * data['Anorm'] + ((2.0 * alpha) / (c + 2.0 * alpha)) * data['Ynorm']
+    if Blocks:
+        W = BlockNoN.BlockNoN(W, Index.Offsets)
+    elif Threads is not None and Threads > 1:
+        W = ParallelSpMV.ParallelSpMV(W, Index.Offsets, Threads)
+
+    Info = {}
+    [TopKResults, Targets] = CQ_Basic.cq_basic_multi(W, q, s, k, tilde_c, A_ID, Targets, Info=Info, Index=Index)
+    if isinstance(W, ParallelSpMV.ParallelSpMV):
+        W.close()
+    Runtime = time.time() - start
+
+    print("The running time of CQ_Basic over " + str(len(Targets)) + " target domains is " + str(Runtime) +
+          " seconds (" + str(Info['iterations']) + " iterations).")
+
+    TargetNames = ConfDict[0, Targets]
+    TopKAuthorNames = [AuthorDict[TopK - 1, 0] for TopK in TopKResults]
+
+    return [TargetNames, TopKAuthorNames]
@@ -1,12 +1,12 @@
-import os
 import time
-import numpy as np
 from scipy import sparse
-import Precomputation
+import LoadData
 import CQ_Fast
+import Telemetry
 
 
-def run_cq_fast(alpha=0.2, c=0.85, epsilon=0.003, q=121, s=0, d=19, k=10, dataset="../data/DBLP_NoN.npy"):
+def run_cq_fast(alpha=0.2, c=0.85, epsilon=0.003, q=121, s=0, d=19, k=10, dataset="../data/DBLP_NoN.npy",
+                PrecompFileName="Precomp_Values_DBLP.npy", TraceFileName=None, Blocks=False):
     """
     CrossQuery-Fast evaluation on DBLP dataset
     
@@ -17,6 +17,10 @@ def run_cq_fast(alpha=0.2, c=0.85, epsilon=0.003, q=121, s=0, d=19, k=10, datase
     :param s: the ID of the source domain-specific network (s = 0 by default, which represents the ID of KDD Conference)
     :param d: the ID of the target domain-specific network (d = 19 by default, which represents the ID of SIGMOD Conference)
     :param k: the number of retrieved nodes
+    :param dataset: the path for the dataset
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) of precomputation results
+    :param TraceFileName: append the per-iteration telemetry of the query to this JSON lines file (optional)
+    :param Blocks: run CQ_Basic on the block operator of the sub-NoN (see BlockNoN)
     :return: the names of top k relevant authors from the target domain-specific network and the the relevant domains
              of the source and target domains
     
@@ -28,7 +32,7 @@ def run_cq_fast(alpha=0.2, c=0.85, epsilon=0.003, q=121, s=0, d=19, k=10, datase
     '''
     Load NoN data
     '''
-    data = np.load(dataset).item()
+    data = LoadData.load_non(dataset)
     CoAuthorNets = data['CoAuthorNets']
     ConfNet = data['ConfNet']
     ConfDict = data['ConfDict']
@@ -45,20 +49,15 @@ def run_cq_fast(alpha=0.2, c=0.85, epsilon=0.003, q=121, s=0, d=19, k=10, datase
     '''
     Precomputation, this step only needs to be done once for a dataset
     '''
-    PrecompFileName = 'Precomp_Values_DBLP.npy'
-
-    if os.path.isfile(PrecompFileName):
-        print("A precomputation file has been detected ...")
-    else:
-        print("Precomputation starts ...")
-        Precomputation.precomputation(A, A_ID, G, PrecompFileName)
+    LoadData.prepare_precomputation(A, A_ID, G, PrecompFileName, AuthorDict, ConfDict)
 
     print("Load the precomputation file ...")
-    data = np.load(PrecompFileName).item()
+    data = LoadData.load_precomputation(PrecompFileName)
     I_n = data['I_n']
     Anorm = data['Anorm']
     Y = data['Y']
     Ynorm = data['Ynorm']
+    DisG = data.get('DisG')  # not stored by older precomputation files
 
     '''
     Run CQ_Fast
@@ -67,12 +66,17 @@ def run_cq_fast(alpha=0.2, c=0.85, epsilon=0.003, q=121, s=0, d=19, k=10, datase
     start = time.time()
 
     # CQ_Fast
-    [TopKResults, SubG_Idx] = CQ_Fast.cq_fast(Anorm, Y, G, q, s, d, k, alpha, c, epsilon, A_ID)
+    Trace = Telemetry.TraceRecorder(algorithm='cq_fast', q=q, s=s, d=d) if TraceFileName is not None else None
+    [TopKResults, SubG_Idx] = CQ_Fast.cq_fast(Anorm, Y, G, q, s, d, k, alpha, c, epsilon, A_ID, DisG, Trace=Trace,
+                                              Blocks=Blocks)
     end = time.time()
     Runtime = end - start
 
     print("The running time of CQ_Fast is " + str(Runtime) + " seconds.")
 
+    if Trace is not None:
+        Trace.write_jsonl(TraceFileName)
+
     TopKAuthorNames = AuthorDict[TopKResults - 1, 0]
     RelevantDomains = ConfDict[0, SubG_Idx]
 
@@ -0,0 +1,83 @@
+import time
+from scipy import sparse
+import LoadData
+import CQ_MonteCarlo
+
+
+# note that python index start from 0, while matlab index start from 1.
+def run_cq_montecarlo(alpha=0.2, c=0.85, NumWalks=10000, Processes=None, q=121, s=0, d=19, k=10,
+                      dataset="../data/DBLP_NoN.npy", PrecompFileName="Precomp_Values_DBLP.npy"):
+    """
+    CrossQuery with Monte Carlo random walks evaluation on DBLP dataset
+    
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param NumWalks: the number of random walks, more walks give tighter intervals at the cost of latency
+    :param Processes: the number of worker processes which simulate the walks (None uses this process)
+    :param q: the ID of the query node of interest (q = 121 by default, which represent the ID of Jiawei Han)
+    :param s: the ID of the source domain-specific network (s = 0 by default, which represents the ID of KDD Conference)
+    :param d: the ID of the target domain-specific network (d = 19 by default, which represents the ID of SIGMOD Conference)
+    :param k: the number of retrieved nodes
+    :param dataset: the path for the dataset
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) of precomputation results
+    :return: the names of top k relevant authors from the target domain-specific network, their estimated scores and
+             their 95% confidence intervals (None if too few walks reach the target domain)
+    
+    Looking at ConfDict in ../data/DBLP_NoN.npy to determine source and target domain IDs, s and d.
+    
+    Looking at AuthorDict in ../data/DBLP_NoN.npy to determine the ID of the query node q.
+    """
+
+    '''
+    Load NoN data
+    '''
+    data = LoadData.load_non(dataset)
+    CoAuthorNets = data['CoAuthorNets']
+    ConfNet = data['ConfNet']
+    ConfDict = data['ConfDict']
+    AuthorDict = data['AuthorDict']
+    CoAuthorNetsID = data['CoAuthorNetsID']
+
+    '''
+    Rename networks
+    '''
+    G = sparse.csc_matrix(ConfNet)  # the main network
+    A = CoAuthorNets  # the domain-specific networks
+    A_ID = CoAuthorNetsID  # the IDs of nodes in domain-specific networks
+
+
+    '''
+    Precomputation, this step only needs to be done once for a dataset
+    '''
+    LoadData.prepare_precomputation(A, A_ID, G, PrecompFileName, AuthorDict, ConfDict)
+
+    print("Load the precomputation file ...")
+    data = LoadData.load_precomputation(PrecompFileName)
+    I_n = data['I_n']
+    Anorm = data['Anorm']
+    Ynorm = data['Ynorm']
+
+    '''
+    Run CQ_MonteCarlo
+    '''
+    # initialization
+    start = time.time()
+    tilde_c = (c + 2.0 * alpha) / (1.0 + 2.0 * alpha)
+    W = (c / (c + 2.0 * alpha)) * Anorm + ((2.0 * alpha) / (c + 2.0 * alpha)) * Ynorm
+    W = W.tocsr()
+
+    # CQ_MonteCarlo
+    try:
+        [TopKResults, Scores, Intervals] = CQ_MonteCarlo.cq_montecarlo(W, q, s, d, k, tilde_c, A_ID, NumWalks,
+                                                                       Processes=Processes)
+    except ValueError as error:  # too few walks reach the target domain
+        print("CQ_MonteCarlo stopped: " + str(error))
+        return [None, None, None]
+    end = time.time()
+    Runtime = end - start
+
+    print("The running time of CQ_MonteCarlo is " + str(Runtime) + " seconds.")
+
+    TopKAuthorNames = AuthorDict[TopKResults - 1, 0]
+
+    return [TopKAuthorNames, Scores, Intervals]
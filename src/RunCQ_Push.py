@@ -0,0 +1,82 @@
+import time
+from scipy import sparse
+import LoadData
+import CQ_Push
+import Telemetry
+
+
+# note that python index start from 0, while matlab index start from 1.
+def run_cq_push(alpha=0.2, c=0.85, rmax=1e-4, q=121, s=0, d=19, k=10, dataset="../data/DBLP_NoN.npy",
+                PrecompFileName="Precomp_Values_DBLP.npy", TraceFileName=None):
+    """
+    CrossQuery with local forward push evaluation on DBLP dataset
+    
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param rmax: the initial residual threshold of the forward push
+    :param q: the ID of the query node of interest (q = 121 by default, which represent the ID of Jiawei Han)
+    :param s: the ID of the source domain-specific network (s = 0 by default, which represents the ID of KDD Conference)
+    :param d: the ID of the target domain-specific network (d = 19 by default, which represents the ID of SIGMOD Conference)
+    :param k: the number of retrieved nodes
+    :param dataset: the path for the dataset
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) of precomputation results
+    :param TraceFileName: append the per-iteration telemetry of the query to this JSON lines file (optional)
+    :return: the names of top k relevant authors from the target domain-specific network
+    
+    Looking at ConfDict in ../data/DBLP_NoN.npy to determine source and target domain IDs, s and d.
+    
+    Looking at AuthorDict in ../data/DBLP_NoN.npy to determine the ID of the query node q.
+    """
+
+    '''
+    Load NoN data
+    '''
+    data = LoadData.load_non(dataset)
+    CoAuthorNets = data['CoAuthorNets']
+    ConfNet = data['ConfNet']
+    ConfDict = data['ConfDict']
+    AuthorDict = data['AuthorDict']
+    CoAuthorNetsID = data['CoAuthorNetsID']
+
+    '''
+    Rename networks
+    '''
+    G = sparse.csc_matrix(ConfNet)  # the main network
+    A = CoAuthorNets  # the domain-specific networks
+    A_ID = CoAuthorNetsID  # the IDs of nodes in domain-specific networks
+
+
+    '''
+    Precomputation, this step only needs to be done once for a dataset
+    '''
+    LoadData.prepare_precomputation(A, A_ID, G, PrecompFileName, AuthorDict, ConfDict)
+
+    print("Load the precomputation file ...")
+    data = LoadData.load_precomputation(PrecompFileName)
+    I_n = data['I_n']
+    Anorm = data['Anorm']
+    Ynorm = data['Ynorm']
+
+    '''
+    Run CQ_Push
+    '''
+    # initialization
+    start = time.time()
+    tilde_c = (c + 2.0 * alpha) / (1.0 + 2.0 * alpha)
+    W = (c / (c + 2.0 * alpha)) * Anorm + ((2.0 * alpha) / (c + 2.0 * alpha)) * Ynorm
+    W = W.tocsr()
+
+    # CQ_Push
+    Trace = Telemetry.TraceRecorder(algorithm='cq_push', q=q, s=s, d=d) if TraceFileName is not None else None
+    TopKResults = CQ_Push.cq_push(W, q, s, d, k, tilde_c, A_ID, rmax, Trace=Trace)
+    end = time.time()
+    Runtime = end - start
+
+    print("The running time of CQ_Push is " + str(Runtime) + " seconds.")
+
+    if Trace is not None:
+        Trace.write_jsonl(TraceFileName)
+
+    TopKAuthorNames = AuthorDict[TopKResults - 1, 0]
+
+    return TopKAuthorNames
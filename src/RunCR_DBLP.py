@@ -1,12 +1,13 @@
-import os
 import time
-import numpy as np
 from scipy import sparse
-import Precomputation
+import LoadData
 import CR
+import Telemetry
 
 
-def run_cr_dblp(alpha=0.2, c=0.85, MaxIter=1000, epsilon=1e-15, q=121, s=0, d=19, k=10, dataset="../data/DBLP_NoN.npy"):
+def run_cr_dblp(alpha=0.2, c=0.85, MaxIter=1000, epsilon=1e-15, q=121, s=0, d=19, k=10, dataset="../data/DBLP_NoN.npy",
+                PrecompFileName="Precomp_Values_DBLP.npy", solver="power", TraceFileName=None, Threads=None,
+                Blocks=False):
     """
     CrossRank evaluation on DBLP dataset
     
@@ -18,13 +19,22 @@ def run_cr_dblp(alpha=0.2, c=0.85, MaxIter=1000, epsilon=1e-15, q=121, s=0, d=19
     :param s: the ID of the source domain-specific network (s = 0 by default, which represents the ID of KDD Conference)
     :param d: the ID of the target domain-specific network (d = 19 by default, which represents the ID of SIGMOD Conference)
     :param k: the number of retrieved nodes
+    :param dataset: the path for the dataset
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) of precomputation results
+    :param solver: the CR solver backend, one of CR.Solvers (power, gauss_seidel, sor, gmres, bicgstab), or topk to
+                   stop as soon as the top k order of the target domain is certain (CR.cr_topk)
+    :param TraceFileName: append the per-iteration telemetry of the query to this JSON lines file (optional)
+    :param Threads: the number of threads of the products with M in the power method and the top-k mode (see
+                    ParallelSpMV, None multiplies serially)
+    :param Blocks: multiply only the blocks of the domains which carry mass in r, in the power method and the top-k
+                   mode (see BlockNoN)
     :return: top k author names
     """
 
     '''
     Load NoN data
     '''
-    data = np.load(dataset).item()
+    data = LoadData.load_non(dataset)
     CoAuthorNets = data['CoAuthorNets']
     ConfNet = data['ConfNet']
     ConfDict = data['ConfDict']
@@ -42,16 +52,11 @@ def run_cr_dblp(alpha=0.2, c=0.85, MaxIter=1000, epsilon=1e-15, q=121, s=0, d=19
     '''
     Precomputation, this step only needs to be done once for a dataset
     '''
-    PrecompFileName = 'Precomp_Values_DBLP.npy'
-
-    if os.path.isfile(PrecompFileName):
-        print("A precomputation file has been detected ...")
-    else:
-        print("Precomputation starts ...")
-        Precomputation.precomputation(A, A_ID, G, PrecompFileName)
+    LoadData.prepare_precomputation(A, A_ID, G, PrecompFileName, AuthorDict, ConfDict)
 
     print("Load the precomputation file ...")
-    data = np.load(PrecompFileName).item()
+    data = LoadData.load_precomputation(PrecompFileName)
+    Index = LoadData.load_node_index(dataset, PrecompFileName, data['Anorm'].shape[0])
     I_n = data['I_n']
     Anorm = data['Anorm']
     Ynorm = data['Ynorm']
@@ -62,42 +67,39 @@ def run_cr_dblp(alpha=0.2, c=0.85, MaxIter=1000, epsilon=1e-15, q=121, s=0, d=19
     # set initial scores
     start = time.time()
 
-    vfunc = np.vectorize(lambda matrix: matrix.shape[0])  # define an element-wise operation
-    DomainSizes = vfunc(A_ID)  # the number of domain nodes in each domain-specific network
-
-    e = np.array([])  # initialize query vector
-
-    for i in range(g):
-
-        tmp_e = np.zeros((DomainSizes[0, i],))
-
-        if i == s:
-            tmp_e[A_ID[0, i].ravel() == q] = 1  # use g to replace 1 if NoN size is large
+    Offsets = Index.Offsets
+    e = Index.query_vector(q, s)
 
-        e = np.hstack((e, tmp_e))
-
-    e = e.reshape(len(e), 1)
-    e = sparse.csc_matrix(e)
+    st = Offsets[d]
+    ed = Offsets[d + 1]
 
     # CR
-    [r, Objs, Deltas] = CR.cr(Anorm, Ynorm, I_n, e, alpha, c, MaxIter, epsilon)
-
-    # sort ranking scores in the target domain-specific network
-    st = np.sum(DomainSizes[0, 0:d])
-    ed = np.sum(DomainSizes[0, 0:d+1])
-    rd_idx = np.arange(st, ed)
-    rd = r[rd_idx]
+    Trace = Telemetry.TraceRecorder(algorithm='cr', solver=solver, q=q, s=s, d=d) if TraceFileName is not None else None
+    if solver == 'topk':
+        [TopKResults, Scores, Info] = CR.cr_topk(Anorm, Ynorm, e, alpha, c, st, ed, k, MaxIter, epsilon, Trace,
+                                                  Threads, Offsets, Blocks)
+    else:
+        [r, Info] = CR.cr_solve(Anorm, Ynorm, e, alpha, c, MaxIter, epsilon, solver, Trace=Trace, Threads=Threads,
+                                  Offsets=Offsets, Blocks=Blocks)
 
-    Sort_rd = np.flip(np.sort(rd.todense().getA1()), axis=0)
-    Sort_Idx = np.flip(np.argsort(rd.todense().getA1()), axis=0)
+        # select the top k ranking scores in the target domain-specific network
+        TopKResults = CR.top_k(r[st:ed], k)
 
-    TopKResults = Sort_Idx[0:k]
     TopKResults = A_ID[0, d][TopKResults, 0]
 
     end = time.time()
     Runtime = end - start
 
     print("The running time of CR is " + str(Runtime) + " seconds.")
+    if solver == 'topk':
+        print("The topk solver ran " + str(Info['iterations']) + " iterations in " + str(Info['runtime']) +
+              " seconds, top k order certified: " + str(Info['certified']) + ".")
+    else:
+        print("The " + solver + " solver ran " + str(Info['iterations']) + " iterations in " + str(Info['runtime']) +
+              " seconds, residual " + str(Info['residual']) + ".")
+
+    if Trace is not None:
+        Trace.write_jsonl(TraceFileName)
 
     TopKAuthorNames = AuthorDict[TopKResults - 1, 0]
 
@@ -0,0 +1,72 @@
+import time
+from scipy import sparse
+import LoadData
+import CR_Multi
+
+
+def run_cr_multi(alpha=0.2, c=0.85, MaxIter=1000, epsilon=1e-15, Queries=None, s=0, d=19, k=10, BlockSize=None,
+                 dataset="../data/DBLP_NoN.npy", PrecompFileName="Precomp_Values_DBLP.npy",
+                 OutFileName="CR_TopK.tsv", Threads=None, Blocks=False):
+    """
+    Multi-source CrossRank evaluation on DBLP dataset
+
+    Ranks the target domain-specific network for many query nodes (by default every author of the source domain)
+    and streams the results into a tab-separated file with one line per (query, rank).
+
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param MaxIter: the maximal number of iteration for updating ranking vector
+    :param epsilon: a convergence parameter
+    :param Queries: the IDs of the query nodes, all authors of the source domain-specific network if None
+    :param s: the ID of the source domain-specific network (s = 0 by default, which represents the ID of KDD Conference)
+    :param d: the ID of the target domain-specific network (d = 19 by default, which represents the ID of SIGMOD Conference)
+    :param k: the number of retrieved nodes
+    :param BlockSize: the number of queries solved together (derived from a 256 MB budget if None)
+    :param dataset: the path for the dataset
+    :param PrecompFileName: the file name (npy format) or directory (mmap format) of precomputation results
+    :param OutFileName: the tab-separated output file (query_id, rank, author_id, author_name, score)
+    :param Threads: the number of threads of the products with M (see ParallelSpMV, None multiplies serially)
+    :param Blocks: multiply only the blocks of the domains which carry mass (see BlockNoN)
+    :return: the number of queries
+    """
+
+    '''
+    Load NoN data
+    '''
+    data = LoadData.load_non(dataset)
+    G = sparse.csc_matrix(data['ConfNet'])  # the main network
+    A = data['CoAuthorNets']  # the domain-specific networks
+    A_ID = data['CoAuthorNetsID']  # the IDs of nodes in domain-specific networks
+    AuthorDict = data['AuthorDict']
+
+    '''
+    Precomputation, this step only needs to be done once for a dataset
+    '''
+    LoadData.prepare_precomputation(A, A_ID, G, PrecompFileName, AuthorDict, data['ConfDict'])
+
+    print("Load the precomputation file ...")
+    data = LoadData.load_precomputation(PrecompFileName)
+    Anorm = data['Anorm']
+    Ynorm = data['Ynorm']
+
+    '''
+    Run multi-source CR
+    '''
+    start = time.time()
+    NumQueries = 0
+
+    with open(OutFileName, 'w') as f:
+        f.write("query_id\trank\tauthor_id\tauthor_name\tscore\n")
+        for (q, TopKResults, Scores, Iters) in CR_Multi.cr_multi(Anorm, Ynorm, A_ID, s, d, k, alpha, c, MaxIter,
+                                                                  epsilon, Queries, BlockSize, Threads=Threads,
+                                                                  Blocks=Blocks):
+            for rank in range(len(TopKResults)):
+                name = AuthorDict[TopKResults[rank] - 1, 0]
+                f.write("%d\t%d\t%d\t%s\t%.17g\n" % (q, rank + 1, TopKResults[rank], name[0], Scores[rank]))
+            NumQueries += 1
+
+    Runtime = time.time() - start
+
+    print("The running time of multi-source CR for " + str(NumQueries) + " queries is " + str(Runtime) + " seconds.")
+
+    return NumQueries
@@ -0,0 +1,479 @@
+import os
+import sys
+import json
+import time
+import getopt
+import shutil
+import tempfile
+import numpy as np
+from scipy import sparse
+import ExtractSubNet
+import NodeIndex
+import LoadData
+import Precomputation
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+# the estimated peak bytes per nonzero entry while a chunk is built (the pair indices, the values, the coo to csr
+# conversion and the sum with the diagonal), used to turn the memory budget into a number of entries per chunk
+EntryBytes = 160
+
+
+def streaming_precomputation(A, A_ID, G, PrecompDir, MemoryBytes=256 * 1024 * 1024, TmpDir=None, Compact=False,
+                             AuthorDict=None, ConfDict=None, Info=None):
+    """
+    Out-of-core CR and CQ precomputation
+
+    Computes the same matrices as Precomputation.build_precomputation and stores them in the mmap format, without
+    ever holding a whole n x n matrix in memory:
+
+    Anorm:  the domain-specific networks are normalized a chunk of domains at a time (see normalize_domain) and
+            each chunk is spilled to disk as a shard of csr rows
+    Y:      the rows of O (the domain-pair blocks of common nodes) are built a chunk of rows at a time from the
+            inverted index of node IDs, Y = O + Dy - Do is formed row by row and spilled as csr shards
+    Ynorm:  the entries of Dy^(-0.5) Y Dy^(-0.5) of each row chunk are spilled as COO shards bucketed by column
+            chunk, and each column chunk is then sorted into a csc shard (an external transpose)
+
+    The shards are finally copied into the raw arrays of the mmap format through numpy.memmap, so the output is
+    identical, array for array, to save_precomputation_mmap of the in-memory path. A chunk holds about
+    MemoryBytes / EntryBytes nonzero entries (a chunk of Anorm is at least one domain, and a chunk of Y is at least
+    one row). The vectors of length n (the inverted index of node IDs and the degrees) and the main network stay in
+    memory.
+
+    :param A: the domain-specific networks, an object array or a LoadData.NoNDirDomains reader
+    :param A_ID: the corresponding IDs of domain-specific networks in A
+    :param G: the adjacency matrix of the main network
+    :param PrecompDir: the directory to store precomputation results in the mmap format
+    :param MemoryBytes: the memory budget of a chunk in bytes
+    :param TmpDir: the directory of the shards (a temporary directory next to PrecompDir if None), removed at the end
+    :param Compact: store the compact mode (float32 values, see Precomputation.compact_precomputation)
+    :param AuthorDict: the names of authors, kept in the node index for name lookups (optional)
+    :param ConfDict: the names of conferences, kept in the node index for name lookups (optional)
+    :param Info: a dictionary which receives the number of chunks of each matrix, the bytes of the shards and the
+                 runtime (optional)
+    """
+
+    start = time.time()
+
+    if not os.path.isdir(PrecompDir):
+        os.makedirs(PrecompDir)
+    Parent = os.path.dirname(os.path.abspath(PrecompDir))
+    Shards = tempfile.mkdtemp(prefix='shards', dir=TmpDir if TmpDir is not None else Parent)
+
+    Offsets = Precomputation.cumulative_ns(A_ID)
+    n = int(Offsets[-1])
+    Budget = max(MemoryBytes // EntryBytes, 1)  # the number of nonzero entries per chunk
+    Dtype = np.float32 if Compact else np.float64
+    Matrices = {}
+    Chunks = {}
+
+    try:
+        '''
+        Anorm, a chunk of domains at a time
+        '''
+        [Matrices['Anorm'], Chunks['Anorm']] = anorm_shards(A, Offsets, Budget, Shards, Dtype)
+
+        '''
+        Y and the COO shards of Ynorm, a chunk of rows at a time
+        '''
+        [Matrices['Y'], ColBounds, Chunks['Y']] = y_shards(A_ID, G, Offsets, Budget, Shards, Dtype)
+
+        '''
+        Ynorm, a chunk of columns at a time
+        '''
+        Matrices['Ynorm'] = ynorm_shards(n, ColBounds, Shards, Dtype)
+        Chunks['Ynorm'] = len(ColBounds) - 1
+
+        ShardBytes = sum(os.path.getsize(os.path.join(Shards, Name)) for Name in os.listdir(Shards))
+
+        '''
+        Assemble the mmap format
+        '''
+        Manifest = {'version': 1, 'n': n, 'matrices': {}}
+
+        DisG = ExtractSubNet.distance_graph(G)  # only depends on the main network, which is small
+        if Compact:
+            DisG = Precomputation.compact_matrix(DisG, 'csr', np.float64)
+        Matrices['DisG'] = ('csr', DisG.shape, [save_shard(Shards, 'DisG.0', DisG)])
+
+        for (name, fmt) in Precomputation.MmapMatrices:
+            (Format, Shape, Files) = Matrices[name]
+            Manifest['matrices'][name] = assemble(PrecompDir, name, Format, Shape, Files)
+
+    finally:
+        shutil.rmtree(Shards, ignore_errors=True)
+
+    # write the manifest last, a directory without it is an incomplete precomputation
+    with open(os.path.join(PrecompDir, 'manifest.json'), 'w') as f:
+        json.dump(Manifest, f, indent=2)
+
+    NodeIndex.NodeIndex.build(A_ID, AuthorDict, ConfDict).save(NodeIndex.index_file_name(PrecompDir))
+
+    if Info is not None:
+        Info['chunks'] = Chunks
+        Info['shard_bytes'] = ShardBytes
+        Info['runtime'] = time.time() - start
+
+
+def chunk_bounds(Counts, Budget):
+    """
+    Split consecutive items into chunks of at most Budget in total (an item larger than Budget is a chunk alone)
+
+    :param Counts: the number of nonzero entries of each item
+    :param Budget: the number of nonzero entries per chunk
+    :return: the first item of each chunk followed by the number of items
+    """
+
+    Cum = np.hstack(([0], np.cumsum(Counts)))
+    Bounds = [0]
+
+    while Bounds[-1] < len(Counts):
+        First = Bounds[-1]
+        Last = np.searchsorted(Cum, Cum[First] + Budget, side='right') - 1
+        Bounds.append(int(max(Last, First + 1)))
+
+    return np.array(Bounds, dtype=np.int64)
+
+
+def save_shard(Shards, Name, M):
+    """
+    Spill a csr row block or csc column block to disk
+
+    :return: the path of the shard
+    """
+
+    FileName = os.path.join(Shards, Name + '.npz')
+    np.savez(FileName, indptr=M.indptr, indices=M.indices, data=M.data)
+
+    return FileName
+
+
+def anorm_shards(A, Offsets, Budget, Shards, Dtype):
+    """
+    Normalize the domain-specific networks a chunk of domains at a time and spill the rows of Anorm as csr shards
+
+    :return: the (format, shape, shard files) of Anorm and the number of chunks
+    """
+
+    n = int(Offsets[-1])
+    g = A.shape[1]
+    Files = []
+    Blocks = []  # the normalized domains of the current chunk
+    First = 0  # the first domain of the current chunk
+    Entries = 0
+
+    for i in range(g + 1):
+        if i < g:
+            Anorm_i = Precomputation.normalize_domain(A[0, i])
+        if len(Blocks) > 0 and (i == g or Entries + Anorm_i.nnz > Budget):
+            # the same blocks as sparse.block_diag, shifted to the rows and columns of the chunk
+            Block = sparse.block_diag(Blocks, format='coo')
+            Rows = Offsets[i] - Offsets[First]
+            Chunk = sparse.coo_matrix((Block.data, (Block.row, Block.col + Offsets[First])), shape=(Rows, n))
+            Chunk = chunk_matrix(Chunk, 'csr', Dtype)
+            Files.append(save_shard(Shards, 'Anorm.%d' % len(Files), Chunk))
+            Blocks = []
+            First = i
+            Entries = 0
+        if i < g:
+            Blocks.append(Anorm_i)
+            Entries += Anorm_i.nnz
+
+    return [('csr', (n, n), Files), len(Files)]
+
+
+def y_shards(A_ID, G, Offsets, Budget, Shards, Dtype):
+    """
+    Build Y = O + Dy - Do a chunk of rows at a time, spill its rows as csr shards and the entries of
+    Ynorm = Dy^(-0.5) Y Dy^(-0.5) as COO shards bucketed by column chunk
+
+    :return: the (format, shape, shard files) of Y, the first column of each column chunk of Ynorm and the number of
+             row chunks
+    """
+
+    n = int(Offsets[-1])
+    g = A_ID.shape[1]
+    dG = G.sum(axis=1).getA().ravel()  # degree of main nodes, summed in the format of G as build_precomputation does
+    G = sparse.csr_matrix(G)
+
+    '''
+    Inverted index of node IDs: the occurrences of each main node ID (see common_node_pairs)
+    '''
+    IDs = np.hstack([np.ravel(A_ID[0, i]) for i in range(g)])
+    Order = np.argsort(IDs, kind='mergesort')
+    Sorted = IDs[Order]
+    del IDs
+    NewGroup = np.hstack(([True], Sorted[1:] != Sorted[:-1])) if n > 0 else np.zeros(0, dtype=bool)
+    del Sorted
+    GroupStart = np.flatnonzero(NewGroup)
+    GroupSize = np.diff(np.hstack((GroupStart, [n])))
+    Group = np.cumsum(NewGroup) - 1  # the group of each sorted occurrence
+    del NewGroup
+
+    RowStart = np.empty(n, dtype=np.int64)  # the first sorted occurrence of the group of each row
+    RowStart[Order] = GroupStart[Group]
+    RowSize = np.empty(n, dtype=np.int64)  # the number of occurrences of the ID of each row
+    RowSize[Order] = GroupSize[Group]
+    del Group, GroupStart, GroupSize
+
+    Domain = np.repeat(np.arange(g), np.diff(Offsets))  # the domain of each domain node
+    dy = dG[Domain]  # the diagonal of Dy
+    dyn = dy ** (-0.5)  # the diagonal of Dy^(-0.5)
+
+    # a row of Y has at most RowSize + 1 entries, and so has a column if G is symmetric
+    RowBounds = chunk_bounds(RowSize + 1, Budget)
+    ColBounds = chunk_bounds(RowSize + 1, Budget)
+
+    Files = []
+    for r in range(len(RowBounds) - 1):
+        (lo, hi) = (RowBounds[r], RowBounds[r + 1])
+
+        '''
+        The rows of O: every occurrence is paired with every occurrence of its ID, O[row, col] = G[i, j]
+        '''
+        Size = RowSize[lo:hi]
+        row = np.repeat(np.arange(lo, hi), Size)
+        PairStart = np.repeat(np.cumsum(Size) - Size, Size)  # the first pair of each row
+        col = Order[np.repeat(RowStart[lo:hi], Size) + np.arange(len(row)) - PairStart]
+        del PairStart
+        data = np.asarray(G[Domain[row], Domain[col]], dtype=np.float64).ravel()
+        Mask = data != 0
+        O = sparse.coo_matrix((data[Mask], (row[Mask] - lo, col[Mask])), shape=(hi - lo, n)).tocsr()
+        del row, col, data, Mask
+
+        '''
+        The rows of Y = O + Dt, Dt = Dy - Do
+        '''
+        Do = O.sum(axis=1).getA().ravel()
+        Dt = dy[lo:hi] - Do
+        Dt = sparse.csr_matrix((Dt, (np.arange(hi - lo), np.arange(lo, hi))), shape=(hi - lo, n))
+        Dt.eliminate_zeros()
+        Y = O + Dt
+        del O, Dt
+
+        '''
+        The entries of Ynorm, without the small entries caused by the precision problem
+        '''
+        row = np.repeat(np.arange(lo, hi), np.diff(Y.indptr))
+        data = (dyn[row] * Y.data) * dyn[Y.indices]
+        Keep = ~(data < 1e-15)
+        spill_columns(Shards, ColBounds, row[Keep], Y.indices[Keep], data[Keep])
+        del row, data, Keep
+
+        Files.append(save_shard(Shards, 'Y.%d' % r, chunk_matrix(Y, 'csr', Dtype)))
+        del Y
+
+    return [('csr', (n, n), Files), ColBounds, len(Files)]
+
+
+def spill_columns(Shards, ColBounds, row, col, data):
+    """
+    Append COO entries to the shards of their column chunks
+    """
+
+    Chunk = np.searchsorted(ColBounds, col, side='right') - 1
+    Order = np.argsort(Chunk, kind='mergesort')
+    Bounds = np.searchsorted(Chunk[Order], np.arange(len(ColBounds)))
+
+    for c in range(len(ColBounds) - 1):
+        Part = Order[Bounds[c]:Bounds[c + 1]]
+        if len(Part) == 0:
+            continue
+        for (field, array) in [('row', row[Part]), ('col', col[Part]), ('data', data[Part])]:
+            with open(os.path.join(Shards, 'Ynorm.%d.%s' % (c, field)), 'ab') as f:
+                array.astype(np.float64 if field == 'data' else np.int64).tofile(f)
+
+
+def ynorm_shards(n, ColBounds, Shards, Dtype):
+    """
+    Sort the COO shards of each column chunk of Ynorm into a csc shard
+
+    :return: the (format, shape, shard files) of Ynorm
+    """
+
+    Files = []
+    for c in range(len(ColBounds) - 1):
+        (lo, hi) = (ColBounds[c], ColBounds[c + 1])
+
+        Arrays = {}
+        for field in ('row', 'col', 'data'):
+            FileName = os.path.join(Shards, 'Ynorm.%d.%s' % (c, field))
+            if os.path.isfile(FileName):
+                Arrays[field] = np.fromfile(FileName, dtype=np.float64 if field == 'data' else np.int64)
+                os.remove(FileName)
+            else:
+                Arrays[field] = np.zeros(0, dtype=np.float64 if field == 'data' else np.int64)
+
+        Chunk = sparse.coo_matrix((Arrays['data'], (Arrays['row'], Arrays['col'] - lo)), shape=(n, hi - lo))
+        del Arrays
+        Files.append(save_shard(Shards, 'Ynorm.%d' % c, chunk_matrix(Chunk, 'csc', Dtype)))
+
+    return ('csc', (n, n), Files)
+
+
+def chunk_matrix(M, Format, Dtype):
+    """
+    Convert a row or column block the way save_precomputation_mmap (and compact_matrix in the compact mode) convert
+    the whole matrix, all of these steps only depend on the entries of a row (csr) or column (csc)
+    """
+
+    if Dtype != np.float64:
+        return Precomputation.compact_matrix(M, Format, Dtype)
+
+    M = M.asformat(Format)
+    M.sum_duplicates()
+
+    return M
+
+
+def assemble(PrecompDir, name, Format, Shape, Files):
+    """
+    Concatenate the csr (or csc) shards of a matrix into the raw arrays of the mmap format through numpy.memmap
+
+    :return: the manifest entry of the matrix (see save_precomputation_mmap)
+    """
+
+    Sizes = []
+    for FileName in Files:
+        with np.load(FileName) as Shard:
+            Sizes.append((len(Shard['indptr']) - 1, len(Shard['indices']), Shard['data'].dtype))
+    nnz = sum(Size[1] for Size in Sizes)
+    Lines = sum(Size[0] for Size in Sizes)  # the number of rows (csr) or columns (csc)
+
+    # the index dtype rule of save_precomputation_mmap
+    IdxDtype = np.int32 if max(nnz, max(Shape)) < np.iinfo(np.int32).max else np.int64
+    Dtypes = {'indptr': np.dtype(IdxDtype), 'indices': np.dtype(IdxDtype), 'data': np.dtype(Sizes[0][2])}
+    Lengths = {'indptr': Lines + 1, 'indices': nnz, 'data': nnz}
+
+    Arrays = {}
+    for field in ('indptr', 'indices', 'data'):
+        FileName = os.path.join(PrecompDir, name + '.' + field)
+        if Lengths[field] == 0:  # empty files cannot be memory-mapped
+            open(FileName, 'wb').close()
+            Arrays[field] = np.zeros(0, dtype=Dtypes[field])
+        else:
+            Arrays[field] = np.memmap(FileName, dtype=Dtypes[field], mode='w+', shape=(Lengths[field],))
+
+    (Line, Entry) = (0, 0)
+    Arrays['indptr'][0:1] = 0
+    for FileName in Files:
+        with np.load(FileName) as Shard:
+            indptr = Shard['indptr']
+            Lines = len(indptr) - 1
+            Size = len(Shard['indices'])
+            Arrays['indptr'][Line + 1:Line + Lines + 1] = indptr[1:].astype(np.int64) + Entry
+            Arrays['indices'][Entry:Entry + Size] = Shard['indices']
+            Arrays['data'][Entry:Entry + Size] = Shard['data']
+        os.remove(FileName)
+        Line += Lines
+        Entry += Size
+
+    for field in Arrays:
+        if isinstance(Arrays[field], np.memmap):
+            Arrays[field].flush()
+    del Arrays
+
+    return {'format': Format, 'shape': [int(Shape[0]), int(Shape[1])],
+            'arrays': dict((field, {'file': name + '.' + field, 'dtype': Dtypes[field].str,
+                                    'length': int(Lengths[field])}) for field in ('indptr', 'indices', 'data'))}
+
+
+def same_precomputation(Dir1, Dir2):
+    """
+    Compare two precomputations in the mmap format array by array
+
+    :return: the names of the arrays which differ (an empty list if the precomputations are identical)
+    """
+
+    with open(os.path.join(Dir1, 'manifest.json')) as f:
+        Manifest1 = json.load(f)
+    with open(os.path.join(Dir2, 'manifest.json')) as f:
+        Manifest2 = json.load(f)
+
+    Different = []
+    for name in sorted(set(Manifest1['matrices']) | set(Manifest2['matrices'])):
+        if Manifest1['matrices'].get(name) != Manifest2['matrices'].get(name):
+            Different.append(name)
+            continue
+        for field in ('indptr', 'indices', 'data'):
+            FileName = name + '.' + field
+            with open(os.path.join(Dir1, FileName), 'rb') as f1, open(os.path.join(Dir2, FileName), 'rb') as f2:
+                while True:
+                    (Block1, Block2) = (f1.read(1 << 20), f2.read(1 << 20))
+                    if Block1 != Block2:
+                        Different.append(FileName)
+                        break
+                    if not Block1:
+                        break
+
+    return Different
+
+
+if __name__ == '__main__':
+
+    dataset = "../data/DBLP_NoN.npy"
+    precomp = "Precomp_Values_DBLP"
+    memory_mb = 256
+    tmp = None
+    compact = False
+    verify = False
+
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["dataset=", "precomp=", "memory_mb=", "tmp=", "compact",
+                                                   "verify"])
+    for option, value in opts:
+        if option == "-h":
+            print("python StreamingPrecomputation.py [--dataset ../data/DBLP_NoN.npy] [--precomp Precomp_Values_DBLP] "
+                  "[--memory_mb 256] [--tmp /scratch] [--compact] [--verify]")
+            print("--verify also runs the in-memory precomputation and compares the outputs array by array")
+            exit(0)
+        if option == "--dataset":
+            dataset = value
+        if option == "--precomp":
+            precomp = value
+        if option == "--memory_mb":
+            memory_mb = float(value)
+        if option == "--tmp":
+            tmp = value
+        if option == "--compact":
+            compact = True
+        if option == "--verify":
+            verify = True
+
+    # an NoN in the directory format is read one domain at a time
+    data = LoadData.load_non_dir(dataset, Lazy=True) if os.path.isdir(dataset) else LoadData.load_non(dataset)
+    G = sparse.csc_matrix(data['ConfNet'])
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+    Info = {}
+    streaming_precomputation(data['CoAuthorNets'], data['CoAuthorNetsID'], G, precomp, int(memory_mb * 1024 * 1024),
+                             tmp, compact, data['AuthorDict'], data['ConfDict'], Info)
+    if tracemalloc is not None:
+        Info['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print("The streaming precomputation took " + str(Info['runtime']) + " seconds, chunks: " + str(Info['chunks']) +
+          ", shards: " + str(Info['shard_bytes']) + " bytes" +
+          (", peak memory: " + str(Info['peak_memory']) + " bytes." if 'peak_memory' in Info else "."))
+
+    if verify:
+        A = data['CoAuthorNets']
+        if isinstance(A, LoadData.NoNDirDomains):
+            A = LoadData.load_non_dir(dataset)['CoAuthorNets']
+        Reference = tempfile.mkdtemp(prefix='reference', dir=tmp)
+        try:
+            Expected = Precomputation.build_precomputation(A, data['CoAuthorNetsID'], G)
+            if compact:
+                Expected = Precomputation.compact_precomputation(Expected)
+            Precomputation.save_precomputation_mmap(Expected, Reference)
+            Different = same_precomputation(precomp, Reference)
+        finally:
+            shutil.rmtree(Reference, ignore_errors=True)
+        if len(Different) == 0:
+            print("The output is identical to the in-memory precomputation.")
+        else:
+            print("The output differs from the in-memory precomputation in: " + ", ".join(Different))
+            exit(1)
@@ -0,0 +1,99 @@
+import threading
+import numpy as np
+import BlockNoN
+from collections import OrderedDict
+
+
+class SubNoNCache(object):
+    """
+    Bounded LRU cache of sub-NoNs extracted by CQ_Fast
+
+    Maps (s, d, epsilon, alpha, c, blocks) to the assembled sub-NoN operator [W, tilde_c, A_ID, SubG_Idx] returned by
+    CQ_Fast.sub_non, so repeated queries on the same pair of domains go straight to the bound-pruning loop. The
+    least recently used entries are evicted once the total size of the cached arrays exceeds the memory budget. A
+    cache only holds sub-NoNs of one dataset.
+    """
+
+    def __init__(self, MaxBytes=512 * 1024 * 1024):
+        """
+        :param MaxBytes: the memory budget of the cached operators in bytes
+        """
+
+        self.MaxBytes = MaxBytes
+        self.Entries = OrderedDict()  # key -> (sub-NoN, size in bytes), least recently used first
+        self.Bytes = 0
+        self.Hits = 0
+        self.Misses = 0
+        self.Evictions = 0
+        self.Lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key: (s, d, epsilon, alpha, c, blocks)
+        :return: the cached sub-NoN, or None
+        """
+
+        with self.Lock:
+            if key in self.Entries:
+                Entry = self.Entries.pop(key)
+                self.Entries[key] = Entry  # move to the most recently used end
+                self.Hits += 1
+                return Entry[0]
+            self.Misses += 1
+            return None
+
+    def put(self, key, SubNoN):
+        """
+        :param key: (s, d, epsilon, alpha, c, blocks)
+        :param SubNoN: the sub-NoN returned by CQ_Fast.sub_non
+        """
+
+        Size = sub_non_nbytes(SubNoN)
+        if Size > self.MaxBytes:  # would evict everything else and still not fit
+            return
+
+        with self.Lock:
+            if key in self.Entries:
+                self.Bytes -= self.Entries.pop(key)[1]
+            self.Entries[key] = (SubNoN, Size)
+            self.Bytes += Size
+            while self.Bytes > self.MaxBytes:
+                self.Bytes -= self.Entries.popitem(last=False)[1][1]
+                self.Evictions += 1
+
+    def clear(self):
+        with self.Lock:
+            self.Entries.clear()
+            self.Bytes = 0
+
+    def stats(self):
+        """
+        :return: a dictionary with hits, misses, hit_rate, evictions, entries, bytes and max_bytes
+        """
+
+        with self.Lock:
+            Requests = self.Hits + self.Misses
+            return {'hits': self.Hits,
+                    'misses': self.Misses,
+                    'hit_rate': float(self.Hits) / Requests if Requests > 0 else 0.0,
+                    'evictions': self.Evictions,
+                    'entries': len(self.Entries),
+                    'bytes': self.Bytes,
+                    'max_bytes': self.MaxBytes}
+
+
+def sub_non_nbytes(SubNoN):
+    """
+    The memory held by a sub-NoN: the arrays of its transition matrix, its node IDs and its domain indices
+    """
+
+    [W, tilde_c, A_ID, SubG_Idx] = SubNoN
+
+    if isinstance(W, BlockNoN.BlockNoN):
+        Size = W.nbytes() + SubG_Idx.nbytes
+    else:
+        Size = W.data.nbytes + W.indices.nbytes + W.indptr.nbytes + SubG_Idx.nbytes
+    for i in range(A_ID.shape[1]):
+        Size += np.asarray(A_ID[0, i]).nbytes
+
+    return Size
@@ -0,0 +1,238 @@
+import sys
+import getopt
+import numpy as np
+from scipy import sparse
+import LoadData
+
+
+def synth_main_network(g, AvgDegree=6, Distribution="poisson", Exponent=2.5, rng=None):
+    """
+    Generate a weighted main network
+
+    :param g: the number of main nodes (domains)
+    :param AvgDegree: the average number of neighbors of a main node
+    :param Distribution: poisson draws edge endpoints uniformly, powerlaw draws them proportionally to Pareto weights
+                         (Chung-Lu), giving a heavy-tailed degree distribution
+    :param Exponent: the exponent of the power-law degree distribution
+    :param rng: a numpy RandomState
+    :return: the symmetric adjacency matrix of the main network (csc) with similarities in (0, 1]
+    """
+
+    if rng is None:
+        rng = np.random.RandomState(0)
+
+    if Distribution == "poisson":
+        p = None
+    elif Distribution == "powerlaw":
+        p = rng.pareto(Exponent - 1.0, g) + 1.0
+        p = p / p.sum()
+    else:
+        raise ValueError("Invalid degree distribution: " + str(Distribution))
+
+    # a ring keeps every main node connected, the remaining edges are drawn at random
+    m = int(g * max(AvgDegree - 2, 0) / 2)
+    row = np.hstack((np.arange(g), rng.choice(g, m, p=p)))
+    col = np.hstack(((np.arange(g) + 1) % g, rng.choice(g, m, p=p)))
+    Mask = row != col
+    data = rng.uniform(0.01, 1.0, int(np.sum(Mask)))
+
+    G = sparse.coo_matrix((data, (row[Mask], col[Mask])), shape=(g, g)).tocsr()
+    G = G + G.transpose()
+    G.data = np.minimum(G.data, 1.0)  # repeated edges add up, keep similarities in (0, 1]
+
+    return sparse.csc_matrix(G)
+
+
+def synth_domain_network(n, AvgDegree=4, rng=None):
+    """
+    Generate a weighted domain-specific network
+
+    :param n: the number of domain nodes
+    :param AvgDegree: the average number of neighbors of a domain node (the density)
+    :param rng: a numpy RandomState
+    :return: the symmetric adjacency matrix of the domain-specific network (csc) with integer weights
+    """
+
+    if rng is None:
+        rng = np.random.RandomState(0)
+
+    # a random path keeps every domain node connected (no zero degrees in the normalization)
+    Perm = rng.permutation(n)
+    m = max(int(n * AvgDegree / 2) - (n - 1), 0)
+    row = np.hstack((Perm[:-1], rng.randint(0, n, m)))
+    col = np.hstack((Perm[1:], rng.randint(0, n, m)))
+    Mask = row != col
+    data = rng.randint(1, 4, int(np.sum(Mask))).astype(np.float64)
+
+    A_i = sparse.coo_matrix((data, (row[Mask], col[Mask])), shape=(n, n)).tocsr()
+    A_i = A_i + A_i.transpose()
+
+    return sparse.csc_matrix(A_i)
+
+
+def synth_domains(g, DomainSize=100, DomainSigma=0.5, DomainDegree=4, Overlap=0.3, rng=None):
+    """
+    Generate domain-specific networks one at a time
+
+    A domain node is a repeated membership with probability Overlap, drawn from the memberships of the previous
+    domains (so authors that are already in many domains are more likely to join another one), and a new author
+    otherwise.
+
+    :param g: the number of domains
+    :param DomainSize: the median number of domain nodes, sizes are log-normally distributed
+    :param DomainSigma: the standard deviation of the log of domain sizes (0 gives equal sizes)
+    :param DomainDegree: the average number of neighbors of a domain node
+    :param Overlap: the expected fraction of domain nodes which also belong to earlier domains
+    :param rng: a numpy RandomState
+    :return: a generator of (adjacency matrix, sorted 1-based author IDs) of each domain, the number of authors is
+             available as the max ID once the generator is exhausted
+    """
+
+    if rng is None:
+        rng = np.random.RandomState(0)
+
+    Pool = np.zeros(1024, dtype=np.int64)  # all memberships so far
+    PoolLen = 0
+    NextID = 1  # the ID of the next new author
+
+    for i in range(g):
+
+        n = max(int(round(DomainSize * np.exp(DomainSigma * rng.randn()))), 2)
+
+        if PoolLen > 0:
+            Repeated = np.unique(Pool[rng.randint(0, PoolLen, rng.binomial(n, Overlap))])
+        else:
+            Repeated = np.array([], dtype=np.int64)
+
+        New = np.arange(NextID, NextID + n - len(Repeated), dtype=np.int64)
+        NextID += len(New)
+        IDs = np.sort(np.hstack((Repeated, New)))
+
+        while PoolLen + n > len(Pool):
+            Pool = np.hstack((Pool, np.zeros(len(Pool), dtype=np.int64)))
+        Pool[PoolLen:PoolLen + n] = IDs
+        PoolLen += n
+
+        yield (synth_domain_network(n, DomainDegree, rng), IDs.reshape(n, 1))
+
+
+def synth_non(g=100, MainDegree=6, MainDistribution="poisson", DomainSize=100, DomainSigma=0.5, DomainDegree=4,
+              Overlap=0.3, seed=0):
+    """
+    Generate an NoN in memory, in the layout of DBLP_NoN.npy
+
+    :param g: the number of domains (main nodes)
+    :param MainDegree: the average number of neighbors of a main node
+    :param MainDistribution: the degree distribution of the main network, poisson or powerlaw
+    :param DomainSize: the median number of domain nodes
+    :param DomainSigma: the standard deviation of the log of domain sizes
+    :param DomainDegree: the average number of neighbors of a domain node
+    :param Overlap: the expected fraction of domain nodes which also belong to earlier domains
+    :param seed: the random seed
+    :return: a dictionary with CoAuthorNets, ConfNet, CoAuthorNetsID, AuthorDict and ConfDict
+    """
+
+    rng = np.random.RandomState(seed)
+
+    ConfNet = synth_main_network(g, MainDegree, MainDistribution, rng=rng)
+    CoAuthorNets = np.zeros((1, g), dtype=object)
+    CoAuthorNetsID = np.zeros((1, g), dtype=object)
+    N = 0  # the number of authors
+
+    for i, (A_i, ID_i) in enumerate(synth_domains(g, DomainSize, DomainSigma, DomainDegree, Overlap, rng)):
+        CoAuthorNets[0, i] = A_i
+        CoAuthorNetsID[0, i] = ID_i
+        N = max(N, int(ID_i.max()))
+
+    AuthorDict = np.zeros((N, 1), dtype=object)
+    for a in range(N):
+        AuthorDict[a, 0] = np.array(['Author %d' % (a + 1)])
+
+    ConfDict = np.zeros((1, g), dtype=object)
+    for i in range(g):
+        ConfDict[0, i] = np.array(['Conference %d' % i])
+
+    return {'CoAuthorNets': CoAuthorNets, 'ConfNet': ConfNet, 'CoAuthorNetsID': CoAuthorNetsID,
+            'AuthorDict': AuthorDict, 'ConfDict': ConfDict}
+
+
+def write_synth_non(OutName, g=100, MainDegree=6, MainDistribution="poisson", DomainSize=100, DomainSigma=0.5,
+                    DomainDegree=4, Overlap=0.3, seed=0):
+    """
+    Generate an NoN and write it to disk
+
+    A name ending in .npy is generated in memory and saved in the layout of DBLP_NoN.npy. Any other name is a
+    directory in the NoN directory format (see LoadData.NoNDirWriter), written while the domains are generated, so
+    only one domain-specific network is in memory at a time. LoadData.load_non reads both.
+
+    :param OutName: the npy file name or directory to write the NoN into
+    :return: the number of domains and authors
+    """
+
+    if OutName.endswith('.npy'):
+        data = synth_non(g, MainDegree, MainDistribution, DomainSize, DomainSigma, DomainDegree, Overlap, seed)
+        np.save(OutName, data)
+        return [g, data['AuthorDict'].shape[0]]
+
+    rng = np.random.RandomState(seed)
+    Writer = LoadData.NoNDirWriter(OutName)
+
+    Writer.write_main(synth_main_network(g, MainDegree, MainDistribution, rng=rng))
+    N = 0  # the number of authors
+
+    for (A_i, ID_i) in synth_domains(g, DomainSize, DomainSigma, DomainDegree, Overlap, rng):
+        Writer.write_domain(A_i, ID_i)
+        N = max(N, int(ID_i.max()))
+
+    Writer.write_names('AuthorDict.txt', ('Author %d' % (a + 1) for a in range(N)))
+    Writer.write_names('ConfDict.txt', ('Conference %d' % i for i in range(g)))
+    Writer.close({'generator': 'SynthNoN', 'g': g, 'main_degree': MainDegree, 'main_distribution': MainDistribution,
+                  'domain_size': DomainSize, 'domain_sigma': DomainSigma, 'domain_degree': DomainDegree,
+                  'overlap': Overlap, 'seed': seed})
+
+    return [g, N]
+
+
+if __name__ == '__main__':
+
+    out = "Synth_NoN"
+    g = 100
+    main_degree = 6
+    main_distribution = "poisson"
+    domain_size = 100
+    domain_sigma = 0.5
+    domain_degree = 4
+    overlap = 0.3
+    seed = 0
+
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["out=", "domains=", "main_degree=", "main_distribution=",
+                                                   "domain_size=", "domain_sigma=", "domain_degree=", "overlap=",
+                                                   "seed="])
+    for option, value in opts:
+        if option == "-h":
+            print("python SynthNoN.py [--out Synth_NoN] [--domains 100] [--main_degree 6] "
+                  "[--main_distribution poisson|powerlaw] [--domain_size 100] [--domain_sigma 0.5] "
+                  "[--domain_degree 4] [--overlap 0.3] [--seed 0]")
+            exit(0)
+        if option == "--out":
+            out = value
+        if option == "--domains":
+            g = int(value)
+        if option == "--main_degree":
+            main_degree = float(value)
+        if option == "--main_distribution":
+            main_distribution = value
+        if option == "--domain_size":
+            domain_size = float(value)
+        if option == "--domain_sigma":
+            domain_sigma = float(value)
+        if option == "--domain_degree":
+            domain_degree = float(value)
+        if option == "--overlap":
+            overlap = float(value)
+        if option == "--seed":
+            seed = int(value)
+
+    [g, N] = write_synth_non(out, g, main_degree, main_distribution, domain_size, domain_sigma, domain_degree,
+                             overlap, seed)
+    print("Wrote " + out + ": " + str(g) + " domains, " + str(N) + " authors.")
@@ -0,0 +1,132 @@
+import json
+import time
+import numpy as np
+
+
+class TraceRecorder(object):
+    """
+    Recorder of convergence telemetry
+
+    An instance is passed as the Trace hook of cq_basic, cq_fast, cr, cr_solve and extract_subnet, which call it
+    once per iteration (or expansion) with an event name and the metrics of that step. Each call is kept as one
+    record together with the context given to the constructor (e.g., the query) and the time since the recorder was
+    created. Without a hook the algorithms only pay a Trace is not None check per step.
+
+    Records are exported as JSON lines, one record per line, for offline analysis. Non-finite values (e.g., L_sd
+    before the two neighbourhoods of extract_subnet meet) are written as Infinity, which json.loads reads back.
+    """
+
+    def __init__(self, **Context):
+        """
+        :param Context: fields added to every record, e.g., q, s, d and the algorithm
+        """
+
+        self.Context = Context
+        self.Records = []
+        self.Start = time.time()
+
+    def __call__(self, Event, **Metrics):
+        """
+        Record one step
+
+        :param Event: the name of the event, e.g., cq_basic, cr, expansion
+        :param Metrics: the metrics of the step
+        """
+
+        Record = {'event': Event, 'time': time.time() - self.Start}
+        Record.update(self.Context)
+        Record.update(Metrics)
+        self.Records.append(Record)
+
+    def events(self, Event):
+        """
+        :param Event: the name of the event
+        :return: the records of the event
+        """
+
+        return [Record for Record in self.Records if Record['event'] == Event]
+
+    def clear(self):
+        """
+        Drop the records
+        """
+
+        self.Records = []
+
+    def write_jsonl(self, FileName, mode='a'):
+        """
+        Export the records as JSON lines
+
+        :param FileName: the file to write
+        :param mode: a appends to an existing trace, w overwrites it
+        """
+
+        with open(FileName, mode) as f:
+            for Record in self.Records:
+                f.write(json.dumps(Record, default=to_json) + '\n')
+
+
+class Histogram(object):
+    """
+    Histogram with power-of-two buckets
+
+    Keeps the number of values in each bucket (Scale * 2^(i - 1), Scale * 2^i], together with the count, sum and
+    maximum, so it can be exported as a small dictionary no matter how many values were added (e.g., the queue
+    depths, batch sizes and latencies of AsyncQuery).
+    """
+
+    def __init__(self, Scale=1.0):
+        """
+        :param Scale: the upper bound of the first bucket (e.g., 1 for counts, 1e-3 for latencies in seconds)
+        """
+
+        self.Scale = Scale
+        self.Buckets = {}  # i -> the number of values in (Scale * 2^(i - 1), Scale * 2^i]
+        self.Count = 0
+        self.Sum = 0.0
+        self.Max = 0.0
+
+    def add(self, value):
+        i = int(np.ceil(np.log2(value / self.Scale))) if value > self.Scale else 0
+        self.Buckets[i] = self.Buckets.get(i, 0) + 1
+        self.Count += 1
+        self.Sum += value
+        self.Max = max(self.Max, value)
+
+    def to_dict(self):
+        """
+        :return: a dictionary with count, mean, max and the buckets as (upper bound, number of values) pairs
+        """
+
+        return {'count': self.Count,
+                'mean': self.Sum / self.Count if self.Count > 0 else 0.0,
+                'max': self.Max,
+                'buckets': [[self.Scale * 2 ** i, self.Buckets[i]] for i in sorted(self.Buckets.keys())]}
+
+
+def to_json(value):
+    """
+    Convert numpy scalars and arrays to JSON-serializable values
+    """
+
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(repr(value) + " is not JSON serializable")
+
+
+def read_jsonl(FileName):
+    """
+    Read a trace exported by TraceRecorder.write_jsonl
+
+    :param FileName: the file to read
+    :return: the list of records
+    """
+
+    with open(FileName) as f:
+        return [json.loads(line) for line in f if line.strip()]
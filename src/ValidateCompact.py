@@ -0,0 +1,189 @@
+import sys
+import json
+import time
+import getopt
+import numpy as np
+import LoadData
+import Precomputation
+import CQ_Basic
+import CR
+import Benchmark
+import Telemetry
+
+
+def matrix_bytes(M):
+    """
+    :param M: a csr or csc matrix
+    :return: the number of bytes of its data, indices and indptr arrays
+    """
+
+    return int(M.data.nbytes + M.indices.nbytes + M.indptr.nbytes)
+
+
+def agreement(Expected, Actual, k):
+    """
+    :param Expected: the top k of the float64 path
+    :param Actual: the top k of the compact mode
+    :param k: the number of retrieved nodes
+    :return: the overlap of the two top k sets (as a fraction of k) and whether the two lists are identical
+    """
+
+    Overlap = len(np.intersect1d(Expected, Actual)) / float(max(min(k, len(Expected)), 1))
+
+    return [Overlap, len(Expected) == len(Actual) and bool(np.all(np.asarray(Expected) == np.asarray(Actual)))]
+
+
+def validate_compact(dataset, PrecompFileName, NumQueries=20, k=10, alpha=0.2, c=0.85, MaxIter=1000,
+                     epsilon=1e-15, seed=0):
+    """
+    Validation report of the compact mode
+
+    Answers a random query workload with CQ_Basic and CR (power method) on the float64 precomputed matrices and on
+    their compact mode (float32 values, int32 indices), and compares the top k of both paths. CR is compared on the
+    top k of the target domain, both as sets and as ordered lists, CQ_Basic (which returns an unordered top k) as
+    sets only.
+
+    :param dataset: the path of the dataset
+    :param PrecompFileName: the file name of precomputation results (float64)
+    :param NumQueries: the number of queries
+    :param k: the number of retrieved nodes
+    :param alpha: a regularization parameter for cross-network consistency
+    :param c: a regularization parameter for query preference
+    :param MaxIter: the maximal number of iterations of CR
+    :param epsilon: the convergence parameter of CR (raised to the float32 precision in the compact mode)
+    :param seed: the random seed of the workload
+    :return: a dictionary with the sizes of the matrices in both modes and, for each algorithm, the mean and minimal
+             top-k overlap, the fraction of identical results, the mean runtimes and the speedup
+    """
+
+    '''
+    Load both modes
+    '''
+    NoN = LoadData.load_all(dataset, PrecompFileName)
+    A_ID = NoN['A_ID']
+    Compact = Precomputation.compact_precomputation(NoN)
+
+    tilde_c = (c + 2.0 * alpha) / (1.0 + 2.0 * alpha)
+    W = ((c / (c + 2.0 * alpha)) * NoN['Anorm'] + ((2.0 * alpha) / (c + 2.0 * alpha)) * NoN['Ynorm']).tocsr()
+    W32 = ((c / (c + 2.0 * alpha)) * Compact['Anorm'] + ((2.0 * alpha) / (c + 2.0 * alpha)) * Compact['Ynorm'])
+    W32 = Precomputation.compact_matrix(W32, 'csr', Compact['Anorm'].dtype)
+
+    Offsets = Precomputation.cumulative_ns(A_ID)  # the first row of each domain
+
+    Report = {'dataset': dataset, 'queries': NumQueries, 'k': k, 'alpha': alpha, 'c': c,
+              'bytes': {'float64': {}, 'compact': {}}}
+    for name in ['Anorm', 'Ynorm']:
+        Report['bytes']['float64'][name] = matrix_bytes(NoN[name].tocsr())
+        Report['bytes']['compact'][name] = matrix_bytes(Compact[name])
+    Report['bytes']['float64']['W'] = matrix_bytes(W)
+    Report['bytes']['compact']['W'] = matrix_bytes(W32)
+
+    '''
+    Answer the workload in both modes
+    '''
+    Stats = {'cq_basic': {'overlap': [], 'identical': [], 'time64': [], 'time32': []},
+             'cr': {'overlap': [], 'identical': [], 'time64': [], 'time32': [], 'score_error': []}}
+
+    for (q, s, d) in Benchmark.query_workload(A_ID, NumQueries, seed):
+
+        st = Offsets[d]
+        ed = Offsets[d + 1]
+
+        # CQ_Basic, an unordered top k
+        start = time.time()
+        Expected = np.sort(CQ_Basic.cq_basic(W, q, s, d, k, tilde_c, A_ID))
+        Stats['cq_basic']['time64'].append(time.time() - start)
+        start = time.time()
+        Actual = np.sort(CQ_Basic.cq_basic(W32, q, s, d, k, tilde_c, A_ID))
+        Stats['cq_basic']['time32'].append(time.time() - start)
+
+        [Overlap, Identical] = agreement(Expected, Actual, k)
+        Stats['cq_basic']['overlap'].append(Overlap)
+        Stats['cq_basic']['identical'].append(Identical)
+
+        # CR, the ordered top k of the target domain
+        e = np.zeros(W.shape[0])
+        e[Offsets[s] + np.nonzero(A_ID[0, s].ravel() == q)[0]] = 1
+
+        start = time.time()
+        [r64, Info] = CR.cr_solve(NoN['Anorm'], NoN['Ynorm'], e, alpha, c, MaxIter, epsilon)
+        Stats['cr']['time64'].append(time.time() - start)
+        start = time.time()
+        [r32, Info] = CR.cr_solve(Compact['Anorm'], Compact['Ynorm'], e, alpha, c, MaxIter, epsilon)
+        Stats['cr']['time32'].append(time.time() - start)
+
+        Expected = CR.top_k(r64[st:ed], k)
+        Actual = CR.top_k(r32[st:ed], k)
+        [Overlap, Identical] = agreement(Expected, Actual, k)
+        Stats['cr']['overlap'].append(Overlap)
+        Stats['cr']['identical'].append(Identical)
+        Stats['cr']['score_error'].append(float(np.abs(r64[st:ed] - r32[st:ed]).max()) if ed > st else 0.0)
+
+    '''
+    Summarize
+    '''
+    for algorithm in Stats:
+        Summary = {'mean_overlap': float(np.mean(Stats[algorithm]['overlap'])),
+                   'min_overlap': float(np.min(Stats[algorithm]['overlap'])),
+                   'identical': float(np.mean(Stats[algorithm]['identical'])),
+                   'time64': float(np.mean(Stats[algorithm]['time64'])),
+                   'time32': float(np.mean(Stats[algorithm]['time32']))}
+        Summary['speedup'] = Summary['time64'] / Summary['time32'] if Summary['time32'] > 0 else float('inf')
+        if 'score_error' in Stats[algorithm]:
+            Summary['max_score_error'] = float(np.max(Stats[algorithm]['score_error']))
+        Report[algorithm] = Summary
+
+    return Report
+
+
+def print_report(Report):
+    """
+    Print a validation report of validate_compact
+    """
+
+    print("Compact mode validation on " + Report['dataset'] + " (" + str(Report['queries']) + " queries, k = " +
+          str(Report['k']) + ")")
+    for name in ['Anorm', 'Ynorm', 'W']:
+        print("%-10s %12d bytes -> %12d bytes" % (name, Report['bytes']['float64'][name],
+                                                   Report['bytes']['compact'][name]))
+    for algorithm in ['cq_basic', 'cr']:
+        Summary = Report[algorithm]
+        Line = "%-10s overlap %.3f (min %.3f), identical %.3f, %.4fs -> %.4fs (%.2fx)" % (
+            algorithm, Summary['mean_overlap'], Summary['min_overlap'], Summary['identical'], Summary['time64'],
+            Summary['time32'], Summary['speedup'])
+        if 'max_score_error' in Summary:
+            Line += ", max score error %.2e" % Summary['max_score_error']
+        print(Line)
+
+
+if __name__ == '__main__':
+
+    dataset = "../data/DBLP_NoN.npy"
+    precomp = "Precomp_Values_DBLP.npy"
+    num_queries = 20
+    k = 10
+    out = None
+
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["dataset=", "precomp=", "num_queries=", "k=", "out="])
+    for option, value in opts:
+        if option == "-h":
+            print("python ValidateCompact.py [--dataset ../data/DBLP_NoN.npy] [--precomp Precomp_Values_DBLP.npy] "
+                  "[--num_queries 20] [--k 10] [--out report.json]")
+            exit(0)
+        if option == "--dataset":
+            dataset = value
+        if option == "--precomp":
+            precomp = value
+        if option == "--num_queries":
+            num_queries = int(value)
+        if option == "--k":
+            k = int(value)
+        if option == "--out":
+            out = value
+
+    Report = validate_compact(dataset, precomp, num_queries, k)
+    print_report(Report)
+
+    if out is not None:
+        with open(out, 'w') as f:
+            json.dump(Report, f, indent=2, default=Telemetry.to_json)
@@ -2,7 +2,10 @@ import sys
 import getopt
 import RunCQ_Basic
 import RunCQ_Fast
+import RunCQ_Push
+import RunCQ_MonteCarlo
 import RunCR_DBLP
+import LoadData
 
 
 if __name__ == '__main__':
@@ -11,14 +14,26 @@ if __name__ == '__main__':
     alpha = 0.2
     c = 0.85
     epsilon = 0.003
+    rmax = 1e-4
+    walks = 10000
+    processes = None
     max_iter = 1000
     query_node = 121
     source = 0
     target = 19
     k = 10
     dataset = "../data/DBLP_NoN.npy"
+    precomp = "Precomp_Values_DBLP.npy"
+    solver = "power"
+    trace = None
+    threads = None
+    blocks = False
+    query_name = None
+    source_name = None
+    target_name = None
+    targets = None
 
-    opts, args = getopt.getopt(sys.argv[1:], "h", ["algorithm=", "alpha=", "c=", "query_node=", "source=", "target=", "k=", "max_iter=", "epsilon=", "dataset="])
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["algorithm=", "alpha=", "c=", "query_node=", "source=", "target=", "k=", "max_iter=", "epsilon=", "dataset=", "precomp=", "solver=", "trace=", "rmax=", "walks=", "processes=", "threads=", "blocks", "query_name=", "source_name=", "target_name=", "targets="])
     for option, value in opts:
         if option == "-h":
             print "Welcome, this is a program of NoN Cross Query"
@@ -29,16 +44,31 @@ if __name__ == '__main__':
             print "--algorithm      The algorithm used to do the query."
             print "                 cq_basic:   requires --alpha --c --query_node --source --target --k --dataset"
             print "                 cq_fast:    requires --alpha --c --epsilon --query_node --source -- target --k --dataset"
-            print "                 cr:         requires --alpha --c --max_iter --epsilon --query_node --source -- target --dataset"
+            print "                 cq_push:    requires --alpha --c --query_node --source --target --k --dataset, optional --rmax"
+            print "                 cq_mc:      requires --alpha --c --query_node --source --target --k --dataset, optional --walks --processes"
+            print "                 cq_multi:   requires --alpha --c --query_node --source --k --dataset, optional --targets (the top k in several target domains from one random walk)"
+            print "                 cr:         requires --alpha --c --max_iter --epsilon --query_node --source -- target --dataset, optional --solver"
             print "--alpha          The regularization parameter for cross-network consistency."
             print "--c              The regularization parameter for query preference."
             print "--max_iter       The maximal number of iteration for updating ranking vector."
             print "--epsilon        In cq_fast, epsilon is the error factor to control the accuracy of results; In cr, epsilon is the convergence parameter."
+            print "--rmax           In cq_push, the initial residual threshold of the forward push."
+            print "--walks          In cq_mc, the number of random walks (more walks give tighter intervals at the cost of latency)."
+            print "--processes      In cq_mc, the number of worker processes which simulate the walks."
+            print "--solver         The CR solver backend: power (default), gauss_seidel, sor, gmres, bicgstab, or topk (stop once the top k order is certain)."
             print "--query_node     The ID of the query node of interest."
             print "--source         The ID of the source domain-specific network."
             print "--target         The ID of the target domain-specific network."
+            print "--query_name     The name of the query node, instead of --query_node (looked up in the node index)."
+            print "--source_name    The name of the source domain-specific network, instead of --source."
+            print "--target_name    The name of the target domain-specific network, instead of --target."
+            print "--targets        In cq_multi, comma-separated IDs or names of the target domain-specific networks (every other domain by default)."
             print "--k              The number of retrieved nodes."
             print "--dataset        The path for the dataset."
+            print "--precomp        The precomputation file (.npy), or directory of the memory-mapped format (any other name)."
+            print "--threads        In cq_basic and cr (power and topk solvers), the number of threads of the sparse matrix-vector products."
+            print "--blocks         In cq_basic, cq_fast and cr (power and topk solvers), multiply only the blocks of the domains which carry mass."
+            print "--trace          Append per-iteration convergence telemetry of the query to this JSON lines file."
             print ""
             print "Example:"
             print ""
@@ -46,6 +76,14 @@ if __name__ == '__main__':
             print ""
             print "python __init__.py --algorithm cq_fast --alpha 0.2 --c 0.85 --epsilon 0.003 --query_node 121 --source 0 --target 19 --k 10 --dataset ../data/DBLP_NoN.npy"
             print ""
+            print "python __init__.py --algorithm cq_push --alpha 0.2 --c 0.85 --rmax 1e-4 --query_node 121 --source 0 --target 19 --k 10 --dataset ../data/DBLP_NoN.npy"
+            print ""
+            print "python __init__.py --algorithm cq_mc --alpha 0.2 --c 0.85 --walks 10000 --processes 4 --query_node 121 --source 0 --target 19 --k 10 --dataset ../data/DBLP_NoN.npy"
+            print ""
+            print "python __init__.py --algorithm cq_basic --query_name \"Jiawei Han\" --source_name KDD --target_name SIGMOD --k 10"
+            print ""
+            print "python __init__.py --algorithm cq_multi --alpha 0.2 --c 0.85 --query_node 121 --source 0 --targets 1,5,19 --k 10 --dataset ../data/DBLP_NoN.npy"
+            print ""
             print "python __init__.py --algorithm cr --alpha 0.2 --c 0.85 --max_iter 1000 --epsilon 1e-15 --query_node 121 --source 0 --target 19 --k 10 --dataset ../data/DBLP_NoN.npy"
             print ""
             exit(0)
@@ -69,17 +107,57 @@ if __name__ == '__main__':
             k = int(value)
         if option == "--dataset":
             dataset = value
+        if option == "--precomp":
+            precomp = value
+        if option == "--solver":
+            solver = value
+        if option == "--trace":
+            trace = value
+        if option == "--rmax":
+            rmax = float(value)
+        if option == "--blocks":
+            blocks = True
+        if option == "--threads":
+            threads = int(value)
+        if option == "--walks":
+            walks = int(value)
+        if option == "--processes":
+            processes = int(value)
+        if option == "--query_name":
+            query_name = value
+        if option == "--source_name":
+            source_name = value
+        if option == "--target_name":
+            target_name = value
+        if option == "--targets":
+            targets = value.split(',')
+
+    if query_name is not None or source_name is not None or target_name is not None:
+        Index = LoadData.load_node_index(dataset, precomp)
+        if query_name is not None:
+            query_node = Index.author_id(query_name)
+        if source_name is not None:
+            source = Index.domain_id(source_name)
+        if target_name is not None:
+            target = Index.domain_id(target_name)
+
+    if targets is not None:
+        if all(name.isdigit() for name in targets):
+            targets = [int(name) for name in targets]
+        else:
+            Index = LoadData.load_node_index(dataset, precomp)
+            targets = [int(name) if name.isdigit() else Index.domain_id(name) for name in targets]
 
     if algorithm == "cq_basic":
         print "------- CQ_Basic -------"
-        TopKAuthorNames = RunCQ_Basic.run_cq_basic(alpha, c, query_node, source, target, k, dataset)
+        TopKAuthorNames = RunCQ_Basic.run_cq_basic(alpha, c, query_node, source, target, k, dataset, precomp, trace, threads, blocks)
         print "\nTop K Author Names:"
         for author in TopKAuthorNames:
             print author[0]
         print "------------------------"
     elif algorithm == "cq_fast":
         print "------- CQ_Fast --------"
-        [TopKAuthorNames_fast, RelevantDomains] = RunCQ_Fast.run_cq_fast(alpha, c, epsilon, query_node, source, target, k, dataset)
+        [TopKAuthorNames_fast, RelevantDomains] = RunCQ_Fast.run_cq_fast(alpha, c, epsilon, query_node, source, target, k, dataset, precomp, trace, blocks)
         print "\nTop K Author Names:"
         for author in TopKAuthorNames_fast:
             print author[0]
@@ -88,9 +166,34 @@ if __name__ == '__main__':
         # for domain in RelevantDomains:
         #     print domain[0]
         print "------------------------"
+    elif algorithm == "cq_push":
+        print "------- CQ_Push --------"
+        TopKAuthorNames_push = RunCQ_Push.run_cq_push(alpha, c, rmax, query_node, source, target, k, dataset, precomp, trace)
+        print "\nTop K Author Names:"
+        for author in TopKAuthorNames_push:
+            print author[0]
+        print "------------------------"
+    elif algorithm == "cq_mc":
+        print "----- CQ_MonteCarlo ----"
+        [TopKAuthorNames_mc, Scores_mc, Intervals_mc] = RunCQ_MonteCarlo.run_cq_montecarlo(alpha, c, walks, processes, query_node, source, target, k, dataset, precomp)
+        if TopKAuthorNames_mc is None:
+            print "\nNo results, increase --walks."
+        else:
+            print "\nTop K Author Names (estimated score, 95% interval):"
+            for i in range(len(TopKAuthorNames_mc)):
+                print TopKAuthorNames_mc[i][0], "%.3e [%.3e, %.3e]" % (Scores_mc[i], Intervals_mc[i, 0], Intervals_mc[i, 1])
+        print "------------------------"
+    elif algorithm == "cq_multi":
+        print "------- CQ_Multi -------"
+        [TargetNames, TopKAuthorNames_multi] = RunCQ_Basic.run_cq_basic_multi(alpha, c, query_node, source, targets, k, dataset, precomp, threads, blocks)
+        for i in range(len(TargetNames)):
+            print "\nTop K Author Names in " + TargetNames[i][0] + ":"
+            for author in TopKAuthorNames_multi[i]:
+                print author[0]
+        print "------------------------"
     elif algorithm == "cr":
         print "---------- CR ----------"
-        TopKAuthorNames_CR = RunCR_DBLP.run_cr_dblp(alpha, c, max_iter, epsilon, query_node, source, target, k, dataset)
+        TopKAuthorNames_CR = RunCR_DBLP.run_cr_dblp(alpha, c, max_iter, epsilon, query_node, source, target, k, dataset, precomp, solver, trace, threads, blocks)
         print "\nTop K Author Names:"
         for author in TopKAuthorNames_CR:
             print author[0]